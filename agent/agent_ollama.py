@@ -2,13 +2,22 @@ import asyncio
 import json
 import logging
 import os
+import random
+import signal
 import sys
+import time
 import uuid
 import webbrowser
+import zlib
 import aiohttp
 import platform
 from pathlib import Path
 
+try:
+    import msgpack
+except ImportError:  # optional — falls back to zlib-compressed JSON
+    msgpack = None
+
 # Load .env.local if present (next to this script, next to the exe, or in parent dir)
 def _load_env_local():
     """Load key=value pairs from .env.local into os.environ (won't overwrite existing vars)."""
@@ -37,9 +46,50 @@ API_URL = os.environ.get("API_URL", "https://gpu-connect-api.onrender.com")
 OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
 NODE_ID = os.environ.get("NODE_ID", f"node-{uuid.uuid4().hex[:8]}")
 
+AGENT_VERSION = "2.2"
+
+# Agent protocol: version and optional features advertised in register
+PROTOCOL_VERSION = 3
+CAPABILITIES = [
+    "compression", "capacity", "models_update", "result_ack", "resume", "drain", "cancel",
+    "accept",
+]
+
+# Connection pools: Ollama serves local jobs, the backend only the WebSocket
+# and the odd REST call, so the backend pool stays small
+OLLAMA_POOL_SIZE = int(os.environ.get("OLLAMA_POOL_SIZE", "8"))
+BACKEND_POOL_SIZE = 4
+
+# Jobs run at once; defaults to Ollama's own OLLAMA_NUM_PARALLEL so the
+# agent never has more generations in flight than Ollama will schedule
+MAX_PARALLEL_JOBS = max(1, int(
+    os.environ.get("MAX_PARALLEL_JOBS") or os.environ.get("OLLAMA_NUM_PARALLEL") or 1
+))
+# Jobs allowed to wait for a free worker before new ones are rejected
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", str(MAX_PARALLEL_JOBS * 2)))
+# Seconds the server is asked to wait before re-offering a rejected job
+REJECT_RETRY_AFTER = 5
+
+# Seconds between /api/tags polls for pulled or removed models
+MODEL_POLL_INTERVAL = int(os.environ.get("MODEL_POLL_INTERVAL", "30"))
+
+# Seconds a drain waits for in-flight jobs before stopping anyway
+DRAIN_TIMEOUT = int(os.environ.get("DRAIN_TIMEOUT", "600"))
+
+# Reconnect backoff: doubles from RECONNECT_BASE up to RECONNECT_MAX seconds,
+# with jitter so agents dropped together do not reconnect together
+RECONNECT_BASE = 5
+RECONNECT_MAX = 120
+
+# Wire encodings offered to the server, most preferred first
+ENCODINGS = (["msgpack"] if msgpack else []) + ["zlib", "json"]
+COMPRESS_MIN_BYTES = 1024
+
 # Token storage
 TOKEN_DIR = Path.home() / ".gpuconnect"
 TOKEN_FILE = TOKEN_DIR / "token"
+# Finished results not yet acknowledged by the server
+OUTBOX_DIR = TOKEN_DIR / "outbox"
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("GPU-Agent")
@@ -72,46 +122,102 @@ def clear_token():
         TOKEN_FILE.unlink()
 
 
+_sessions = {}
+
+
+def _get_session(name, limit):
+    """Return the long-lived session for ``name``, (re)creating it if closed."""
+    session = _sessions.get(name)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=limit,
+            keepalive_timeout=60,
+            ttl_dns_cache=300,
+        )
+        session = _sessions[name] = aiohttp.ClientSession(connector=connector)
+    return session
+
+
+def ollama_session() -> aiohttp.ClientSession:
+    """Shared session (keep-alive pool) for the local Ollama API."""
+    return _get_session("ollama", OLLAMA_POOL_SIZE)
+
+
+def backend_session() -> aiohttp.ClientSession:
+    """Shared session for the GPU Connect backend."""
+    return _get_session("backend", BACKEND_POOL_SIZE)
+
+
+async def close_sessions():
+    """Close every shared session (call before the event loop exits)."""
+    for session in list(_sessions.values()):
+        await session.close()
+    _sessions.clear()
+
+
 async def verify_token(token: str) -> bool:
     """Quick check that the token is still valid by calling the backend."""
     try:
-        async with aiohttp.ClientSession() as session:
-            # We'll test by connecting to WebSocket briefly
-            async with session.ws_connect(SERVER_URL, heartbeat=10) as ws:
-                await ws.send_str(json.dumps({
-                    "type": "register",
-                    "node_id": "verify-check",
-                    "auth_token": token,
-                    "gpu_info": {"models": [], "provider": "verify"}
-                }))
-                msg = await asyncio.wait_for(ws.receive(), timeout=5)
-                if msg.type == aiohttp.WSMsgType.TEXT:
-                    data = json.loads(msg.data)
-                    if data.get("type") == "registered":
-                        return True
-                    elif data.get("type") == "auth_error":
-                        return False
-                return False
+        # We'll test by connecting to WebSocket briefly
+        async with backend_session().ws_connect(SERVER_URL, heartbeat=10) as ws:
+            await ws.send_str(json.dumps({
+                "type": "register",
+                "node_id": "verify-check",
+                "auth_token": token,
+                "gpu_info": {"models": [], "provider": "verify"}
+            }))
+            msg = await asyncio.wait_for(ws.receive(), timeout=5)
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                data = json.loads(msg.data)
+                if data.get("type") == "registered":
+                    return True
+                elif data.get("type") == "auth_error":
+                    return False
+            return False
     except Exception:
         return False
 
 
+async def watch_models(ws, encoding, models):
+    """Poll Ollama and send a models_update diff whenever the model list changes.
+
+    ``models`` is the list sent at registration; it is updated in place so a
+    reconnect registers with the current inventory.
+    """
+    while True:
+        await asyncio.sleep(MODEL_POLL_INTERVAL)
+        current = await list_ollama_models()
+        if current is None:
+            continue  # Ollama unreachable; keep the last known list
+        added = sorted(set(current) - set(models))
+        removed = sorted(set(models) - set(current))
+        if not added and not removed:
+            continue
+        logger.info(f"Model inventory changed: +{added} -{removed}")
+        await send_message(ws, {"type": "models_update", "added": added, "removed": removed}, encoding)
+        models[:] = current
+
+
+async def list_ollama_models():
+    """Return the model names Ollama has pulled, or None if it is unreachable."""
+    try:
+        async with ollama_session().get(f"{OLLAMA_URL}/api/tags") as response:
+            if response.status != 200:
+                return None
+            data = await response.json()
+            return [m['name'] for m in data.get('models', [])]
+    except Exception:
+        return None
+
+
 async def check_ollama_status():
     """Checks if local Ollama is running and lists models."""
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{OLLAMA_URL}/api/tags") as response:
-                if response.status == 200:
-                    data = await response.json()
-                    models = [m['name'] for m in data.get('models', [])]
-                    logger.info(f"Ollama connected. Available models: {models}")
-                    return models
-                else:
-                    logger.error(f"Ollama returned status {response.status}")
-                    return []
-    except Exception as e:
-        logger.error(f"Could not connect to Ollama at {OLLAMA_URL}: {e}")
+    models = await list_ollama_models()
+    if models is None:
+        logger.error(f"Could not connect to Ollama at {OLLAMA_URL}")
         return []
+    logger.info(f"Ollama connected. Available models: {models}")
+    return models
 
 
 async def execute_task(task_data):
@@ -123,22 +229,30 @@ async def execute_task(task_data):
     logger.info(f"Executing Task {task_id}: model={model} prompt='{prompt[:50]}...'")
 
     try:
-        async with aiohttp.ClientSession() as session:
-            payload = {"model": model, "prompt": prompt, "stream": False}
-            async with session.post(
-                f"{OLLAMA_URL}/api/generate",
-                json=payload,
-                timeout=aiohttp.ClientTimeout(total=600)
-            ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    output_text = result.get("response", "")
-                    logger.info(f"Task {task_id} Completed. ({len(output_text)} chars)")
-                    return {"status": "success", "response": output_text, "task_id": task_id}
-                else:
-                    error_text = await response.text()
-                    logger.error(f"Task {task_id} Failed: Ollama {response.status}")
-                    return {"status": "failed", "error": error_text[:500], "task_id": task_id}
+        payload = {"model": model, "prompt": prompt, "stream": False}
+        if task_data.get("options"):
+            payload["options"] = task_data["options"]
+        started = time.monotonic()
+        async with ollama_session().post(
+            f"{OLLAMA_URL}/api/generate",
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=600)
+        ) as response:
+            if response.status == 200:
+                result = await response.json()
+                output_text = result.get("response", "")
+                logger.info(f"Task {task_id} Completed. ({len(output_text)} chars)")
+                timings = {"duration_ms": int((time.monotonic() - started) * 1000)}
+                if "prompt_eval_duration" in result:
+                    # Ollama reports nanoseconds; the first token follows load and prompt evaluation
+                    timings["first_token_ms"] = (
+                        result.get("load_duration", 0) + result["prompt_eval_duration"]
+                    ) // 1_000_000
+                return {"status": "success", "response": output_text, "task_id": task_id, **timings}
+            else:
+                error_text = await response.text()
+                logger.error(f"Task {task_id} Failed: Ollama {response.status}")
+                return {"status": "failed", "error": error_text[:500], "task_id": task_id}
     except asyncio.TimeoutError:
         logger.error(f"Task {task_id} timed out (600s)")
         return {"status": "failed", "error": "Inference timed out after 600s", "task_id": task_id}
@@ -147,15 +261,238 @@ async def execute_task(task_data):
         return {"status": "failed", "error": str(e), "task_id": task_id}
 
 
-async def handle_job(ws, job_data):
-    """Run a job in the background and send the result back."""
-    result = await execute_task(job_data)
-    try:
-        payload = json.dumps({"type": "job_result", "result": result}, ensure_ascii=False)
-        await ws.send_str(payload)
-        logger.info(f"Result for Task {result.get('task_id')} sent successfully")
-    except Exception as e:
-        logger.error(f"Failed to send result for Task {result.get('task_id')}: {e}")
+def encode_message(message, encoding):
+    """Serialize a message for the negotiated encoding. Returns str or bytes."""
+    if encoding == "msgpack":
+        return msgpack.packb(message, use_bin_type=True)
+    text = json.dumps(message, ensure_ascii=False)
+    if encoding == "zlib" and len(text) >= COMPRESS_MIN_BYTES:
+        return zlib.compress(text.encode("utf-8"))
+    return text
+
+
+def decode_message(msg, encoding):
+    """Parse a TEXT (always JSON) or BINARY (negotiated encoding) frame."""
+    if msg.type == aiohttp.WSMsgType.TEXT:
+        return json.loads(msg.data)
+    if encoding == "msgpack":
+        return msgpack.unpackb(msg.data, raw=False)
+    return json.loads(zlib.decompress(msg.data))
+
+
+async def send_message(ws, message, encoding):
+    """Send a message as a text or binary frame depending on the encoding."""
+    frame = encode_message(message, encoding)
+    if isinstance(frame, bytes):
+        await ws.send_bytes(frame)
+    else:
+        await ws.send_str(frame)
+
+
+class ResultOutbox:
+    """Finished results kept on disk until the server acknowledges them.
+
+    One JSON file per task under ``~/.gpuconnect/outbox``, written to a temp
+    file and renamed so a crash never leaves a half-written result.
+    """
+
+    def __init__(self, directory=OUTBOX_DIR):
+        self.directory = Path(directory)
+
+    def _path(self, task_id):
+        return self.directory / f"{task_id}.json"
+
+    def put(self, result):
+        """Store a result before it is sent."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(result.get("task_id"))
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(result, ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp, path)
+
+    def ack(self, task_id):
+        """Drop a result the server has recorded."""
+        try:
+            self._path(task_id).unlink()
+        except FileNotFoundError:
+            pass
+
+    def pending(self):
+        """Stored results, oldest first."""
+        if not self.directory.exists():
+            return []
+        results = []
+        for path in sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime):
+            try:
+                results.append(json.loads(path.read_text(encoding='utf-8')))
+            except (OSError, ValueError) as e:
+                logger.error(f"Discarding unreadable outbox entry {path.name}: {e}")
+                path.unlink(missing_ok=True)
+        return results
+
+
+class JobExecutor:
+    """Bounded worker pool running jobs on Ollama.
+
+    At most ``workers`` jobs run at once and ``queue_size`` more wait in a
+    local queue. Beyond that ``submit`` refuses the job so the server can
+    offer it elsewhere. The pool outlives reconnects; results are written
+    to the outbox first and go to whichever connection is attached, and
+    unacknowledged ones are replayed when the next connection attaches.
+    """
+
+    def __init__(self, workers=MAX_PARALLEL_JOBS, queue_size=JOB_QUEUE_SIZE, outbox=None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.outbox = outbox or ResultOutbox()
+        self._queue = asyncio.Queue()
+        self._tasks = []
+        self._active = set()  # task ids queued or running
+        self._running = {}  # task id -> execute_task task
+        self._cancelled = set()  # queued task ids to skip
+        self._ws = None
+        self._encoding = "json"
+        self._acks = False
+        self.draining = False
+
+    def start(self):
+        """Start the worker tasks on the running loop."""
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Cancel the workers (queued jobs are dropped)."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def attach(self, ws, encoding, acks=False):
+        """Send results over this connection from now on.
+
+        With ``acks`` the server confirms each result with job_result_ack;
+        otherwise a result leaves the outbox once it is sent.
+        """
+        self._ws, self._encoding, self._acks = ws, encoding, acks
+
+    async def replay(self):
+        """Re-send results that finished while disconnected or were never acked."""
+        pending = self.outbox.pending()
+        if pending:
+            logger.info(f"Replaying {len(pending)} unacknowledged result(s)")
+        for result in pending:
+            await self._send_result(result)
+
+    def detach(self):
+        """Forget the current connection (it closed)."""
+        self._ws = None
+
+    @property
+    def load(self):
+        """Jobs queued or running."""
+        return len(self._active)
+
+    def submit(self, job_data, bounded=True):
+        """Queue a job. Returns False if it was refused because the pool is full.
+
+        With ``bounded=False`` (servers that cannot re-route a rejected job)
+        the job is always queued, unless the pool is draining.
+        """
+        task_id = job_data.get("task_id")
+        if task_id in self._active:
+            return True  # re-dispatch of a job we already have
+        if self.draining:
+            return False
+        if bounded and self.load >= self.workers + self.queue_size:
+            return False
+        self._active.add(task_id)
+        self._queue.put_nowait((time.monotonic(), job_data))
+        return True
+
+    def cancel(self, task_id):
+        """Abort a queued or running job. Returns False if the pool does not have it.
+
+        Cancelling a running job closes its Ollama request, which stops the
+        generation and frees the GPU slot. No result is sent for it.
+        """
+        if task_id not in self._active:
+            return False
+        self._cancelled.add(task_id)
+        running = self._running.get(task_id)
+        if running is not None:
+            running.cancel()
+        return True
+
+    async def drain(self, timeout=DRAIN_TIMEOUT):
+        """Refuse new jobs, tell the server, and wait for queued and running ones.
+
+        Returns False if jobs were still running when ``timeout`` ran out.
+        """
+        self.draining = True
+        if self._ws is not None and not self._ws.closed:
+            await send_message(self._ws, {"type": "drain"}, self._encoding)
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _worker(self):
+        while True:
+            queued_at, job_data = await self._queue.get()
+            task_id = job_data.get("task_id")
+            wait_ms = int((time.monotonic() - queued_at) * 1000)
+            if wait_ms >= 1000:
+                logger.info(f"Task {task_id} waited {wait_ms} ms for a worker")
+            try:
+                if task_id in self._cancelled:
+                    logger.info(f"Task {task_id} cancelled before it started")
+                    continue
+                run = self._running[task_id] = asyncio.ensure_future(execute_task(job_data))
+                try:
+                    result = await run
+                except asyncio.CancelledError:
+                    if task_id not in self._cancelled:
+                        raise  # the worker itself is stopping
+                    logger.info(f"Task {task_id} cancelled; Ollama request closed")
+                    continue
+                result["queue_wait_ms"] = wait_ms
+                self.outbox.put(result)
+                await self._send_result(result)
+            finally:
+                self._active.discard(task_id)
+                self._running.pop(task_id, None)
+                self._cancelled.discard(task_id)
+                self._queue.task_done()
+
+    async def _send_result(self, result):
+        task_id = result.get("task_id")
+        if self._ws is None or self._ws.closed:
+            logger.warning(f"Result for Task {task_id} kept in outbox: not connected")
+            return
+        try:
+            await send_message(self._ws, {"type": "job_result", "result": result}, self._encoding)
+            logger.info(f"Result for Task {task_id} sent successfully")
+        except Exception as e:
+            logger.error(f"Failed to send result for Task {task_id}, kept in outbox: {e}")
+            return
+        if not self._acks:
+            self.outbox.ack(task_id)
+
+
+def reconnect_delay(attempt, retry_after=None):
+    """Seconds to wait before reconnect ``attempt`` (0-based).
+
+    A server ``retry_after`` hint wins over the backoff; either way a random
+    share is added or taken off so the agents of one outage spread out.
+    """
+    if retry_after:
+        return retry_after + random.uniform(0, min(retry_after, RECONNECT_BASE))
+    ceiling = min(RECONNECT_MAX, RECONNECT_BASE * 2 ** attempt)
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+class _AuthRejected(Exception):
+    """The server rejected the agent token; stop reconnecting."""
 
 
 async def agent_loop(auth_token: str):
@@ -166,59 +503,186 @@ async def agent_loop(auth_token: str):
 
     logger.info(f"Starting agent with NODE_ID={NODE_ID}")
 
-    while True:
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.ws_connect(SERVER_URL, heartbeat=20) as ws:
-                    logger.info(f"Connected to Server at {SERVER_URL}")
-
-                    # Register with agent token
-                    register_msg = {
-                        "type": "register",
-                        "node_id": NODE_ID,
-                        "auth_token": auth_token,
-                        "gpu_info": {
-                            "provider": "Ollama-Local",
-                            "models": models,
-                            "platform": platform.platform()
-                        }
-                    }
-                    await ws.send_str(json.dumps(register_msg, ensure_ascii=False))
-
-                    async for msg in ws:
-                        if msg.type == aiohttp.WSMsgType.TEXT:
-                            data = json.loads(msg.data)
-                            msg_type = data.get("type")
-
-                            if msg_type == "registered":
-                                owner = data.get("owner", "unknown")
-                                logger.info(f"✅ Node registered as {NODE_ID} (owner: {owner})")
-                            elif msg_type == "auth_error":
-                                logger.error(f"❌ Token rejected: {data.get('error')}")
-                                clear_token()
-                                logger.info("Stored token cleared. Please re-authenticate.")
-                                print("\n  ❌ Authentication failed. Token revoked or invalid.")
-                                input("  Press Enter to exit...")
-                                return
-                            elif msg_type == "job_dispatch":
-                                asyncio.create_task(handle_job(ws, data.get("job_data")))
-                            elif msg_type == "ping":
-                                await ws.send_str(json.dumps({"type": "pong"}))
-
-                        elif msg.type == aiohttp.WSMsgType.ERROR:
-                            logger.error(f"WebSocket error: {ws.exception()}")
-                            break
-                        elif msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSING, aiohttp.WSMsgType.CLOSED):
-                            logger.warning("WebSocket closed by server")
-                            break
-
-        except aiohttp.ClientError as e:
-            logger.error(f"Connection failed: {e}")
-        except Exception as e:
-            logger.error(f"Unexpected error: {e}")
+    executor = JobExecutor()
+    executor.start()
+    logger.info(f"Running up to {executor.workers} job(s) at once, {executor.queue_size} queued")
+    _install_drain_handler(executor)
+    # Resume token from the last registration, so a reconnect keeps its jobs,
+    # and the server's hint for when to try again
+    session = {"resume_token": None, "retry_after": None}
+    attempt = 0
+
+    try:
+        while True:
+            session["retry_after"] = None
+            if await _connect_once(auth_token, models, executor, session):
+                attempt = 0
+            delay = reconnect_delay(attempt, session["retry_after"])
+            attempt += 1
+            logger.info(f"Reconnecting in {delay:.1f} seconds...")
+            await asyncio.sleep(delay)
+    except (_AuthRejected, asyncio.CancelledError):
+        return
+    finally:
+        await executor.stop()
+        await close_sessions()
+
+
+def _install_drain_handler(executor):
+    """First SIGINT/SIGTERM drains the node and exits; a second one exits at once.
+
+    Windows event loops have no signal handlers, so there Ctrl-C (SIGINT) and
+    Ctrl-Break (SIGBREAK) are caught with ``signal.signal`` and the drain is
+    handed to the loop from the handler.
+    """
+    loop = asyncio.get_running_loop()
+    main_task = asyncio.current_task()
+    drain_task = None
+
+    async def drain_then_stop():
+        logger.info(f"Draining: finishing {executor.load} job(s); press Ctrl-C again to stop now")
+        if not await executor.drain():
+            logger.warning("Drain timed out; stopping with jobs unfinished")
+        main_task.cancel()
+
+    def on_signal():
+        nonlocal drain_task
+        if drain_task is None:
+            drain_task = asyncio.create_task(drain_then_stop())
+        else:
+            main_task.cancel()
 
-        logger.info("Reconnecting in 5 seconds...")
-        await asyncio.sleep(5)
+    try:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, on_signal)
+    except (NotImplementedError, RuntimeError):
+        # Python runs signal.signal handlers between bytecodes of the main
+        # thread, so only schedule the drain; the loop runs it
+        for name in ("SIGINT", "SIGBREAK"):
+            sig = getattr(signal, name, None)
+            if sig is not None:
+                signal.signal(sig, lambda *_: loop.call_soon_threadsafe(on_signal))
+
+
+async def _connect_once(auth_token, models, executor, session):
+    """Run one WebSocket session until it drops. Sessions are reused across calls.
+
+    Returns True if the node registered during the session.
+    """
+    watcher = None
+    registered = False
+    try:
+        async with backend_session().ws_connect(SERVER_URL, heartbeat=20) as ws:
+            logger.info(f"Connected to Server at {SERVER_URL}")
+
+            # Register with agent token (always plain JSON)
+            register_msg = {
+                "type": "register",
+                "node_id": NODE_ID,
+                "auth_token": auth_token,
+                "gpu_info": {
+                    "provider": "Ollama-Local",
+                    "models": models,
+                    "platform": platform.platform(),
+                    "max_parallel": executor.workers,
+                },
+                "agent_version": AGENT_VERSION,
+                "protocol_version": PROTOCOL_VERSION,
+                "capabilities": CAPABILITIES,
+                "encodings": ENCODINGS,
+                "resume_token": session["resume_token"],
+            }
+            await ws.send_str(json.dumps(register_msg, ensure_ascii=False))
+            encoding = "json"
+            # Features the server agreed to; older servers send none
+            server_capabilities = set()
+
+            async for msg in ws:
+                if msg.type in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                    data = decode_message(msg, encoding)
+                    msg_type = data.get("type")
+
+                    if msg_type == "registered":
+                        registered = True
+                        owner = data.get("owner", "unknown")
+                        server_capabilities = set(data.get("capabilities", []))
+                        session["resume_token"] = data.get("resume_token")
+                        if data.get("resumed"):
+                            logger.info(f"Resumed session with {len(data['resumed'])} job(s) in flight")
+                        if "compression" in server_capabilities:
+                            encoding = data.get("encoding", "json")
+                        executor.attach(ws, encoding, acks="result_ack" in server_capabilities)
+                        await executor.replay()
+                        if executor.draining:
+                            # Reconnected mid-drain: stay out of dispatch
+                            await send_message(ws, {"type": "drain"}, encoding)
+                        if "models_update" in server_capabilities and watcher is None:
+                            watcher = asyncio.create_task(watch_models(ws, encoding, models))
+                        logger.info(
+                            f"✅ Node registered as {NODE_ID} (owner: {owner}, "
+                            f"protocol: v{data.get('protocol_version', 2)}, encoding: {encoding})"
+                        )
+                    elif msg_type == "drain_ack":
+                        logger.info("Server stopped sending new jobs to this node")
+                    elif msg_type == "reconnect":
+                        # The server process is draining; move to another one
+                        session["retry_after"] = data.get("retry_after")
+                        logger.info("Server asked this node to reconnect")
+                    elif msg_type == "retry_later":
+                        session["retry_after"] = data.get("retry_after")
+                        logger.warning(f"Server busy; asked to retry in {session['retry_after']}s")
+                    elif msg_type == "auth_error":
+                        logger.error(f"❌ Token rejected: {data.get('error')}")
+                        clear_token()
+                        logger.info("Stored token cleared. Please re-authenticate.")
+                        print("\n  ❌ Authentication failed. Token revoked or invalid.")
+                        input("  Press Enter to exit...")
+                        raise _AuthRejected()
+                    elif msg_type == "job_dispatch":
+                        job_data = data.get("job_data")
+                        # Servers without "capacity" cannot re-route, so queue regardless
+                        bounded = "capacity" in server_capabilities
+                        if executor.submit(job_data, bounded=bounded):
+                            if "accept" in server_capabilities:
+                                # Stops the server re-offering it after another node's reject
+                                await send_message(ws, {
+                                    "type": "job_accept", "task_id": job_data.get("task_id"),
+                                }, encoding)
+                        else:
+                            reason = "draining" if executor.draining else "busy"
+                            logger.warning(f"{reason.capitalize()} ({executor.load} jobs); rejecting Task {job_data.get('task_id')}")
+                            await send_message(ws, {
+                                "type": "job_reject",
+                                "task_id": job_data.get("task_id"),
+                                "reason": reason,
+                                "retry_after": REJECT_RETRY_AFTER,
+                            }, encoding)
+                    elif msg_type == "job_cancel":
+                        if executor.cancel(data.get("task_id")):
+                            logger.info(f"Task {data.get('task_id')} cancelled by its owner")
+                    elif msg_type == "job_result_ack":
+                        executor.outbox.ack(data.get("task_id"))
+                    elif msg_type == "ping":
+                        await ws.send_str(json.dumps({"type": "pong"}))
+
+                elif msg.type == aiohttp.WSMsgType.ERROR:
+                    logger.error(f"WebSocket error: {ws.exception()}")
+                    break
+                elif msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSING, aiohttp.WSMsgType.CLOSED):
+                    logger.warning("WebSocket closed by server")
+                    break
+
+    except aiohttp.ClientError as e:
+        logger.error(f"Connection failed: {e}")
+    except _AuthRejected:
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+    finally:
+        executor.detach()
+        if watcher is not None:
+            watcher.cancel()
+    return registered
 
 
 def get_dashboard_url():
@@ -230,7 +694,7 @@ def get_dashboard_url():
 def main():
     print(f"""
 ╔══════════════════════════════════════════════════════╗
-║             GPU Connect Agent v2.1                  ║
+║             GPU Connect Agent v{AGENT_VERSION:<21}║
 ║                                                      ║
 ║  Node ID:  {NODE_ID:<40} ║
 ║  Server:   {API_URL:<40} ║
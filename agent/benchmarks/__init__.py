@@ -0,0 +1 @@
+"""Agent benchmarks. Run from agent/ with ``python -m benchmarks.<name>``."""
@@ -0,0 +1,66 @@
+"""
+Per-job HTTP overhead: a new ClientSession per call vs. the shared pool.
+
+    python -m benchmarks.bench_sessions [jobs]
+
+Runs jobs sequentially against a stub Ollama on loopback and reports the
+latency of each strategy and how many TCP connections it opened.
+"""
+import asyncio
+import logging
+import statistics
+import sys
+import time
+
+import aiohttp
+
+import agent_ollama
+from benchmarks.stub_ollama import StubOllama
+
+
+async def _per_call_session(task):
+    # What execute_task did before the shared session
+    async with aiohttp.ClientSession() as session:
+        async with session.post(
+            f"{agent_ollama.OLLAMA_URL}/api/generate",
+            json={"model": task["model"], "prompt": task["prompt"], "stream": False},
+        ) as response:
+            return await response.json()
+
+
+async def _measure(stub, run_job, jobs):
+    before = stub.connections
+    timings = []
+    for i in range(jobs):
+        task = {"task_id": i, "model": "llama3:latest", "prompt": "benchmark"}
+        start = time.perf_counter()
+        await run_job(task)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings, stub.connections - before
+
+
+async def main(jobs):
+    """Run both strategies and print a comparison."""
+    logging.getLogger("GPU-Agent").setLevel(logging.WARNING)
+    stub = await StubOllama().start()
+    agent_ollama.OLLAMA_URL = stub.url
+    try:
+        print(f"{'strategy':<18} | {'jobs':>5} | {'mean ms':>8} | {'p50 ms':>8} | {'p95 ms':>8} | {'TCP conns':>9}")
+        for label, run_job in (
+            ("session per call", _per_call_session),
+            ("shared session", agent_ollama.execute_task),
+        ):
+            timings, conns = await _measure(stub, run_job, jobs)
+            print(
+                f"{label:<18} | {jobs:>5} | {statistics.mean(timings) * 1000:>8.3f} | "
+                f"{timings[len(timings) // 2] * 1000:>8.3f} | "
+                f"{timings[int(len(timings) * 0.95)] * 1000:>8.3f} | {conns:>9}"
+            )
+    finally:
+        await agent_ollama.close_sessions()
+        await stub.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
@@ -0,0 +1,60 @@
+"""Minimal in-process stand-in for the Ollama HTTP API."""
+import asyncio
+
+from aiohttp import web
+
+
+class StubOllama:
+    """Serves /api/tags and /api/generate on a loopback port.
+
+    ``delay`` simulates inference time; ``connections`` counts the distinct
+    TCP connections clients opened.
+    """
+
+    def __init__(self, models=("llama3:latest",), delay=0.0, response="ok"):
+        self.models = list(models)
+        self.delay = delay
+        self.response = response
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._transports = set()
+        self._runner = None
+        self.url = None
+
+    @property
+    def connections(self):
+        """Distinct TCP connections seen so far."""
+        return len(self._transports)
+
+    async def _tags(self, request):
+        self._transports.add(request.transport)
+        return web.json_response({"models": [{"name": m} for m in self.models]})
+
+    async def _generate(self, request):
+        self._transports.add(request.transport)
+        await request.json()
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        return web.json_response({"response": self.response, "done": True})
+
+    async def start(self):
+        """Start listening on a free loopback port."""
+        app = web.Application()
+        app.router.add_get("/api/tags", self._tags)
+        app.router.add_post("/api/generate", self._generate)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]  # pylint: disable=protected-access
+        self.url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def stop(self):
+        """Shut the server down."""
+        await self._runner.cleanup()
@@ -70,6 +70,8 @@ WorkingDirectory=/opt/gpu-connect-agent
 ExecStart=/opt/gpu-connect-agent/venv/bin/python /opt/gpu-connect-agent/agent_ollama.py
 Restart=on-failure
 RestartSec=10
+# SIGTERM drains: let in-flight jobs finish (matches DRAIN_TIMEOUT)
+TimeoutStopSec=600
 StandardOutput=journal
 StandardError=journal
 
@@ -0,0 +1,234 @@
+"""
+Test Suite: Agent job execution
+Covers: JobExecutor concurrency bound, ResultOutbox replay and de-dup, reconnect backoff bounds,
+drain signal handling
+"""
+import asyncio
+import json
+
+import agent_ollama
+from agent_ollama import JobExecutor, ResultOutbox, reconnect_delay
+
+
+class FakeWebSocket:
+    """Records the frames the agent sends."""
+
+    def __init__(self):
+        self.closed = False
+        self.frames = []
+
+    async def send_str(self, text):  # pylint: disable=missing-function-docstring
+        self.frames.append(json.loads(text))
+
+    async def send_bytes(self, data):  # pylint: disable=missing-function-docstring
+        self.frames.append(data)
+
+    def results(self):
+        """Task ids of the job_result frames sent so far."""
+        return [f["result"]["task_id"] for f in self.frames if f.get("type") == "job_result"]
+
+
+def _job(task_id):
+    return {"task_id": task_id, "model": "llama3", "prompt": "hi"}
+
+
+def test_executor_runs_at_most_workers_jobs_and_refuses_beyond_the_queue(  # pylint: disable=missing-function-docstring
+    monkeypatch, tmp_path
+):
+    running, peak = set(), []
+    release = None
+
+    async def fake_execute(job_data):
+        running.add(job_data["task_id"])
+        peak.append(len(running))
+        await release.wait()
+        running.discard(job_data["task_id"])
+        return {"status": "success", "response": "ok", "task_id": job_data["task_id"]}
+
+    monkeypatch.setattr(agent_ollama, "execute_task", fake_execute)
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        executor = JobExecutor(workers=2, queue_size=1, outbox=ResultOutbox(tmp_path))
+        ws = FakeWebSocket()
+        executor.attach(ws, "json")
+        executor.start()
+        accepted = [executor.submit(_job(i)) for i in range(1, 5)]
+        await asyncio.sleep(0.01)
+        assert accepted == [True, True, True, False]
+        assert executor.load == 3
+        assert len(running) == 2
+        # Unbounded submits (legacy servers) are always queued
+        assert executor.submit(_job(5), bounded=False)
+
+        release.set()
+        assert await executor.drain(timeout=5)
+        await executor.stop()
+        assert max(peak) == 2
+        assert sorted(ws.results()) == [1, 2, 3, 5]
+        assert executor.load == 0
+
+    asyncio.run(scenario())
+
+
+def test_redispatch_of_an_active_job_is_not_run_twice(monkeypatch, tmp_path):  # pylint: disable=missing-function-docstring
+    calls = []
+
+    async def fake_execute(job_data):
+        calls.append(job_data["task_id"])
+        await asyncio.sleep(0.01)
+        return {"status": "success", "response": "ok", "task_id": job_data["task_id"]}
+
+    monkeypatch.setattr(agent_ollama, "execute_task", fake_execute)
+
+    async def scenario():
+        executor = JobExecutor(workers=1, queue_size=1, outbox=ResultOutbox(tmp_path))
+        executor.start()
+        assert executor.submit(_job(7))
+        assert executor.submit(_job(7))
+        assert executor.load == 1
+        assert await executor.drain(timeout=5)
+        await executor.stop()
+
+    asyncio.run(scenario())
+    assert calls == [7]
+
+
+def test_unacked_results_are_replayed_after_reconnect_until_acked(  # pylint: disable=missing-function-docstring
+    monkeypatch, tmp_path
+):
+    async def fake_execute(job_data):
+        return {"status": "success", "response": "ok", "task_id": job_data["task_id"]}
+
+    monkeypatch.setattr(agent_ollama, "execute_task", fake_execute)
+    outbox = ResultOutbox(tmp_path)
+
+    async def scenario():
+        executor = JobExecutor(workers=1, queue_size=1, outbox=outbox)
+        first = FakeWebSocket()
+        executor.attach(first, "json", acks=True)
+        executor.start()
+        executor.submit(_job(11))
+        assert await executor.drain(timeout=5)
+        await executor.stop()
+        assert first.results() == [11]
+        # Sent but never acknowledged: the connection dropped
+        first.closed = True
+        executor.detach()
+
+        second = FakeWebSocket()
+        executor.attach(second, "json", acks=True)
+        await executor.replay()
+        assert second.results() == [11]
+
+        executor.outbox.ack(11)
+        third = FakeWebSocket()
+        executor.attach(third, "json", acks=True)
+        await executor.replay()
+        assert not third.results()
+
+    asyncio.run(scenario())
+    assert not outbox.pending()
+
+
+def test_results_finished_while_disconnected_wait_in_the_outbox(  # pylint: disable=missing-function-docstring
+    monkeypatch, tmp_path
+):
+    async def fake_execute(job_data):
+        return {"status": "success", "response": "ok", "task_id": job_data["task_id"]}
+
+    monkeypatch.setattr(agent_ollama, "execute_task", fake_execute)
+
+    async def scenario():
+        executor = JobExecutor(workers=1, queue_size=1, outbox=ResultOutbox(tmp_path))
+        executor.start()
+        executor.submit(_job(21))
+        assert await executor.drain(timeout=5)
+        await executor.stop()
+        ws = FakeWebSocket()
+        executor.attach(ws, "json")
+        await executor.replay()
+        return ws
+
+    ws = asyncio.run(scenario())
+    assert ws.results() == [21]
+    # Without acks a sent result leaves the outbox at once
+    assert not ResultOutbox(tmp_path).pending()
+
+
+def test_outbox_keeps_one_entry_per_task(tmp_path):  # pylint: disable=missing-function-docstring
+    outbox = ResultOutbox(tmp_path)
+    outbox.put({"task_id": 3, "status": "failed", "error": "first try"})
+    outbox.put({"task_id": 3, "status": "success", "response": "ok"})
+    outbox.put({"task_id": 4, "status": "success", "response": "ok"})
+    pending = outbox.pending()
+    assert sorted(r["task_id"] for r in pending) == [3, 4]
+    assert next(r for r in pending if r["task_id"] == 3)["status"] == "success"
+    outbox.ack(3)
+    outbox.ack(3)
+    assert [r["task_id"] for r in outbox.pending()] == [4]
+
+
+def test_outbox_discards_unreadable_entries(tmp_path):  # pylint: disable=missing-function-docstring
+    outbox = ResultOutbox(tmp_path)
+    (tmp_path / "9.json").write_text("{not json", encoding="utf-8")
+    assert not outbox.pending()
+    assert not list(tmp_path.glob("*.json"))
+
+
+def test_reconnect_delay_stays_within_the_backoff_bounds(monkeypatch):  # pylint: disable=missing-function-docstring
+    for pick in (lambda low, high: low, lambda low, high: high):
+        monkeypatch.setattr(agent_ollama.random, "uniform", pick)
+        for attempt in range(12):
+            ceiling = min(agent_ollama.RECONNECT_MAX, agent_ollama.RECONNECT_BASE * 2 ** attempt)
+            assert ceiling / 2 <= reconnect_delay(attempt) <= ceiling
+    monkeypatch.undo()
+    delays = [reconnect_delay(20) for _ in range(200)]
+    assert max(delays) <= agent_ollama.RECONNECT_MAX
+    assert min(delays) >= agent_ollama.RECONNECT_MAX / 2
+
+
+def test_reconnect_delay_honours_retry_after(monkeypatch):  # pylint: disable=missing-function-docstring
+    monkeypatch.setattr(agent_ollama.random, "uniform", lambda low, high: high)
+    assert reconnect_delay(0, retry_after=2) == 4
+    assert reconnect_delay(5, retry_after=30) == 30 + agent_ollama.RECONNECT_BASE
+    monkeypatch.setattr(agent_ollama.random, "uniform", lambda low, high: low)
+    assert reconnect_delay(5, retry_after=30) == 30
+
+
+
+def test_drain_handler_falls_back_to_signal_signal_without_loop_support(monkeypatch):  # pylint: disable=missing-function-docstring
+    class Executor:
+        """Records the drain the handler starts."""
+        load = 0
+        drained = False
+
+        async def drain(self):  # pylint: disable=missing-function-docstring
+            self.drained = True
+            return True
+
+    def unsupported(*_):
+        raise NotImplementedError
+
+    installed = {}
+    executor = Executor()
+
+    async def scenario():
+        # Patched here: asyncio.run installs its own SIGINT handler first
+        monkeypatch.setattr(agent_ollama.signal, "signal", installed.__setitem__)
+        monkeypatch.setattr(asyncio.get_running_loop(), "add_signal_handler", unsupported)
+
+        async def main():
+            agent_ollama._install_drain_handler(executor)  # pylint: disable=protected-access
+            installed[agent_ollama.signal.SIGINT](agent_ollama.signal.SIGINT, None)
+            await asyncio.sleep(5)
+
+        try:
+            await asyncio.wait_for(asyncio.create_task(main()), timeout=2)
+        except asyncio.CancelledError:
+            return True
+        return False
+
+    assert asyncio.run(scenario())
+    assert executor.drained
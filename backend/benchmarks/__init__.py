@@ -0,0 +1 @@
+"""Standalone benchmarks. Run from backend/ with ``python -m benchmarks.<name>``."""
@@ -0,0 +1,23 @@
+"""Boots Django against a throwaway test database for benchmark scripts."""
+import os
+from contextlib import contextmanager
+
+import django
+
+
+@contextmanager
+def test_database():
+    """Set up Django and yield while a fresh test database exists."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+    django.setup()
+    # pylint: disable=import-outside-toplevel
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
@@ -0,0 +1,70 @@
+"""
+Heartbeat write volume: per-node get()+save() vs. the presence buffer.
+
+    python -m benchmarks.bench_heartbeats [node counts...]
+
+Prints the queries and wall time one heartbeat interval costs for each
+connected-node count.
+"""
+import sys
+import time
+
+from benchmarks._django import test_database
+
+DEFAULT_COUNTS = (10, 100, 1000, 5000)
+
+
+def _per_node_save(node_ids):
+    from computing.models import Node  # pylint: disable=import-outside-toplevel
+    for node_id in node_ids:
+        Node.objects.get(node_id=node_id).save()
+
+
+def _presence(node_ids):
+    from computing.heartbeats import HeartbeatBuffer  # pylint: disable=import-outside-toplevel
+    buffer = HeartbeatBuffer()
+    for node_id in node_ids:
+        buffer.record(node_id, f"channel.{node_id}")
+    buffer.flush()
+
+
+def _measure(func, node_ids):
+    from django.db import connection  # pylint: disable=import-outside-toplevel
+
+    statements = []
+
+    def _count(execute, sql, params, many, context):
+        statements.append(sql.split(None, 1)[0].upper())
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(_count):
+        start = time.perf_counter()
+        func(node_ids)
+        elapsed = time.perf_counter() - start
+    return len(statements), statements.count("UPDATE"), elapsed
+
+
+def main(counts):
+    """Run the comparison for each node count and print a table."""
+    with test_database():
+        # pylint: disable=import-outside-toplevel
+        from computing.models import Node
+        from core.models import User
+
+        owner = User.objects.create_user(username="bench", password="bench")
+        print(f"{'nodes':>6} | {'strategy':<14} | {'queries':>7} | {'UPDATEs':>7} | {'ms':>9}")
+        for count in counts:
+            Node.objects.all().delete()
+            Node.objects.bulk_create([
+                Node(owner=owner, node_id=f"bench-{i}", name=f"Bench {i}",
+                     gpu_info={"gpus": [{"name": "RTX 4090"}], "models": ["llama3"]})
+                for i in range(count)
+            ])
+            node_ids = [f"bench-{i}" for i in range(count)]
+            for label, func in (("get+save", _per_node_save), ("presence", _presence)):
+                queries, writes, elapsed = _measure(func, node_ids)
+                print(f"{count:>6} | {label:<14} | {queries:>7} | {writes:>7} | {elapsed * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_COUNTS)
@@ -0,0 +1,350 @@
+"""
+Connection-scale benchmark for GPUConsumer and DashboardConsumer.
+
+    python -m benchmarks.bench_websockets [--agents N] [--dashboards N] [--jobs N]
+                                          [--v3-share F]
+
+Opens simulated agent and dashboard connections in process against
+``config.asgi.application`` through WebsocketCommunicator, then drives
+register, heartbeat, job and result traffic. A ``--v3-share`` of the agents
+register with protocol v3, negotiating an encoding and every capability, and
+accept jobs before answering them; the rest speak the legacy protocol.
+Reports Python heap per connection, message latency percentiles and DB
+queries per second for each phase. Runs on InMemoryChannelLayer and a
+throwaway SQLite test database, so no external services are needed.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from benchmarks._django import test_database
+
+# Connections opened concurrently while ramping up
+CONNECT_BATCH = 100
+
+
+class Client:
+    """One simulated WebSocket client with a background reader."""
+
+    def __init__(self, application, path, encoding="json"):
+        # pylint: disable=import-outside-toplevel
+        from channels.testing import WebsocketCommunicator
+        self.comm = WebsocketCommunicator(application, path)
+        self.encoding = encoding
+        self._waiters = {}
+        self._reader = None
+
+    async def connect(self):
+        """Open the socket, start reading frames and return the handshake time."""
+        start = time.perf_counter()
+        connected, _ = await self.comm.connect(timeout=60)
+        assert connected, "connection rejected"
+        self._reader = asyncio.ensure_future(self._read())
+        return time.perf_counter() - start
+
+    def expect(self, key):
+        """Return a future resolved with the arrival time of the next ``key`` message."""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[key] = future
+        return future
+
+    async def send(self, payload):
+        """Send a JSON frame."""
+        await self.comm.send_to(text_data=json.dumps(payload))
+
+    async def close(self):
+        """Stop reading and disconnect."""
+        self._reader.cancel()
+        await self.comm.disconnect(timeout=30)
+
+    async def _read(self):
+        from computing.protocol import decode  # pylint: disable=import-outside-toplevel
+        # Read the queue directly: receive_from() cancels the app on timeout
+        while True:
+            message = await self.comm.output_queue.get()
+            if message.get("type") != "websocket.send":
+                continue
+            arrived = time.perf_counter()
+            key = _message_key(decode(message.get("text"), message.get("bytes"), self.encoding))
+            future = self._waiters.pop(key, None)
+            if future and not future.done():
+                future.set_result(arrived)
+
+
+def _message_key(data):
+    msg_type = data.get("type")
+    if msg_type == "job_dispatch":
+        return msg_type, data["job_data"]["task_id"]
+    if msg_type == "job_update":
+        return msg_type, data["job"]["id"]
+    if msg_type == "job_result_ack":
+        return msg_type, data["task_id"]
+    return (msg_type,)
+
+
+class QueryCounter:
+    """Counts SQL statements on every thread's connection."""
+
+    def __init__(self):
+        self.count = 0
+
+    def install(self):
+        """Wrap CursorWrapper so statements from sync_to_async threads are counted."""
+        from django.db.backends import utils  # pylint: disable=import-outside-toplevel
+        original = utils.CursorWrapper._execute_with_wrappers  # pylint: disable=protected-access
+        counter = self
+
+        def counted(cursor, sql, params, many, executor):
+            counter.count += 1
+            return original(cursor, sql, params, many, executor)
+
+        utils.CursorWrapper._execute_with_wrappers = counted  # pylint: disable=protected-access
+
+
+class Report:
+    """Collects per-phase results and prints them as a table."""
+
+    def __init__(self, queries):
+        self.queries = queries
+        self.rows = []
+
+    @contextmanager
+    def phase(self, name, latencies):
+        """Time a phase; ``latencies`` is filled in seconds by the caller."""
+        start_queries = self.queries.count
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        queries = self.queries.count - start_queries
+        self.rows.append((name, elapsed, queries, sorted(latencies)))
+
+    def print(self):
+        """Print every phase."""
+        print(
+            f"{'phase':<18} | {'msgs':>6} | {'p50 ms':>8} | {'p95 ms':>8} | "
+            f"{'p99 ms':>8} | {'max ms':>8} | {'queries':>8} | {'q/s':>8} | {'secs':>6}"
+        )
+        for name, elapsed, queries, latencies in self.rows:
+            print(
+                f"{name:<18} | {len(latencies):>6} | {_pct(latencies, 50):>8.2f} | "
+                f"{_pct(latencies, 95):>8.2f} | {_pct(latencies, 99):>8.2f} | "
+                f"{_pct(latencies, 100):>8.2f} | {queries:>8} | "
+                f"{queries / elapsed if elapsed else 0:>8.0f} | {elapsed:>6.2f}"
+            )
+
+
+def _pct(values, percentile):
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(len(values) * percentile / 100))
+    return values[index] * 1000
+
+
+async def _open(clients, latencies):
+    for start in range(0, len(clients), CONNECT_BATCH):
+        latencies += await asyncio.gather(
+            *(c.connect() for c in clients[start:start + CONNECT_BATCH])
+        )
+
+
+def _heap():
+    """Traced heap size after a full collection."""
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+async def _round_trip(sender, receiver, key, payload):
+    """Send ``payload`` from sender; return seconds until receiver gets ``key``."""
+    waiter = receiver.expect(key)
+    sent = time.perf_counter()
+    await sender.send(payload)
+    return await asyncio.wait_for(waiter, timeout=60) - sent
+
+
+def _setup_users(providers):
+    """Create job owner, providers and agent tokens. Returns (owner, jwt, raw tokens)."""
+    # pylint: disable=import-outside-toplevel
+    from decimal import Decimal
+    from rest_framework_simplejwt.tokens import AccessToken
+    from core.models import AgentToken, User
+
+    owner = User.objects.create_user(
+        username="bench_owner", password="bench", wallet_balance=Decimal("1000000.00"),
+    )
+    tokens = []
+    for i in range(providers):
+        provider = User.objects.create_user(username=f"bench_provider_{i}", password="bench")
+        tokens.append(AgentToken.generate(provider)[1])
+    return owner, str(AccessToken.for_user(owner)), tokens
+
+
+def _create_jobs(owner, count):
+    """Create PENDING jobs with escrow holds, as JobSubmissionView does."""
+    # pylint: disable=import-outside-toplevel
+    from decimal import Decimal
+    from computing.models import Job
+    from payments.services import EscrowService
+
+    jobs = []
+    for _ in range(count):
+        job = Job.objects.create(
+            user=owner, task_type="inference",
+            input_data={"prompt": "bench", "model": "llama3"},
+            status="PENDING", cost=Decimal("1.00"),
+        )
+        EscrowService.reserve(owner, job, Decimal("1.00"))
+        jobs.append(job.id)
+    return jobs
+
+
+def _register_message(node_id, token, v3):
+    """A legacy register, or a v3 one offering every encoding and capability."""
+    # pylint: disable=import-outside-toplevel
+    from computing.protocol import PROTOCOL_VERSION, SERVER_CAPABILITIES, supported_encodings
+    message = {
+        "type": "register",
+        "node_id": node_id,
+        "auth_token": token,
+        "gpu_info": {"gpus": [{"name": "RTX 4090"}], "models": ["llama3"]},
+    }
+    if v3:
+        message.update({
+            "protocol_version": PROTOCOL_VERSION,
+            "capabilities": sorted(SERVER_CAPABILITIES),
+            "encodings": supported_encodings(),
+        })
+    return message
+
+
+async def run(agents, dashboards, jobs, v3_share):  # pylint: disable=too-many-locals,too-many-statements
+    """Drive every phase and print the report."""
+    # pylint: disable=import-outside-toplevel
+    from channels.db import database_sync_to_async
+    from channels.layers import get_channel_layer
+    from config.asgi import application
+    from computing import admission
+    from computing.keepalive import get_keepalive_scheduler
+    from computing.protocol import negotiate, supported_encodings
+
+    # Measure steady-state cost, not the registration rate limit
+    admission._limiter = admission.RegistrationLimiter(  # pylint: disable=protected-access
+        rate=float(agents), burst=agents,
+    )
+    queries = QueryCounter()
+    queries.install()
+    report = Report(queries)
+    owner, owner_jwt, tokens = await database_sync_to_async(_setup_users)(max(1, agents // 10))
+
+    # Connect agents
+    tracemalloc.start()
+    base = _heap()
+    # Every n-th agent speaks v3, spreading the cohort over workers and buckets
+    v3_every = round(1 / v3_share) if v3_share > 0 else 0
+    v3_agents = {i for i in range(agents) if v3_every and i % v3_every == 0}
+    agent_clients = [
+        Client(
+            application, "/ws/computing/",
+            negotiate(supported_encodings()) if i in v3_agents else "json",
+        )
+        for i in range(agents)
+    ]
+    latencies = []
+    with report.phase("agent connect", latencies):
+        await _open(agent_clients, latencies)
+    agent_bytes = (_heap() - base) / agents
+
+    latencies = []
+    with report.phase("agent register", latencies):
+        for start in range(0, agents, CONNECT_BATCH):
+            latencies += await asyncio.gather(*(
+                _round_trip(client, client, ("registered",), _register_message(
+                    f"bench-node-{i}", tokens[i % len(tokens)], i in v3_agents,
+                ))
+                for i, client in enumerate(agent_clients[start:start + CONNECT_BATCH], start)
+            ))
+
+    # Connect dashboards; the first one is the job owner's
+    base = _heap()
+    dashboard_clients = [
+        Client(application, f"/ws/dashboard/?token={owner_jwt}" if i == 0 else "/ws/dashboard/")
+        for i in range(dashboards)
+    ]
+    latencies = []
+    with report.phase("dashboard connect", latencies):
+        await _open(dashboard_clients, latencies)
+    dashboard_bytes = (_heap() - base) / max(1, dashboards)
+    tracemalloc.stop()
+
+    # Heartbeats: one scheduler pass over every bucket (latency = tick time)
+    scheduler = get_keepalive_scheduler()
+    pings = [c.expect(("ping",)) for c in agent_clients]
+    latencies = []
+    with report.phase("heartbeat tick", latencies):
+        for bucket in scheduler._buckets:  # pylint: disable=protected-access
+            start = time.perf_counter()
+            await scheduler.tick(list(bucket))
+            latencies.append(time.perf_counter() - start)
+        await asyncio.wait_for(asyncio.gather(*pings), timeout=60)
+
+    # Jobs: broadcast dispatch, one agent answers each job; v3 agents accept
+    # it first and get a job_result_ack back
+    job_ids = await database_sync_to_async(_create_jobs)(owner, jobs)
+    channel_layer = get_channel_layer()
+    dispatch, results = [], []
+    owner_dashboard = dashboard_clients[0] if dashboards else None
+    with report.phase("job dispatch", dispatch):
+        for job_id in job_ids:
+            worker = agent_clients[job_id % agents]
+            waiter = worker.expect(("job_dispatch", job_id))
+            sent = time.perf_counter()
+            await channel_layer.group_send("gpu_nodes", {
+                "type": "job_dispatch",
+                "job_data": {"task_id": job_id, "owner_id": owner.id,
+                             "model": "llama3", "prompt": "bench"},
+            })
+            dispatch.append(await asyncio.wait_for(waiter, timeout=60) - sent)
+            if job_id % agents in v3_agents:
+                await worker.send({"type": "job_accept", "task_id": job_id})
+    with report.phase("job result", results):
+        for job_id in job_ids:
+            payload = {"type": "job_result", "result": {
+                "task_id": job_id, "status": "success", "response": "ok",
+            }}
+            worker = agent_clients[job_id % agents]
+            if owner_dashboard:
+                receiver, key = owner_dashboard, ("job_update", job_id)
+            elif job_id % agents in v3_agents:
+                receiver, key = worker, ("job_result_ack", job_id)
+            else:
+                await worker.send(payload)
+                continue
+            results.append(await _round_trip(worker, receiver, key, payload))
+
+    for client in dashboard_clients + agent_clients:
+        await client.close()
+
+    report.print()
+    print(f"\nagents={agents} (v3: {len(v3_agents)}) dashboards={dashboards} jobs={jobs}")
+    print(f"heap per agent connection:     {agent_bytes / 1024:.1f} KiB")
+    print(f"heap per dashboard connection: {dashboard_bytes / 1024:.1f} KiB")
+
+
+def main():
+    """Parse arguments and run the benchmark on a throwaway database."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--agents", type=int, default=1000)
+    parser.add_argument("--dashboards", type=int, default=100)
+    parser.add_argument("--jobs", type=int, default=50)
+    parser.add_argument("--v3-share", type=float, default=0.5,
+                        help="fraction of agents speaking protocol v3 (0 to 1)")
+    args = parser.parse_args()
+    with test_database():
+        asyncio.run(run(args.agents, args.dashboards, args.jobs, args.v3_share))
+
+
+if __name__ == "__main__":
+    main()
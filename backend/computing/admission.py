@@ -0,0 +1,49 @@
+"""Admission control for node registrations.
+
+After a deploy every agent reconnects at once. A token bucket admits
+NODE_REGISTER_RATE registrations per second with a burst of
+NODE_REGISTER_BURST. A register that finds the bucket empty is answered
+with ``retry_later`` instead of hitting the database. Its ``retry_after``
+hint hands out successive slots 1/rate apart, so a crowd of rejected
+agents comes back spread over time rather than all at once.
+"""
+import time
+
+from django.conf import settings
+
+# Longest retry_after hint handed out, however deep the backlog
+MAX_RETRY_AFTER = 300
+
+
+class RegistrationLimiter:
+    """Token bucket with slotted retry hints; one per process, used on the event loop."""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._next_slot = 0.0
+
+    def acquire(self):
+        """Admit a registration (returns 0) or return seconds to wait before retrying."""
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        self._next_slot = max(self._next_slot, now) + 1 / self.rate
+        return min(self._next_slot - now, MAX_RETRY_AFTER)
+
+
+_limiter = None  # pylint: disable=invalid-name
+
+
+def get_register_limiter():
+    """Return the process-wide registration limiter."""
+    global _limiter  # pylint: disable=global-statement
+    if _limiter is None:
+        _limiter = RegistrationLimiter(settings.NODE_REGISTER_RATE, settings.NODE_REGISTER_BURST)
+    return _limiter
@@ -1,34 +1,38 @@
 """WebSocket consumers for GPU node communication and dashboard updates."""
-import asyncio
 import json
 import logging
 from decimal import Decimal
 
+from asgiref.sync import sync_to_async
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.db import transaction
 from django.utils import timezone
 
-from datetime import timedelta
+from core.token_cache import revocation_group, token_cache
+from .admission import get_register_limiter
+from .dispatch import (
+    REDISPATCH_DELAY, announce_cancellation, hand_over_followers, node_group,
+    redispatch_pending, schedule_redispatch,
+)
+from .drain import DRAIN_RETRY_AFTER, install_drain_handler, is_draining
+from .hedging import cancel_losers, hold_failure, record_loser
+from .heartbeats import ensure_heartbeat_flusher, heartbeat_buffer
+from .keepalive import get_keepalive_scheduler
+from .presence import active_nodes, get_presence
+from .protocol import (
+    ACCEPT, CANCEL, CAPACITY, COMPRESSION, DRAIN, JSON, LEGACY_PROTOCOL_VERSION, MODELS_UPDATE,
+    RESULT_ACK, RESUME, decode, encode, negotiate, negotiate_capabilities,
+)
+from .result_cache import CACHED_JOB_COST, get_result_cache
+from .scoring import record_failure, record_result
+from .sessions import IN_FLIGHT_PRUNE_AT, new_resume_token, park_session, resume_session
 
 logger = logging.getLogger(__name__)
 
 JOB_COST = Decimal("1.00")
 PROVIDER_SHARE = Decimal("1.00")
 
-# Nodes with no heartbeat for this long are auto-marked inactive
-NODE_STALE_THRESHOLD = timedelta(seconds=45)
-
-
-def _cleanup_stale_nodes():
-    """Mark nodes inactive if their last heartbeat is older than threshold."""
-    from .models import Node  # pylint: disable=import-outside-toplevel
-    cutoff = timezone.now() - NODE_STALE_THRESHOLD
-    stale = Node.objects.filter(is_active=True, last_heartbeat__lt=cutoff)
-    count = stale.update(is_active=False)
-    if count:
-        logger.info("Marked %d stale node(s) inactive (no heartbeat since %s)", count, cutoff)
-
-
 class GPUConsumer(AsyncWebsocketConsumer):
     """Handles GPU provider node WebSocket connections and job dispatching."""
 
@@ -36,15 +40,30 @@ class GPUConsumer(AsyncWebsocketConsumer):
         """Accept the WebSocket and start keep-alive pings."""
         self.node_id = "unknown"
         self.provider_user_id = None
-        self.auth_token = None
+        self.agent_token_id = None
+        self.encoding = JSON
+        self.protocol_version = LEGACY_PROTOCOL_VERSION
+        self.capabilities = frozenset()
+        # Jobs sent to this node with no result or rejection yet (RESUME only)
+        self.in_flight = set()
+        # Jobs hedged dispatch offered to this node alone, with no result or rejection yet
+        self.targeted = set()
+        self.resume_token = None
+        # Set once the node asked to drain: no new jobs, results still accepted
+        self.draining = False
         self.group_name = "gpu_nodes"
+        # Per-node group, kept while draining (job_cancel for running jobs)
+        self.node_group = None
         await self.channel_layer.group_add(
             self.group_name,
             self.channel_name
         )
         await self.accept()
         logger.info("WebSocket Connected")
-        self._ping_task = asyncio.ensure_future(self._keep_alive())
+        ensure_heartbeat_flusher()
+        install_drain_handler()
+        # Pings, heartbeats and token re-checks run from the shared scheduler
+        get_keepalive_scheduler().add(self)
 
     async def _broadcast_dashboard_update(self):
         """Trigger a recalculation and broadcast to dashboard consumers."""
@@ -76,13 +95,12 @@ class GPUConsumer(AsyncWebsocketConsumer):
     @database_sync_to_async
     def _get_stats(self):
         """Return network stats: active nodes, completed jobs, model count."""
-        from .models import Node, Job  # pylint: disable=import-outside-toplevel
-        _cleanup_stale_nodes()
-        active_nodes = Node.objects.filter(is_active=True).count()
+        from .models import Job  # pylint: disable=import-outside-toplevel
+        active_count = active_nodes().count()
         completed_jobs = Job.objects.filter(status="COMPLETED").count()
         models = self._get_models_sync_shared()
         return {
-            "active_nodes": active_nodes,
+            "active_nodes": active_count,
             "completed_jobs": completed_jobs,
             "available_models": len(models)
         }
@@ -90,13 +108,11 @@ class GPUConsumer(AsyncWebsocketConsumer):
     @database_sync_to_async
     def _get_models(self):
         """Return available models aggregated from active nodes."""
-        _cleanup_stale_nodes()
         return self._get_models_sync_shared()
 
     def _get_models_sync_shared(self):
         """Synchronous helper: aggregate model counts from active nodes."""
-        from .models import Node  # pylint: disable=import-outside-toplevel
-        nodes = Node.objects.filter(is_active=True)
+        nodes = active_nodes()
         model_counts = {}
         for node in nodes:
             info = node.gpu_info or {}
@@ -110,48 +126,35 @@ class GPUConsumer(AsyncWebsocketConsumer):
                     model_counts[name] = model_counts.get(name, 0) + 1
         return [{"name": k, "providers": v} for k, v in model_counts.items()]
 
-    async def _keep_alive(self):
-        """Send periodic pings and RE-VALIDATE token to handle revocation."""
-        try:
-            while True:
-                await asyncio.sleep(15)
-
-                # Re-validate token if we are registered
-                if self.auth_token:
-                    user_id = await self._validate_token(self.auth_token)
-                    if not user_id:
-                        logger.warning(
-                            "Token revoked for node %s. Disconnecting.",
-                            self.node_id,
-                        )
-                        await self.send(json.dumps({
-                            "type": "auth_error",
-                            "error": "Token revoked or expired."
-                        }, ensure_ascii=False))
-                        await self.close()
-                        return
-
-                # Update node's last_heartbeat to keep it active
-                if self.node_id != "unknown":
-                    await self._touch_node_heartbeat(self.node_id)
-
-                await self.send(json.dumps(
-                    {"type": "ping"}, ensure_ascii=False,
-                ))
-        except Exception:  # pylint: disable=broad-except
-            pass
-
     async def disconnect(self, close_code):
         """Clean up on WebSocket disconnect."""
         logger.info("WebSocket Disconnected: %s", close_code)
-        if hasattr(self, '_ping_task'):
-            self._ping_task.cancel()
+        get_keepalive_scheduler().remove(self)
         await self.channel_layer.group_discard(
             self.group_name,
             self.channel_name
         )
+        if getattr(self, "agent_token_id", None):
+            await self.channel_layer.group_discard(
+                revocation_group(self.agent_token_id),
+                self.channel_name
+            )
+        if getattr(self, "node_group", None):
+            await self.channel_layer.group_discard(self.node_group, self.channel_name)
         if self.node_id != "unknown":
+            parked = self.in_flight - self.targeted
+            if self.resume_token and parked:
+                unfinished = await self._unfinished_jobs(parked)
+                if unfinished:
+                    await park_session(self.node_id, self.resume_token, unfinished)
+            heartbeat_buffer.discard(self.node_id)
+            await sync_to_async(get_presence().remove)(self.node_id)
             await self._mark_node_inactive(self.node_id)
+            # No other node has these jobs, so they cannot wait for a resume.
+            # The node is out of presence by now, so they go elsewhere.
+            for task_id in self.targeted:
+                if await redispatch_pending(task_id, node_id=self.node_id):
+                    logger.info("Re-dispatched Job %s from departed Node %s", task_id, self.node_id)
             await self._broadcast_dashboard_update()
             if self.provider_user_id:
                 await self.channel_layer.group_send(
@@ -162,19 +165,34 @@ class GPUConsumer(AsyncWebsocketConsumer):
                     }
                 )
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         """Route incoming WebSocket messages by type."""
-        data = json.loads(text_data)
+        try:
+            data = decode(text_data, bytes_data, self.encoding)
+        except ValueError as e:
+            logger.warning("Undecodable frame from node %s: %s", self.node_id, e)
+            return
         msg_type = data.get("type")
 
         if msg_type == "register":
+            # Shed reconnect storms before touching the database; a draining
+            # process sends every node on to the others
+            retry_after = DRAIN_RETRY_AFTER if is_draining() else get_register_limiter().acquire()
+            if retry_after:
+                await self.send(json.dumps({
+                    "type": "retry_later",
+                    "retry_after": round(retry_after, 2),
+                }, ensure_ascii=False))
+                await self.close()
+                return
+
             self.node_id = data.get("node_id")
             gpu_info = data.get("gpu_info")
             auth_token = data.get("auth_token")
 
-            # Validate JWT and get user
-            user_id = await self._validate_token(auth_token)
-            if not user_id:
+            # Validate the agent token and get user
+            resolved = await self._resolve_token(auth_token)
+            if not resolved:
                 await self.send(json.dumps({
                     "type": "auth_error",
                     "error": "Invalid or expired token. Please re-login."
@@ -182,18 +200,43 @@ class GPUConsumer(AsyncWebsocketConsumer):
                 await self.close()
                 return
 
-            self.auth_token = auth_token
+            user_id, self.agent_token_id = resolved
             self.provider_user_id = user_id
+            # Revoking the token pushes a token_revoked event to this group
+            await self.channel_layer.group_add(
+                revocation_group(self.agent_token_id),
+                self.channel_name
+            )
+            self.node_group = node_group(self.node_id)
+            await self.channel_layer.group_add(self.node_group, self.channel_name)
             logger.info(
                 "Registering Node: %s (user_id=%s)", self.node_id, user_id,
             )
 
             username = await self._register_node(self.node_id, gpu_info, user_id)
-            await self.send(json.dumps({
+            await sync_to_async(get_presence().touch)({self.node_id: self.channel_name})
+            self.protocol_version, self.capabilities = negotiate_capabilities(data)
+            # Frames after this one use the negotiated encoding
+            if self.supports(COMPRESSION):
+                self.encoding = negotiate(data.get("encodings"))
+            registered = {
                 "type": "registered",
                 "status": "ok",
-                "owner": username
-            }, ensure_ascii=False))
+                "owner": username,
+                "protocol_version": self.protocol_version,
+                "capabilities": sorted(self.capabilities),
+                "encoding": self.encoding,
+            }
+            if self.supports(RESUME):
+                # Re-bind jobs parked when this node last disconnected
+                resumed = await resume_session(self.node_id, data.get("resume_token"))
+                if resumed:
+                    logger.info("Node %s resumed %d in-flight job(s)", self.node_id, len(resumed))
+                self.in_flight.update(resumed)
+                self.resume_token = new_resume_token()
+                registered["resume_token"] = self.resume_token
+                registered["resumed"] = sorted(resumed)
+            await self.send(json.dumps(registered, ensure_ascii=False))
             await self._broadcast_dashboard_update()
             await self.channel_layer.group_send(
                 f"user_{user_id}",
@@ -215,14 +258,65 @@ class GPUConsumer(AsyncWebsocketConsumer):
             )
 
             if task_id:
+                self.in_flight.discard(task_id)
+                self.targeted.discard(task_id)
+                await self._record_timings(task_id, result)
                 if status == "success":
-                    await self._complete_job(task_id, {"output": response_text}, self.provider_user_id)
+                    await record_loser(task_id, self.node_id)
+                    followers = await self._complete_job(
+                        task_id, {"output": response_text}, self.provider_user_id,
+                        node_id=self.node_id,
+                    )
                     await self._broadcast_dashboard_update()
                     # Notify involved users (Owner & Provider)
                     await self._notify_job_completion(task_id, self.provider_user_id)
+                    for follower_id in followers:
+                        await self._notify_job_completion(follower_id, None)
+                    # The first success wins; a hedged duplicate still running is stopped
+                    await cancel_losers(task_id)
+                elif await hold_failure(task_id, self.node_id, {"error": error}):
+                    logger.info(
+                        "Hedged Job %s failed on Node %s; waiting for its other attempt",
+                        task_id, self.node_id,
+                    )
                 else:
                     await self._fail_job(task_id, {"error": error})
                     await self._notify_job_completion(task_id, self.provider_user_id)
+                    await hand_over_followers(task_id)
+                # Agents keep the result on disk until acknowledged; replays
+                # of a finished job are no-ops above and are acked again
+                if self.supports(RESULT_ACK):
+                    await self._send_message({"type": "job_result_ack", "task_id": task_id})
+
+        elif msg_type == "job_accept" and self.supports(ACCEPT):
+            task_id = data.get("task_id")
+            if task_id and await self._accept_job(task_id):
+                logger.info("Node %s took Job %s", self.node_id, task_id)
+
+        elif msg_type == "job_reject" and self.supports(CAPACITY):
+            task_id = data.get("task_id")
+            logger.info(
+                "Node %s rejected Job %s (%s)",
+                self.node_id, task_id, data.get("reason", "busy"),
+            )
+            if task_id:
+                self.in_flight.discard(task_id)
+                self.targeted.discard(task_id)
+                try:
+                    delay = float(data.get("retry_after", REDISPATCH_DELAY))
+                except (TypeError, ValueError):
+                    delay = REDISPATCH_DELAY
+                schedule_redispatch(task_id, delay, node_id=self.node_id)
+
+        elif msg_type == "models_update" and self.supports(MODELS_UPDATE):
+            changed = await self._apply_models_update(
+                self.node_id, data.get("added") or [], data.get("removed") or [],
+            )
+            if changed:
+                await self._broadcast_dashboard_update()
+
+        elif msg_type == "drain" and self.supports(DRAIN):
+            await self._drain_node()
 
         elif msg_type == "pong":
             pass
@@ -288,6 +382,7 @@ class GPUConsumer(AsyncWebsocketConsumer):
         """Gather job, owner, and provider data for completion notifications."""
         from .models import Job  # pylint: disable=import-outside-toplevel
         from core.models import User  # pylint: disable=import-outside-toplevel
+        from payments.services import EscrowService  # pylint: disable=import-outside-toplevel
         try:
             job = Job.objects.get(id=job_id)
             owner = job.user
@@ -305,7 +400,7 @@ class GPUConsumer(AsyncWebsocketConsumer):
             is_dict = isinstance(input_data, dict)
             return {
                 "owner_id": owner.id,
-                "owner_balance": owner.wallet_balance,
+                "owner_balance": EscrowService.available_balance(owner),
                 "provider_balance": provider_bal,
                 "max_retries": 1,
                 "job_data": {
@@ -347,23 +442,117 @@ class GPUConsumer(AsyncWebsocketConsumer):
             )
             return
 
-        await self.send(json.dumps({
+        # Dispatches queued before the node left the group
+        if self.draining:
+            if event.get("targeted"):
+                await redispatch_pending(job_data["task_id"])
+            return
+
+        await self._send_message({
             "type": "job_dispatch",
             "job_data": job_data
+        })
+        if event.get("targeted"):
+            self.targeted.add(job_data["task_id"])
+        if self.supports(RESUME):
+            self.in_flight.add(job_data["task_id"])
+            if len(self.in_flight) >= IN_FLIGHT_PRUNE_AT:
+                # Broadcast jobs finished by other nodes never report back here
+                self.in_flight = await self._unfinished_jobs(self.in_flight)
+
+    async def job_cancel(self, event):
+        """Handler for a cancelled job: tell the node to abort it."""
+        if event.get("direct") and not self.draining:
+            return  # the gpu_nodes broadcast already reached this node
+        task_id = event["task_id"]
+        self.in_flight.discard(task_id)
+        self.targeted.discard(task_id)
+        if self.provider_user_id and self.supports(CANCEL):
+            await self._send_message({"type": "job_cancel", "task_id": task_id})
+
+    async def _drain_node(self):
+        """Take this node out of dispatch and presence; it stays connected for results."""
+        if self.draining:
+            return
+        self.draining = True
+        logger.info(
+            "Node %s draining with %d job(s) in flight", self.node_id, len(self.in_flight),
+        )
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        heartbeat_buffer.discard(self.node_id)
+        await sync_to_async(get_presence().remove)(self.node_id)
+        await self._mark_node_inactive(self.node_id)
+        await self._send_message({"type": "drain_ack"})
+        await self._broadcast_dashboard_update()
+
+    async def hand_off(self, retry_after):
+        """Ask the node to reconnect to another process (server drain)."""
+        await self.send(json.dumps({
+            "type": "reconnect",
+            "retry_after": retry_after,
         }, ensure_ascii=False))
+        await self.close()
+
+    def supports(self, capability):
+        """Whether this node negotiated an optional protocol feature."""
+        return capability in self.capabilities
+
+    async def _send_message(self, message):
+        """Send a message in the encoding negotiated at registration."""
+        text_data, bytes_data = encode(message, self.encoding)
+        await self.send(text_data=text_data, bytes_data=bytes_data)
+
+    async def token_revoked(self, event):
+        """Handler for a pushed revocation of this node's agent token."""
+        token_cache.evict(event["token_id"])
+        logger.warning(
+            "Token revoked for node %s. Disconnecting.", self.node_id,
+        )
+        await self.send(json.dumps({
+            "type": "auth_error",
+            "error": "Token revoked or expired."
+        }, ensure_ascii=False))
+        await self.close()
 
     # --- DB Operations ---
 
-    @database_sync_to_async
-    def _validate_token(self, token):
-        """Validate an agent token (gpc_...) and return user_id, or None."""
+    async def _resolve_token(self, token):
+        """Return (user_id, token_id) for a valid agent token, or None.
+
+        Validated tokens are cached in process for TOKEN_CACHE_TTL seconds. A
+        cache hit still checks ``is_active`` by primary key, because a
+        revocation only evicts the caches of processes that have a node
+        connected with the token.
+        """
         if not token:
             return None
+        from core.models import AgentToken  # pylint: disable=import-outside-toplevel
+        token_hash = AgentToken.hash_token(token)
+        cached = token_cache.get(token_hash)
+        if cached:
+            if await self._token_active(cached[1]):
+                return cached
+            token_cache.evict(cached[1])
+            return None
+        resolved = await self._lookup_token(token)
+        if resolved:
+            token_cache.put(token_hash, *resolved)
+        return resolved
+
+    @database_sync_to_async
+    def _token_active(self, token_id):
+        """Read-only check that a cached token has not been revoked since."""
+        from core.models import AgentToken  # pylint: disable=import-outside-toplevel
+        return AgentToken.objects.filter(id=token_id, is_active=True).exists()
+
+    @database_sync_to_async
+    def _lookup_token(self, token):
+        """Validate an agent token against the DB; return (user_id, token_id)."""
         try:
             from core.models import AgentToken  # pylint: disable=import-outside-toplevel
             agent_token = AgentToken.validate(token)
             if agent_token:
-                return agent_token.user_id
+                return agent_token.user_id, agent_token.id
             return None
         except Exception as e:  # pylint: disable=broad-except
             logger.warning("Token validation failed: %s", e)
@@ -388,6 +577,40 @@ class GPUConsumer(AsyncWebsocketConsumer):
         logger.info("%s Node: %s (owner: %s)", action, node, owner.username)
         return owner.username
 
+    @database_sync_to_async
+    def _apply_models_update(self, node_id, added, removed):
+        """Apply a model list diff to the node's gpu_info. Returns True if it changed."""
+        from .models import Node  # pylint: disable=import-outside-toplevel
+        with transaction.atomic():
+            node = Node.objects.select_for_update().filter(node_id=node_id).first()
+            if node is None:
+                return False
+            info = node.gpu_info or {}
+            current = info.get("models", [])
+            removed = set(removed)
+            models = [
+                m for m in current
+                if (m.get("name") if isinstance(m, dict) else m) not in removed
+            ]
+            names = {m.get("name") if isinstance(m, dict) else m for m in models}
+            models += [m for m in added if m not in names]
+            if models == current:
+                return False
+            info["models"] = models
+            node.gpu_info = info
+            node.save(update_fields=["gpu_info"])
+        logger.info("Node %s models: +%s -%s", node_id, added, sorted(removed))
+        return True
+
+    @database_sync_to_async
+    def _unfinished_jobs(self, task_ids):
+        """Return the subset of task ids whose jobs are still PENDING or RUNNING."""
+        from .models import Job  # pylint: disable=import-outside-toplevel
+        return set(
+            Job.objects.filter(id__in=task_ids, status__in=("PENDING", "RUNNING"))
+            .values_list("id", flat=True)
+        )
+
     @database_sync_to_async
     def _mark_node_inactive(self, node_id):
         """Set a node to inactive when its WebSocket disconnects."""
@@ -396,81 +619,120 @@ class GPUConsumer(AsyncWebsocketConsumer):
         logger.info("Node %s marked inactive", node_id)
 
     @database_sync_to_async
-    def _touch_node_heartbeat(self, node_id):
-        """Update node's last_heartbeat to keep it active."""
-        from .models import Node  # pylint: disable=import-outside-toplevel
+    def _record_timings(self, task_id, result):
+        """Update this node's latency averages for the job's model from a result.
+
+        Failed jobs count as a penalty run.
+        """
+        from .models import Job, Node  # pylint: disable=import-outside-toplevel
+        input_data = Job.objects.filter(id=task_id).values_list("input_data", flat=True).first()
+        model = input_data.get("model") if isinstance(input_data, dict) else None
+        node = Node.objects.filter(node_id=self.node_id).first()
+        if not (model and node):
+            return
+        if result.get("status", "failed") != "success":
+            record_failure(node, model)
+            return
         try:
-            node = Node.objects.get(node_id=node_id)
-            node.save()  # Triggers auto_now on last_heartbeat
-        except Node.DoesNotExist:
-            logger.warning("Node %s not found for heartbeat touch", node_id)
+            duration_ms = float(result["duration_ms"])
+            queue_ms = float(result.get("queue_wait_ms", 0))
+            first_token = result.get("first_token_ms")
+            first_token_ms = float(first_token) if first_token is not None else None
+        except (KeyError, TypeError, ValueError):
+            return  # older agents report no timings
+        record_result(node, model, queue_ms, duration_ms, first_token_ms)
 
     @database_sync_to_async
-    def _complete_job(self, task_id, result_data, provider_user_id):
-        """Mark a job as COMPLETED, credit provider, debit consumer."""
-        from .models import Job  # pylint: disable=import-outside-toplevel
-        from core.models import User  # pylint: disable=import-outside-toplevel
-        from payments.models import CreditLog  # pylint: disable=import-outside-toplevel
-        try:
-            job = Job.objects.get(id=task_id)
-            job.status = "COMPLETED"
-            job.result = result_data
-            job.completed_at = timezone.now()
-            job.cost = JOB_COST
-            job.save()
-
-            # Credit the provider
-            if provider_user_id:
-                try:
-                    provider = User.objects.get(id=provider_user_id)
-                    provider.wallet_balance += PROVIDER_SHARE
-                    provider.save()
-                    model_name = job.input_data.get(
-                        "model", "unknown",
-                    )
-                    CreditLog.objects.create(
-                        user=provider,
-                        amount=PROVIDER_SHARE,
-                        description=(
-                            f"Earned: Job #{task_id} completed"
-                            f" (model: {model_name})"
-                        ),
-                    )
-                    CreditLog.objects.get_or_create(
-                        user=job.user,
-                        amount=-JOB_COST,
-                        description=(
-                            f"Spent: Job #{task_id}"
-                            f" (model: {model_name})"
-                        ),
-                        defaults={"created_at": job.created_at},
-                    )
-                    logger.info(
-                        "Provider %s earned $%s for Job %s",
-                        provider.username, PROVIDER_SHARE, task_id,
-                    )
-                except User.DoesNotExist:
-                    logger.error(
-                        "Provider user %s not found", provider_user_id,
-                    )
+    def _accept_job(self, task_id):
+        """Mark a PENDING job RUNNING on this node. Returns False if another node took it.
+
+        Jobs no longer PENDING are not re-dispatched when a busy node rejects them.
+        """
+        from .models import Job, Node  # pylint: disable=import-outside-toplevel
+        node_pk = Node.objects.filter(node_id=self.node_id).values_list("pk", flat=True).first()
+        return bool(
+            Job.objects.filter(id=task_id, status="PENDING").update(status="RUNNING", node_id=node_pk)
+        )
 
-            logger.info("Job %s completed successfully", task_id)
-        except Job.DoesNotExist:
-            logger.error("Job %s not found", task_id)
+    @database_sync_to_async
+    def _complete_job(self, task_id, result_data, provider_user_id, node_id=None):
+        """Mark a job as COMPLETED and capture its hold for the provider.
+
+        The job is credited to the node that sent the result (``node_id``),
+        whichever node accepted it. Jobs coalesced onto it are completed with
+        the same result at the cached price. Returns their ids. Wallets are
+        not touched here; the settlement worker applies captured holds in
+        batches.
+        """
+        from .models import Job, Node  # pylint: disable=import-outside-toplevel
+        from payments.services import EscrowService  # pylint: disable=import-outside-toplevel
+        fields = {}
+        if node_id:
+            fields["node_id"] = (
+                Node.objects.filter(node_id=node_id).values_list("pk", flat=True).first()
+            )
+        with transaction.atomic():
+            updated = Job.objects.filter(
+                id=task_id, status__in=("PENDING", "RUNNING"),
+            ).update(
+                status="COMPLETED",
+                result=result_data,
+                completed_at=timezone.now(),
+                cost=JOB_COST,
+                **fields,
+            )
+            if not updated:
+                logger.warning("Job %s not found or already finished", task_id)
+                return []
+            input_data = (
+                Job.objects.filter(id=task_id).values_list("input_data", flat=True).first()
+            )
+            key = input_data.get("cache_key") if isinstance(input_data, dict) else None
+            if key:
+                # Opted-in jobs share their answer with identical requests
+                transaction.on_commit(
+                    lambda: get_result_cache().put(key, result_data["output"]),
+                )
+            if EscrowService.capture(task_id, provider_user_id):
+                logger.info(
+                    "Captured $%s for Job %s (provider user_id=%s)",
+                    JOB_COST, task_id, provider_user_id,
+                )
+            followers = list(
+                Job.objects.filter(leader_id=task_id, status="PENDING")
+                .values_list("id", flat=True)
+            )
+            if followers:
+                Job.objects.filter(id__in=followers).update(
+                    status="COMPLETED",
+                    result={**result_data, "coalesced": True},
+                    completed_at=timezone.now(),
+                    cost=CACHED_JOB_COST,
+                )
+                EscrowService.capture_shared(followers, CACHED_JOB_COST)
+        logger.info("Job %s completed successfully", task_id)
+        if followers:
+            logger.info("Job %s answered %d coalesced job(s)", task_id, len(followers))
+        return followers
 
     @database_sync_to_async
     def _fail_job(self, task_id, error_data):
-        """Mark a job as FAILED with error details."""
+        """Mark a job as FAILED and release its hold back to the consumer."""
         from .models import Job  # pylint: disable=import-outside-toplevel
-        try:
-            job = Job.objects.get(id=task_id)
-            job.status = "FAILED"
-            job.result = error_data
-            job.completed_at = timezone.now()
-            job.save()
-            logger.error("Job %s failed: %s", task_id, error_data)
-        except Job.DoesNotExist:
-            logger.error("Job %s not found", task_id)
+        from payments.services import EscrowService  # pylint: disable=import-outside-toplevel
+        with transaction.atomic():
+            updated = Job.objects.filter(
+                id=task_id, status__in=("PENDING", "RUNNING"),
+            ).update(
+                status="FAILED",
+                result=error_data,
+                completed_at=timezone.now(),
+            )
+            if not updated:
+                logger.warning("Job %s not found or already finished", task_id)
+                return
+            EscrowService.release(task_id)
+        logger.error("Job %s failed: %s", task_id, error_data)
 
 class DashboardConsumer(AsyncWebsocketConsumer):
     """Sends real-time dashboard updates to authenticated frontend users."""
@@ -560,7 +822,17 @@ class DashboardConsumer(AsyncWebsocketConsumer):
             data = json.loads(text_data)
             msg_type = data.get("type")
 
-            if msg_type == "subscribe_provider_stats":
+            if msg_type == "cancel_job" and self.user_id:
+                job = await self._cancel_job(data.get("job_id"), self.user_id)
+                if job:
+                    await announce_cancellation(job)
+                await self.send(json.dumps({
+                    "type": "cancel_result",
+                    "job_id": data.get("job_id"),
+                    "cancelled": job is not None,
+                }))
+
+            elif msg_type == "subscribe_provider_stats":
                 self.provider_days = int(data.get("days", 30))
                 if self.user_id:
                     stats = await self._get_provider_stats_async(
@@ -590,6 +862,13 @@ class DashboardConsumer(AsyncWebsocketConsumer):
 
         await self.send(json.dumps(msg, default=str))
 
+    @database_sync_to_async
+    def _cancel_job(self, job_id, user_id):
+        """Cancel one of the user's jobs. Returns the job, or None if it could not be."""
+        from .models import Job  # pylint: disable=import-outside-toplevel
+        job = Job.objects.filter(id=job_id, user_id=user_id).first()
+        return job if job and job.cancel() else None
+
     @database_sync_to_async
     def _get_user_from_token(self, token):
         """Validate a JWT access token and return the user, or None."""
@@ -604,10 +883,11 @@ class DashboardConsumer(AsyncWebsocketConsumer):
 
     @database_sync_to_async
     def _get_balance(self, user_id):
-        """Return the wallet balance for the given user."""
+        """Return the available (unreserved) balance for the given user."""
         from core.models import User  # pylint: disable=import-outside-toplevel
+        from payments.services import EscrowService  # pylint: disable=import-outside-toplevel
         try:
-            return User.objects.get(id=user_id).wallet_balance
+            return EscrowService.available_balance(User.objects.get(id=user_id))
         except Exception:  # pylint: disable=broad-except
             return Decimal("0.00")
 
@@ -646,13 +926,12 @@ class DashboardConsumer(AsyncWebsocketConsumer):
     @database_sync_to_async
     def _get_stats(self):
         """Return network stats for the dashboard."""
-        from .models import Node, Job  # pylint: disable=import-outside-toplevel
-        _cleanup_stale_nodes()
-        active_nodes = Node.objects.filter(is_active=True).count()
+        from .models import Job  # pylint: disable=import-outside-toplevel
+        active_count = active_nodes().count()
         completed_jobs = Job.objects.filter(status="COMPLETED").count()
         available = self._get_models_sync()
         return {
-            "active_nodes": active_nodes,
+            "active_nodes": active_count,
             "completed_jobs": completed_jobs,
             "available_models": len(available)
         }
@@ -660,13 +939,11 @@ class DashboardConsumer(AsyncWebsocketConsumer):
     @database_sync_to_async
     def _get_models(self):
         """Return available models aggregated from active nodes."""
-        _cleanup_stale_nodes()
         return self._get_models_sync()
 
     def _get_models_sync(self):
         """Synchronous helper: aggregate model counts from active nodes."""
-        from .models import Node  # pylint: disable=import-outside-toplevel
-        nodes = Node.objects.filter(is_active=True)
+        nodes = active_nodes()
         model_counts = {}
         for node in nodes:
             info = node.gpu_info or {}
@@ -0,0 +1,181 @@
+"""Sending jobs to GPU nodes over the channel layer."""
+import asyncio
+import logging
+import re
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+GPU_NODES_GROUP = "gpu_nodes"
+
+# Seconds to wait before re-offering a job a busy node rejected
+REDISPATCH_DELAY = 5
+# Upper bound on an agent-supplied retry_after
+MAX_REDISPATCH_DELAY = 60
+
+# Jobs with a re-dispatch already scheduled in this process
+_scheduled = set()
+
+
+def node_group(node_id):
+    """Channel-layer group joined by every connection of one node, draining or not."""
+    return "node_" + re.sub(r"[^A-Za-z0-9_.-]", "_", str(node_id))[:90]
+
+
+def job_payload(job):
+    """The job_data sent to agents for a Job."""
+    input_data = job.input_data if isinstance(job.input_data, dict) else {}
+    payload = {
+        "task_id": job.id,
+        "owner_id": job.user_id,
+        "model": input_data.get("model", ""),
+        "prompt": input_data.get("prompt", ""),
+    }
+    if input_data.get("options"):
+        payload["options"] = input_data["options"]
+    return payload
+
+
+async def dispatch_job(job_data):
+    """Offer a job to every connected GPU node, or to one under hedged dispatch."""
+    if settings.HEDGE_ENABLED:
+        from .hedging import offer  # pylint: disable=import-outside-toplevel
+        if await offer(job_data):
+            return
+    await get_channel_layer().group_send(
+        GPU_NODES_GROUP,
+        {"type": "job_dispatch", "job_data": job_data},
+    )
+
+
+async def announce_cancellation(job):
+    """Tell GPU nodes to abort a cancelled job and update the owner's dashboard.
+
+    Dispatch is a broadcast, so every node is told; nodes without the job ignore it.
+    The node running it is also told directly: a draining node has left the
+    broadcast group but still runs its jobs.
+    """
+    layer = get_channel_layer()
+    await layer.group_send(GPU_NODES_GROUP, {"type": "job_cancel", "task_id": job.id})
+    node_id = await _node_id_of(job)
+    if node_id:
+        await layer.group_send(node_group(node_id), {
+            "type": "job_cancel", "task_id": job.id, "direct": True,
+        })
+    await hand_over_followers(job.id)
+    input_data = job.input_data if isinstance(job.input_data, dict) else {}
+    await layer.group_send(f"user_{job.user_id}", {
+        "type": "dashboard_update",
+        "data": {
+            "type": "job_update",
+            "job": {
+                "id": job.id,
+                "status": job.status,
+                "prompt": input_data.get("prompt", ""),
+                "model": input_data.get("model", ""),
+                "cost": str(job.cost) if job.cost else None,
+                "result": job.result,
+                "created_at": str(job.created_at),
+                "completed_at": str(job.completed_at),
+            },
+        },
+    })
+
+
+@database_sync_to_async
+def _node_id_of(job):
+    from .models import Node  # pylint: disable=import-outside-toplevel
+    if job.node_id is None:
+        return None
+    return Node.objects.filter(pk=job.node_id).values_list("node_id", flat=True).first()
+
+
+@database_sync_to_async
+def _pending_payload(job_id, node_id):
+    from .models import Job  # pylint: disable=import-outside-toplevel
+    if node_id:
+        Job.objects.filter(id=job_id, status="RUNNING", node__node_id=node_id).update(
+            status="PENDING", node=None,
+        )
+    job = Job.objects.filter(id=job_id, status="PENDING").first()
+    return job_payload(job) if job else None
+
+
+async def redispatch_pending(job_id, node_id=None):
+    """Offer a job to the network again if it is still PENDING. Returns True if sent.
+
+    With ``node_id``, a job that node accepted but will not finish is released
+    back to PENDING first.
+    """
+    payload = await _pending_payload(job_id, node_id)
+    if payload:
+        await dispatch_job(payload)
+    return payload is not None
+
+
+@database_sync_to_async
+def _promote_follower(job_id):
+    from .models import Job  # pylint: disable=import-outside-toplevel
+    return Job.promote_follower(job_id)
+
+
+async def hand_over_followers(job_id):
+    """Dispatch the oldest follower of a job that will not produce a result.
+
+    The other followers now wait on it. Returns the promoted job id, or None.
+    """
+    successor = await _promote_follower(job_id)
+    if successor:
+        await redispatch_pending(successor)
+        logger.info("Job %s took over the followers of Job %s", successor, job_id)
+    return successor
+
+
+def hand_over_followers_of(job_ids):
+    """Hand over the waiting followers of jobs that just failed, from sync code.
+
+    Returns the number of leaders whose followers got a new run.
+    """
+    from .models import Job  # pylint: disable=import-outside-toplevel
+    leaders = set(
+        Job.objects.filter(leader_id__in=job_ids, status="PENDING")
+        .values_list("leader_id", flat=True)
+    )
+    for leader_id in leaders:
+        async_to_sync(hand_over_followers)(leader_id)
+    return len(leaders)
+
+
+async def _redispatch(job_id, delay, node_id):
+    try:
+        await asyncio.sleep(delay)
+        if await redispatch_pending(job_id, node_id=node_id):
+            logger.info("Re-dispatched Job %s after rejection", job_id)
+    finally:
+        _scheduled.discard(job_id)
+
+
+async def redispatch_scheduled():
+    """Re-offer every job waiting on a scheduled re-dispatch now (this process is going away)."""
+    for job_id in list(_scheduled):
+        await redispatch_pending(job_id)
+
+
+def schedule_redispatch(job_id, delay=REDISPATCH_DELAY, node_id=None):
+    """Re-offer a still-PENDING job after ``delay`` seconds.
+
+    A job another node accepted in the meantime is RUNNING and is left alone;
+    one assigned to ``node_id`` (the node that rejected it) is released first.
+
+    Returns False if a re-dispatch for the job is already scheduled.
+    """
+    if job_id in _scheduled:
+        return False
+    _scheduled.add(job_id)
+    delay = min(max(delay, 0), MAX_REDISPATCH_DELAY)
+    asyncio.ensure_future(_redispatch(job_id, delay, node_id))
+    return True
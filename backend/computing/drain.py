@@ -0,0 +1,67 @@
+"""Draining GPU nodes and server processes.
+
+A node drain is asked for by the agent (``drain``): the node leaves
+dispatch and presence but keeps its socket until its in-flight jobs have
+reported back.
+
+A server drain is for rolling deploys. It is started by SIGUSR1 to the ASGI
+process, or by ``drain_server()``. The process stops admitting
+registrations and asks the nodes connected to it to reconnect, a few at a
+time, so the load balancer moves them to the remaining processes. Nodes that
+negotiated ``resume`` take their in-flight jobs with them. Jobs this process
+was holding back for a re-dispatch are offered to the network at once.
+"""
+import asyncio
+import logging
+import signal
+import weakref
+
+from .dispatch import redispatch_scheduled
+from .keepalive import get_keepalive_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Seconds over which a draining server hands its nodes off
+DRAIN_SPREAD = 10
+
+# retry_after hint sent to nodes asked to reconnect elsewhere
+DRAIN_RETRY_AFTER = 1
+
+_draining = False  # pylint: disable=invalid-name
+_handled_loops = weakref.WeakSet()
+
+
+def is_draining():
+    """Whether this process is draining and refuses new registrations."""
+    return _draining
+
+
+async def drain_server(spread=DRAIN_SPREAD):
+    """Stop admitting nodes and hand every connected node off to other processes."""
+    global _draining  # pylint: disable=global-statement
+    if _draining:
+        return
+    _draining = True
+    await redispatch_scheduled()
+    consumers = [c for c in get_keepalive_scheduler().connections() if c.node_id != "unknown"]
+    logger.warning("Draining: handing off %d node(s) over %ss", len(consumers), spread)
+    step = spread / max(1, len(consumers))
+    for consumer in consumers:
+        try:
+            await consumer.hand_off(DRAIN_RETRY_AFTER)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("Hand-off of node %s failed: %s", consumer.node_id, e)
+        await asyncio.sleep(step)
+
+
+def install_drain_handler():
+    """Start a server drain on SIGUSR1 (once per event loop, where signals are supported)."""
+    loop = asyncio.get_running_loop()
+    if loop in _handled_loops:
+        return
+    _handled_loops.add(loop)
+    try:
+        loop.add_signal_handler(signal.SIGUSR1, lambda: asyncio.ensure_future(drain_server()))
+    except (AttributeError, NotImplementedError, RuntimeError, ValueError):
+        # No SIGUSR1 on Windows; signals need the main thread
+        logger.debug("Server drain signal handler not installed")
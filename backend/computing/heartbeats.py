@@ -0,0 +1,71 @@
+"""Per-process buffer that batches node heartbeats into one presence refresh per interval.
+
+The same periodic task marks nodes inactive once they drop out of presence,
+so request paths such as the dashboard stats stay read-only.
+"""
+import asyncio
+import logging
+import threading
+import weakref
+
+from asgiref.sync import sync_to_async
+
+from .presence import deactivate_absent_nodes, get_presence
+
+logger = logging.getLogger(__name__)
+
+# Seconds between heartbeat flushes; must stay well under PRESENCE_TTL
+HEARTBEAT_FLUSH_INTERVAL = 15
+
+
+class HeartbeatBuffer:
+    """Collects the nodes seen since the last flush."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def record(self, node_id, channel_name):
+        """Note that a node is alive; its presence is refreshed at the next flush."""
+        with self._lock:
+            self._pending[node_id] = channel_name
+
+    def discard(self, node_id):
+        """Forget a pending heartbeat (e.g. the node disconnected)."""
+        with self._lock:
+            self._pending.pop(node_id, None)
+
+    def flush(self):
+        """Refresh presence for all pending nodes. Returns the number of nodes touched."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            get_presence().touch(pending)
+        return len(pending)
+
+
+heartbeat_buffer = HeartbeatBuffer()
+
+_flusher_tasks = weakref.WeakKeyDictionary()
+
+
+async def _flush_forever(interval):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            count = await sync_to_async(heartbeat_buffer.flush)()
+            if count:
+                logger.debug("Flushed heartbeats for %d node(s)", count)
+            deactivated = await sync_to_async(deactivate_absent_nodes)()
+            if deactivated:
+                logger.info("Marked %d node(s) inactive (presence expired)", deactivated)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("Heartbeat flush failed: %s", e)
+
+
+def ensure_heartbeat_flusher(interval=HEARTBEAT_FLUSH_INTERVAL):
+    """Start the flusher task on the running event loop if it is not running."""
+    loop = asyncio.get_running_loop()
+    task = _flusher_tasks.get(loop)
+    if task is None or task.done():
+        _flusher_tasks[loop] = loop.create_task(_flush_forever(interval))
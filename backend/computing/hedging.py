@@ -0,0 +1,312 @@
+"""Hedged dispatch: offer a job to one node, and to a second if it is slow.
+
+Dispatch is normally a broadcast. With HEDGE_ENABLED a job is offered to a
+single eligible node instead (present, serving the job's model and not owned
+by the job's owner), the one expected to finish it soonest. If no result has arrived once the model's
+HEDGE_PERCENTILE completion latency has passed, a duplicate goes to a second
+eligible node. The first successful result wins and the other node is told to
+cancel; a failure from one attempt waits for the other's result. A node is
+scored as slow when its hedge beats it, or when it has not taken the job by
+the deadline and no hedge was sent.
+
+Duplicates are paid from a budget: each first offer earns HEDGE_BUDGET of a
+hedge, so hedges stay under that fraction of runs. Jobs whose id falls in
+the HEDGE_HOLDOUT_PERCENT holdout are never hedged; ``stats()`` compares
+their p99 latency with everyone else's to show what hedging buys. A job that
+is not hedged is still re-offered at the deadline if no present node has
+accepted it, and a node that disconnects re-dispatches the jobs offered to it.
+"""
+import asyncio
+import logging
+import math
+import time
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .dispatch import GPU_NODES_GROUP, redispatch_pending
+from .presence import get_presence
+from .scoring import choose_node, record_failure
+
+logger = logging.getLogger(__name__)
+
+# Recent completed jobs of a model used to estimate its latency percentile
+LATENCY_SAMPLE_SIZE = 200
+# With fewer samples than this, HEDGE_DEFAULT_DELAY is used instead
+LATENCY_MIN_SAMPLES = 20
+# Seconds a model's hedge delay is reused before it is recomputed
+LATENCY_CACHE_TTL = 60
+# Seconds to wait before hedging a model with too little history
+HEDGE_DEFAULT_DELAY = 30
+# Bounds on the hedge delay, whatever the history says
+HEDGE_MIN_DELAY = 1
+HEDGE_MAX_DELAY = 300
+# Hedges a burst of slow jobs may spend from saved-up budget
+HEDGE_BURST = 10
+# Completed jobs compared by stats()
+STATS_WINDOW = 2000
+
+# job id -> nodes offered the job, while its hedge timer runs in this process
+_attempts = {}
+# model -> (hedge delay, monotonic time computed)
+_delays = {}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty sequence."""
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def is_holdout(job_id):
+    """Whether a job belongs to the holdout that is never hedged."""
+    return job_id % 100 < settings.HEDGE_HOLDOUT_PERCENT
+
+
+class HedgeBudget:
+    """Hedges earned by dispatches; one per process, used on the event loop."""
+
+    def __init__(self, ratio, burst=HEDGE_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = 0.0
+
+    def earn(self):
+        """Credit one first offer's share of a hedge."""
+        self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def spend(self):
+        """Take one hedge from the budget. Returns False if it is spent."""
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def refund(self):
+        """Return a hedge that found no node to run on."""
+        self._tokens = min(self.burst, self._tokens + 1)
+
+
+_budget = None  # pylint: disable=invalid-name
+
+
+def get_hedge_budget():
+    """Return the process-wide hedge budget."""
+    global _budget  # pylint: disable=global-statement
+    if _budget is None:
+        _budget = HedgeBudget(settings.HEDGE_BUDGET)
+    return _budget
+
+
+@database_sync_to_async
+def _choose_node(model, owner_id, exclude):
+    """Return (node_id, channel_name) of the best node that can run the job, or None."""
+    chosen = choose_node(model, owner_id, exclude)
+    return (chosen[0].node_id, chosen[1]) if chosen else None
+
+
+@database_sync_to_async
+def hedge_delay(model):
+    """Seconds to wait for a result before hedging a job for ``model``."""
+    from .models import Job  # pylint: disable=import-outside-toplevel
+    now = time.monotonic()
+    cached = _delays.get(model)
+    if cached and now - cached[1] < LATENCY_CACHE_TTL:
+        return cached[0]
+    rows = (
+        Job.objects.filter(status="COMPLETED", leader__isnull=True, input_data__model=model)
+        .exclude(result__cached=True)
+        .order_by("-completed_at")
+        .values_list("created_at", "completed_at")[:LATENCY_SAMPLE_SIZE]
+    )
+    samples = [(done - created).total_seconds() for created, done in rows if done]
+    if len(samples) < LATENCY_MIN_SAMPLES:
+        delay = HEDGE_DEFAULT_DELAY
+    else:
+        delay = min(max(percentile(samples, settings.HEDGE_PERCENTILE), HEDGE_MIN_DELAY),
+                    HEDGE_MAX_DELAY)
+    _delays[model] = (delay, now)
+    return delay
+
+
+async def offer(job_data):
+    """Send a job to one eligible node it has not been offered yet.
+
+    The first offer starts the job's hedge timer. Returns False if no node
+    is eligible; the caller should broadcast instead.
+    """
+    job_id = job_data["task_id"]
+    model = job_data.get("model", "")
+    chosen = await _choose_node(model, job_data.get("owner_id"), _attempts.get(job_id, ()))
+    if chosen is None:
+        return False
+    node_id, channel_name = chosen
+    await get_channel_layer().send(
+        channel_name, {"type": "job_dispatch", "job_data": job_data, "targeted": True},
+    )
+    if job_id in _attempts:
+        _attempts[job_id].append(node_id)
+    else:
+        _attempts[job_id] = [node_id]
+        get_hedge_budget().earn()
+        asyncio.ensure_future(_hedge_after(job_data, await hedge_delay(model)))
+    return True
+
+
+@database_sync_to_async
+def _unfinished(job_id):
+    from .models import Job  # pylint: disable=import-outside-toplevel
+    return Job.objects.filter(id=job_id, status__in=("PENDING", "RUNNING")).exists()
+
+
+@database_sync_to_async
+def _release_if_stranded(job_id):
+    """Whether nobody is running a job: it is PENDING, or its node has left.
+
+    A RUNNING job whose node is gone is put back to PENDING.
+    """
+    from .models import Job  # pylint: disable=import-outside-toplevel
+    job = Job.objects.filter(id=job_id).select_related("node").first()
+    if job is None or job.status not in ("PENDING", "RUNNING"):
+        return False
+    if job.status == "RUNNING" and job.node and job.node.node_id in get_presence().alive():
+        return False
+    Job.objects.filter(id=job_id, status="RUNNING").update(status="PENDING", node=None)
+    return True
+
+
+@database_sync_to_async
+def _record_timeout(node_id, model):
+    """Count a job nobody took by its deadline against the node it was offered to."""
+    from .models import Node  # pylint: disable=import-outside-toplevel
+    node = Node.objects.filter(node_id=node_id).first()
+    if node and model:
+        record_failure(node, model)
+
+
+@database_sync_to_async
+def _mark_hedged(job_id):
+    from .models import Job  # pylint: disable=import-outside-toplevel
+    Job.objects.filter(id=job_id).update(hedged_at=timezone.now())
+
+
+async def _hedge_after(job_data, delay):
+    job_id = job_data["task_id"]
+    try:
+        await asyncio.sleep(delay)
+        if not await _unfinished(job_id):
+            return
+        budget = get_hedge_budget()
+        if not is_holdout(job_id) and budget.spend():
+            if await offer(job_data):
+                await _mark_hedged(job_id)
+                logger.info("Hedged Job %s on a second node after %.1fs", job_id, delay)
+                return
+            budget.refund()
+        # Unhedged jobs still get the fault tolerance a broadcast had
+        if await _release_if_stranded(job_id):
+            await _record_timeout(_attempts[job_id][0], job_data.get("model", ""))
+            if await redispatch_pending(job_id):
+                logger.info("Re-offered Job %s that no node took within %.1fs", job_id, delay)
+    finally:
+        _attempts.pop(job_id, None)
+
+
+@database_sync_to_async
+def _was_hedged(job_id):
+    from .models import Job  # pylint: disable=import-outside-toplevel
+    return Job.objects.filter(id=job_id, hedged_at__isnull=False).exists()
+
+
+@database_sync_to_async
+def _hold_failure(job_id, node_id, error_data):
+    from .models import Job  # pylint: disable=import-outside-toplevel
+    with transaction.atomic():
+        job = (
+            Job.objects.select_for_update()
+            .filter(id=job_id, status__in=("PENDING", "RUNNING"), hedged_at__isnull=False)
+            .first()
+        )
+        if job is None:
+            return False
+        held = job.result.get("failed_attempt") if isinstance(job.result, dict) else None
+        if held:
+            # A replay of the same failure keeps waiting; a second node's ends the job
+            return held.get("node") == node_id
+        job.result = {"failed_attempt": {"node": node_id, **error_data}}
+        job.save(update_fields=["result"])
+        return True
+
+
+async def hold_failure(job_id, node_id, error_data):
+    """Whether a failed result can wait for the other attempt of a hedged job.
+
+    The first failure of a hedged job is noted on the job and the job stays
+    unfinished; the caller fails it only when this returns False (not hedged,
+    or the other attempt already failed too).
+    """
+    return settings.HEDGE_ENABLED and await _hold_failure(job_id, node_id, error_data)
+
+
+@database_sync_to_async
+def _record_loser(job_id, winner_node_id):
+    from .models import Job  # pylint: disable=import-outside-toplevel
+    job = (
+        Job.objects.filter(id=job_id, status__in=("PENDING", "RUNNING"), hedged_at__isnull=False)
+        .select_related("node").first()
+    )
+    model = job.input_data.get("model") if job and isinstance(job.input_data, dict) else None
+    if model and job.node and job.node.node_id != winner_node_id:
+        record_failure(job.node, model)
+
+
+async def record_loser(job_id, winner_node_id):
+    """Score the node that accepted a hedged job as slow if another node finishes it.
+
+    Call before the winning result completes the job.
+    """
+    if settings.HEDGE_ENABLED:
+        await _record_loser(job_id, winner_node_id)
+
+
+async def cancel_losers(job_id):
+    """Tell the nodes of a finished hedged job to stop running it."""
+    if settings.HEDGE_ENABLED and await _was_hedged(job_id):
+        await get_channel_layer().group_send(
+            GPU_NODES_GROUP, {"type": "job_cancel", "task_id": job_id},
+        )
+
+
+def stats():
+    """Hedges sent and p99 latency against the holdout, over recent completed jobs."""
+    from .models import Job  # pylint: disable=import-outside-toplevel
+    if not settings.HEDGE_ENABLED:
+        return {"enabled": False}
+    rows = (
+        Job.objects.filter(status="COMPLETED", leader__isnull=True)
+        .exclude(result__cached=True)
+        .order_by("-completed_at")
+        .values_list("id", "created_at", "completed_at", "hedged_at")[:STATS_WINDOW]
+    )
+    hedged, policy_ms, holdout_ms = 0, [], []
+    for job_id, created, done, hedged_at in rows:
+        if done is None:
+            continue
+        latency_ms = int((done - created).total_seconds() * 1000)
+        (holdout_ms if is_holdout(job_id) else policy_ms).append(latency_ms)
+        hedged += hedged_at is not None
+    p99 = percentile(policy_ms, 99) if policy_ms else None
+    holdout_p99 = percentile(holdout_ms, 99) if holdout_ms else None
+    return {
+        "enabled": True,
+        "hedged_jobs": hedged,
+        "p99_ms": p99,
+        "holdout_p99_ms": holdout_p99,
+        "p99_improvement_ms": (
+            holdout_p99 - p99 if p99 is not None and holdout_p99 is not None else None
+        ),
+    }
@@ -0,0 +1,125 @@
+"""Process-wide keep-alive scheduler for GPU node connections.
+
+Connections are spread round-robin over KEEPALIVE_BUCKETS buckets and one
+task per event loop visits a bucket every KEEPALIVE_INTERVAL / KEEPALIVE_BUCKETS
+seconds, so each connection is pinged once per interval while the work is
+spread evenly instead of every connection waking on its own timer.
+
+Token revocation is pushed to the connection (see ``token_revoked``), so ticks
+never query tokens; they only collect the ids in use and bump
+``AgentToken.last_used`` in one UPDATE per LAST_USED_RESOLUTION.
+"""
+import asyncio
+import json
+import logging
+import time
+import weakref
+
+from channels.db import database_sync_to_async
+
+from core.models import LAST_USED_RESOLUTION
+
+from .heartbeats import heartbeat_buffer
+
+logger = logging.getLogger(__name__)
+
+# Seconds between pings for any one connection
+KEEPALIVE_INTERVAL = 15
+
+# Buckets the connections are spread over; one bucket is handled per tick
+KEEPALIVE_BUCKETS = 15
+
+_PING_FRAME = json.dumps({"type": "ping"}, ensure_ascii=False)
+
+
+class KeepAliveScheduler:
+    """Pings, heartbeats and token last_used bumps for every connection on one loop."""
+
+    def __init__(self, interval=KEEPALIVE_INTERVAL, buckets=KEEPALIVE_BUCKETS):
+        self.interval = interval
+        self._buckets = [set() for _ in range(buckets)]
+        self._slots = {}
+        self._next_slot = 0
+        self._position = 0
+        self._task = None
+        self._used_token_ids = set()
+        self._last_used_flushed = time.monotonic()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def add(self, consumer):
+        """Schedule a connection, starting the tick task if needed."""
+        slot = self._next_slot
+        self._next_slot = (self._next_slot + 1) % len(self._buckets)
+        self._slots[consumer] = slot
+        self._buckets[slot].add(consumer)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def remove(self, consumer):
+        """Stop scheduling a connection."""
+        slot = self._slots.pop(consumer, None)
+        if slot is not None:
+            self._buckets[slot].discard(consumer)
+
+    def connections(self):
+        """Every connection currently scheduled."""
+        return list(self._slots)
+
+    async def _run(self):
+        tick = self.interval / len(self._buckets)
+        while True:
+            await asyncio.sleep(tick)
+            bucket = list(self._buckets[self._position])
+            self._position = (self._position + 1) % len(self._buckets)
+            if bucket:
+                try:
+                    await self.tick(bucket)
+                except Exception as e:  # pylint: disable=broad-except
+                    logger.error("Keep-alive tick failed: %s", e)
+
+    async def tick(self, consumers):
+        """Heartbeat and ping one bucket of connections."""
+        registered = [c for c in consumers if c.node_id != "unknown"]
+        for consumer in registered:
+            # Draining nodes stay connected but out of presence
+            if not consumer.draining:
+                heartbeat_buffer.record(consumer.node_id, consumer.channel_name)
+            if consumer.agent_token_id:
+                self._used_token_ids.add(consumer.agent_token_id)
+
+        now = time.monotonic()
+        if now - self._last_used_flushed >= LAST_USED_RESOLUTION.total_seconds():
+            token_ids, self._used_token_ids = self._used_token_ids, set()
+            self._last_used_flushed = now
+            if token_ids:
+                await _mark_tokens_used(token_ids)
+
+        await asyncio.gather(
+            *(consumer.send(_PING_FRAME) for consumer in consumers),
+            return_exceptions=True,
+        )
+
+
+@database_sync_to_async
+def _mark_tokens_used(token_ids):
+    """Coarse last_used bump for tokens held by connected agents.
+
+    Connected agents keep using their token without re-validating it, so this
+    stands in for the bump AgentToken.validate applies.
+    """
+    from core.models import AgentToken  # pylint: disable=import-outside-toplevel
+    AgentToken.mark_used(token_ids)
+
+
+_schedulers = weakref.WeakKeyDictionary()
+
+
+def get_keepalive_scheduler():
+    """Return the scheduler for the running event loop."""
+    loop = asyncio.get_running_loop()
+    scheduler = _schedulers.get(loop)
+    if scheduler is None:
+        scheduler = _schedulers[loop] = KeepAliveScheduler()
+    return scheduler
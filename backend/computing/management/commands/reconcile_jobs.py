@@ -0,0 +1,32 @@
+"""Fail or re-offer unfinished jobs left behind by a backend restart."""
+from django.core.management.base import BaseCommand
+
+from computing.tasks import JOB_LEASE, PENDING_LEASE, RECONCILE_BATCH_SIZE, reconcile_jobs
+
+
+class Command(BaseCommand):
+    """Safe to run at any time: jobs a live node may still be running are left alone.
+
+    Re-offered jobs reach nodes only through a shared channel layer, so
+    without REDIS_URL run it inside the web process (see StartupReconcile).
+    """
+    help = "Re-offer orphaned PENDING/RUNNING jobs and fail expired ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lease", type=float, default=JOB_LEASE.total_seconds(),
+            help="Leave RUNNING jobs younger than this many seconds alone.",
+        )
+        parser.add_argument(
+            "--pending-lease", type=float, default=PENDING_LEASE.total_seconds(),
+            help="Leave PENDING jobs younger than this many seconds alone.",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=RECONCILE_BATCH_SIZE,
+            help="Jobs re-offered per query.",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(reconcile_jobs(
+            options["lease"], options["batch_size"], options["pending_lease"],
+        ))
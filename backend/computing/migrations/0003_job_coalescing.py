@@ -0,0 +1,30 @@
+# Generated by Django 6.0.2 on 2026-10-19 09:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("computing", "0002_job_cancelled_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="coalesce_key",
+            field=models.CharField(blank=True, db_index=True, default="", max_length=64),
+        ),
+        migrations.AddField(
+            model_name="job",
+            name="leader",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="followers",
+                to="computing.job",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-19 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("computing", "0003_job_coalescing"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="hedged_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
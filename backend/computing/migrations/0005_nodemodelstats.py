@@ -0,0 +1,39 @@
+# Generated by Django 6.0.2 on 2026-10-19 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("computing", "0004_job_hedged_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NodeModelStats",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("model", models.CharField(max_length=200)),
+                ("queue_ms", models.FloatField(default=0)),
+                ("first_token_ms", models.FloatField(blank=True, null=True)),
+                ("duration_ms", models.FloatField(default=0)),
+                ("samples", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "node",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="model_stats",
+                        to="computing.node",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(fields=("node", "model"), name="unique_node_model_stats"),
+                ],
+            },
+        ),
+    ]
@@ -1,6 +1,7 @@
 """Models for the computing module — GPU nodes and inference jobs."""
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 
 
 class Node(models.Model):
@@ -15,6 +16,30 @@ class Node(models.Model):
     def __str__(self):
         return f"{self.name} ({self.node_id})"
 
+class NodeModelStats(models.Model):
+    """Moving averages of how quickly a node serves one model."""
+    node = models.ForeignKey(Node, related_name='model_stats', on_delete=models.CASCADE)
+    model = models.CharField(max_length=200)
+    queue_ms = models.FloatField(default=0)
+    first_token_ms = models.FloatField(null=True, blank=True)
+    duration_ms = models.FloatField(default=0)
+    samples = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        """One row per (node, model); the dispatcher reads a model's rows together."""
+        constraints = [
+            models.UniqueConstraint(fields=['node', 'model'], name='unique_node_model_stats'),
+        ]
+
+    def __str__(self):
+        return f"{self.node_id} / {self.model}: {self.expected_ms:.0f} ms"
+
+    @property
+    def expected_ms(self):
+        """Expected milliseconds from dispatch to result."""
+        return self.queue_ms + self.duration_ms
+
 class Job(models.Model):
     """An inference or training job submitted by a consumer."""
     STATUS_CHOICES = (
@@ -22,6 +47,7 @@ class Job(models.Model):
         ('RUNNING', 'Running'),
         ('COMPLETED', 'Completed'),
         ('FAILED', 'Failed'),
+        ('CANCELLED', 'Cancelled'),
     )
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, related_name='jobs',
@@ -40,6 +66,61 @@ class Job(models.Model):
     completed_at = models.DateTimeField(null=True, blank=True)
     result = models.JSONField(null=True, blank=True)
     cost = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    # Hash of (model, prompt, options); identical in-flight jobs share one run
+    coalesce_key = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    leader = models.ForeignKey(
+        'self', related_name='followers',
+        on_delete=models.SET_NULL, null=True, blank=True,
+    )
+    # Set when hedged dispatch offered the job to a second node
+    hedged_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"Job {self.id} - {self.status}"
+
+    @classmethod
+    def in_flight_leader(cls, key):
+        """Return the unfinished job whose run new jobs with ``key`` can follow, if any."""
+        return cls.objects.select_for_update().filter(
+            coalesce_key=key, leader__isnull=True, status__in=("PENDING", "RUNNING"),
+        ).order_by("id").first()
+
+    @classmethod
+    def promote_follower(cls, job_id):
+        """Hand the followers of a job that produced no result to the oldest of them.
+
+        The promoted job stops following and must be dispatched by the caller.
+        Returns its id, or None if no follower was waiting.
+        """
+        with transaction.atomic():
+            waiting = list(
+                cls.objects.select_for_update()
+                .filter(leader_id=job_id, status="PENDING")
+                .order_by("id").values_list("id", flat=True)
+            )
+            if not waiting:
+                return None
+            successor = waiting[0]
+            cls.objects.filter(id=successor).update(leader=None)
+            cls.objects.filter(id__in=waiting[1:]).update(leader_id=successor)
+        return successor
+
+    def cancel(self):
+        """Cancel the job if it is unfinished and release its hold.
+
+        Returns False if the job had already finished.
+        """
+        from payments.services import EscrowService  # pylint: disable=import-outside-toplevel
+        with transaction.atomic():
+            updated = Job.objects.filter(
+                id=self.id, status__in=("PENDING", "RUNNING"),
+            ).update(
+                status="CANCELLED",
+                result={"error": "Cancelled by user"},
+                completed_at=timezone.now(),
+            )
+            if not updated:
+                return False
+            EscrowService.release(self.id)
+        self.refresh_from_db()
+        return True
@@ -0,0 +1,122 @@
+"""Node presence: which nodes are connected right now.
+
+Each live node has a key that expires PRESENCE_TTL seconds after its last
+heartbeat, holding the channel name of the consumer serving it. Liveness
+reads come from here; the DB ``Node.is_active`` flag only changes on real
+connect and disconnect transitions.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+# A node whose presence has not been refreshed for this long is offline
+PRESENCE_TTL = 45
+
+_KEY_PREFIX = "presence:node:"
+_INDEX_KEY = "presence:nodes"
+
+
+class MemoryPresence:
+    """In-process presence, suitable for single-process deployments."""
+
+    def __init__(self, ttl=PRESENCE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def touch(self, entries):
+        """Mark nodes alive for another ttl seconds; ``entries`` maps node_id -> channel name."""
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for node_id, channel_name in entries.items():
+                self._entries[node_id] = (channel_name, expires_at)
+
+    def remove(self, node_id):
+        """Forget a node immediately (it disconnected)."""
+        with self._lock:
+            self._entries.pop(node_id, None)
+
+    def alive(self):
+        """Return {node_id: channel_name} for every node that has not expired."""
+        now = time.monotonic()
+        with self._lock:
+            for node_id in [n for n, (_, exp) in self._entries.items() if exp < now]:
+                del self._entries[node_id]
+            return {node_id: channel for node_id, (channel, _) in self._entries.items()}
+
+
+class RedisPresence:
+    """TTL keys in the channel-layer Redis, shared by every ASGI worker."""
+
+    def __init__(self, url, ttl=PRESENCE_TTL):
+        import redis  # pylint: disable=import-outside-toplevel
+        self.ttl = ttl
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+
+    def touch(self, entries):
+        """Mark nodes alive for another ttl seconds; ``entries`` maps node_id -> channel name."""
+        if not entries:
+            return
+        pipe = self._redis.pipeline(transaction=False)
+        for node_id, channel_name in entries.items():
+            pipe.set(_KEY_PREFIX + node_id, channel_name, ex=self.ttl)
+        pipe.sadd(_INDEX_KEY, *entries)
+        pipe.execute()
+
+    def remove(self, node_id):
+        """Forget a node immediately (it disconnected)."""
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.delete(_KEY_PREFIX + node_id)
+        pipe.srem(_INDEX_KEY, node_id)
+        pipe.execute()
+
+    def alive(self):
+        """Return {node_id: channel_name} for every node whose key has not expired."""
+        node_ids = list(self._redis.smembers(_INDEX_KEY))
+        if not node_ids:
+            return {}
+        channels = self._redis.mget([_KEY_PREFIX + n for n in node_ids])
+        expired = [n for n, channel in zip(node_ids, channels) if channel is None]
+        if expired:
+            self._redis.srem(_INDEX_KEY, *expired)
+        return {
+            node_id: channel
+            for node_id, channel in zip(node_ids, channels) if channel is not None
+        }
+
+
+_presence = None  # pylint: disable=invalid-name
+
+
+def get_presence():
+    """Return the process-wide presence store (Redis when REDIS_URL is set)."""
+    global _presence  # pylint: disable=global-statement
+    if _presence is None:
+        if settings.REDIS_URL:
+            _presence = RedisPresence(settings.REDIS_URL)
+        else:
+            _presence = MemoryPresence()
+    return _presence
+
+
+def deactivate_absent_nodes():
+    """Mark nodes inactive that dropped out of presence without disconnecting.
+
+    Returns the number of nodes changed.
+    """
+    from .models import Node  # pylint: disable=import-outside-toplevel
+    alive = get_presence().alive()
+    absent = [
+        pk for pk, node_id in Node.objects.filter(is_active=True).values_list("pk", "node_id")
+        if node_id not in alive
+    ]
+    if not absent:
+        return 0
+    return Node.objects.filter(pk__in=absent, is_active=True).update(is_active=False)
+
+
+def active_nodes():
+    """Queryset of connected nodes, filtered by presence."""
+    from .models import Node  # pylint: disable=import-outside-toplevel
+    return Node.objects.filter(is_active=True, node_id__in=list(get_presence().alive()))
@@ -0,0 +1,103 @@
+"""Wire encodings for the agent WebSocket protocol.
+
+Text frames are always JSON, whatever was negotiated, so pings and errors
+need no encoding state. Binary frames carry the negotiated encoding:
+
+* ``json``    -- no binary frames (the fallback, and what old agents get)
+* ``zlib``    -- messages over COMPRESS_MIN_BYTES are zlib-compressed JSON
+* ``msgpack`` -- every message is MessagePack (needs the msgpack package)
+
+The agent lists the encodings it accepts in ``register``; the server picks
+the first one it also supports and echoes it in ``registered``.
+
+``register`` also carries a ``protocol_version`` and the agent's
+``capabilities``; ``registered`` answers with the version both sides speak
+and the capabilities both support. Agents that send no version (v2.1 and
+older) are served the legacy protocol with no optional features.
+"""
+import json
+import zlib
+
+try:
+    import msgpack
+except ImportError:  # optional; agents fall back to zlib/json
+    msgpack = None
+
+JSON = "json"
+ZLIB = "zlib"
+MSGPACK = "msgpack"
+
+# Messages smaller than this are not worth compressing
+COMPRESS_MIN_BYTES = 1024
+
+PROTOCOL_VERSION = 3
+# Version assumed for agents whose register message carries none
+LEGACY_PROTOCOL_VERSION = 2
+
+# Optional features, enabled per node when both sides advertise them
+COMPRESSION = "compression"  # binary framing from ``encodings``
+CAPACITY = "capacity"        # node may answer job_dispatch with job_reject when busy
+MODELS_UPDATE = "models_update"  # node reports model list diffs without re-registering
+RESULT_ACK = "result_ack"    # server answers job_result with job_result_ack
+RESUME = "resume"            # reconnecting nodes keep in-flight jobs via a resume token
+DRAIN = "drain"              # node may leave dispatch while finishing its jobs
+CANCEL = "cancel"            # server sends job_cancel for jobs the owner cancelled
+ACCEPT = "accept"            # node sends job_accept when it queues a dispatched job
+
+SERVER_CAPABILITIES = frozenset({
+    COMPRESSION, CAPACITY, MODELS_UPDATE, RESULT_ACK, RESUME, DRAIN, CANCEL, ACCEPT,
+})
+
+
+def negotiate_capabilities(register):
+    """Return ``(protocol_version, capabilities)`` agreed for a register message."""
+    try:
+        version = int(register.get("protocol_version", LEGACY_PROTOCOL_VERSION))
+    except (TypeError, ValueError):
+        version = LEGACY_PROTOCOL_VERSION
+    version = min(version, PROTOCOL_VERSION)
+    if version <= LEGACY_PROTOCOL_VERSION:
+        return version, frozenset()
+    offered = register.get("capabilities") or ()
+    return version, SERVER_CAPABILITIES.intersection(offered)
+
+
+def supported_encodings():
+    """Encodings this server can speak, in order of preference."""
+    encodings = [ZLIB, JSON]
+    if msgpack is not None:
+        encodings.insert(0, MSGPACK)
+    return encodings
+
+
+def negotiate(offered):
+    """Pick the first encoding in ``offered`` the server supports (JSON if none)."""
+    supported = supported_encodings()
+    for encoding in offered or ():
+        if encoding in supported:
+            return encoding
+    return JSON
+
+
+def encode(message, encoding):
+    """Return ``(text_data, bytes_data)`` for a message; exactly one is set."""
+    if encoding == MSGPACK:
+        return None, msgpack.packb(message, use_bin_type=True)
+    text = json.dumps(message, ensure_ascii=False)
+    if encoding == ZLIB and len(text) >= COMPRESS_MIN_BYTES:
+        return None, zlib.compress(text.encode("utf-8"))
+    return text, None
+
+
+def decode(text_data, bytes_data, encoding):
+    """Parse an incoming frame into a message dict. Raises ValueError if malformed."""
+    if text_data is not None:
+        return json.loads(text_data)
+    if encoding == MSGPACK:
+        return msgpack.unpackb(bytes_data, raw=False)
+    if encoding == ZLIB:
+        try:
+            return json.loads(zlib.decompress(bytes_data))
+        except zlib.error as e:
+            raise ValueError(str(e)) from e
+    raise ValueError(f"Unexpected binary frame for encoding {encoding!r}")
@@ -0,0 +1,41 @@
+"""Reconciling jobs when a web process starts.
+
+Daphne has no ASGI lifespan events, so StartupReconcile wraps the
+application and starts a timer on the first connection. Once agents have
+had STARTUP_RECONCILE_DELAY seconds to reconnect, it runs one
+``reconcile_jobs`` pass. That pass judges ownership by node presence, so
+jobs running on nodes served by other processes are left alone, and only
+re-offers PENDING jobs too old for a node to still be running them.
+"""
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+
+from .tasks import reconcile_jobs
+
+logger = logging.getLogger(__name__)
+
+# Seconds after the first connection before orphaned jobs are re-offered
+STARTUP_RECONCILE_DELAY = 10
+
+
+class StartupReconcile:
+    """ASGI wrapper that reconciles jobs once, shortly after startup."""
+
+    def __init__(self, application, delay=STARTUP_RECONCILE_DELAY):
+        self.application = application
+        self.delay = delay
+        self._task = None
+
+    async def __call__(self, scope, receive, send):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._reconcile())
+        return await self.application(scope, receive, send)
+
+    async def _reconcile(self):
+        await asyncio.sleep(self.delay)
+        try:
+            logger.info("Startup reconcile: %s", await sync_to_async(reconcile_jobs)())
+        except Exception as e:  # pylint: disable=broad-except
+            logger.error("Startup reconcile failed: %s", e)
@@ -0,0 +1,123 @@
+"""Cache of inference results for identical requests.
+
+Consumers opt in per job with ``"cache": true``. The key is a hash of the
+model, prompt and generation options. A hit completes the job at once for
+CACHED_JOB_COST without dispatching it. A miss is dispatched as usual, and
+its successful output is stored when the node reports back.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+
+# Price of a job answered from the cache (a dispatched job costs JOB_COST)
+CACHED_JOB_COST = Decimal("0.25")
+
+_KEY_PREFIX = "resultcache:"
+_HITS_KEY = "resultcache:stats:hits"
+_MISSES_KEY = "resultcache:stats:misses"
+
+
+def cache_key(model, prompt, options=None):
+    """Stable hash of everything that determines a generation."""
+    material = json.dumps(
+        [model, prompt, options or {}], sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class MemoryResultCache:
+    """In-process LRU bounded by total output size, with a TTL per entry."""
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (output, expires_at)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached output for key, or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < now:
+                self._evict(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, output):
+        """Store an output, evicting least-recently-used entries to stay under max_bytes."""
+        size = len(output.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+            self._entries[key] = (output, time.monotonic() + self.ttl)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._evict(next(iter(self._entries)))
+
+    def _evict(self, key):
+        output, _ = self._entries.pop(key)
+        self._bytes -= len(output.encode("utf-8"))
+
+    def stats(self):
+        """Hit/miss counters and current size."""
+        with self._lock:
+            return {
+                "hits": self.hits, "misses": self.misses,
+                "entries": len(self._entries), "bytes": self._bytes,
+            }
+
+
+class RedisResultCache:
+    """Entries in the channel-layer Redis with a TTL; shared by every process."""
+
+    def __init__(self, url, ttl):
+        import redis  # pylint: disable=import-outside-toplevel
+        self.ttl = ttl
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+
+    def get(self, key):
+        """Return the cached output for key, or None."""
+        output = self._redis.get(_KEY_PREFIX + key)
+        self._redis.incr(_HITS_KEY if output is not None else _MISSES_KEY)
+        return output
+
+    def put(self, key, output):
+        """Store an output for ttl seconds."""
+        self._redis.set(_KEY_PREFIX + key, output, ex=self.ttl)
+
+    def stats(self):
+        """Hit/miss counters shared by every process."""
+        hits, misses = self._redis.mget([_HITS_KEY, _MISSES_KEY])
+        return {"hits": int(hits or 0), "misses": int(misses or 0)}
+
+
+_cache = None  # pylint: disable=invalid-name
+
+
+def get_result_cache():
+    """Return the process-wide result cache (Redis when REDIS_URL is set)."""
+    global _cache  # pylint: disable=global-statement
+    if _cache is None:
+        if settings.REDIS_URL:
+            _cache = RedisResultCache(settings.REDIS_URL, settings.RESULT_CACHE_TTL)
+        else:
+            _cache = MemoryResultCache(
+                settings.RESULT_CACHE_MAX_BYTES, settings.RESULT_CACHE_TTL,
+            )
+    return _cache
@@ -0,0 +1,106 @@
+"""Latency-aware node choice from per-(node, model) moving averages.
+
+Each result a node reports updates exponentially weighted moving averages
+of its queue wait, time to first token and generation time for the job's
+model. A failed job, a hedged job the node lost to its duplicate, or one
+it never took by the hedge deadline, is folded in as a penalty run
+FAILURE_PENALTY_FACTOR times the model's median.
+The averages live in NodeModelStats, so they survive restarts.
+
+A node's expected completion time for a model is its average queue wait
+plus its average generation time. Nodes with no history for the model are
+assumed to be typical, scoring the model's median, and EXPLORATION_RATE of
+choices go to one of them at random so they get measured.
+
+``choose_node`` applies the scores to the present nodes that can run a
+job. Hedged dispatch and the ``find_node_for_job`` task offer the job to
+the node it picks; plain broadcast dispatch lets every node compete.
+"""
+import random
+import statistics
+
+from django.db import transaction
+
+from .models import NodeModelStats
+from .presence import active_nodes, get_presence
+
+# Weight of the newest result in each moving average
+EWMA_ALPHA = 0.2
+# A failed or timed-out run counts as this many times the model's median
+FAILURE_PENALTY_FACTOR = 4
+# Penalty run for a model with no history at all
+FAILURE_PENALTY_MS = 60_000
+# Share of choices spent on a node with no history for the model
+EXPLORATION_RATE = 0.1
+
+
+def _ewma(average, sample, first):
+    if sample is None:
+        return average
+    if first or average is None:
+        return sample
+    return average + EWMA_ALPHA * (sample - average)
+
+
+def record_result(node, model, queue_ms, duration_ms, first_token_ms=None):
+    """Fold one job's timings into the node's averages for ``model``."""
+    with transaction.atomic():
+        stats, _ = NodeModelStats.objects.select_for_update().get_or_create(
+            node=node, model=model,
+        )
+        first = stats.samples == 0
+        stats.queue_ms = _ewma(stats.queue_ms, queue_ms, first)
+        stats.duration_ms = _ewma(stats.duration_ms, duration_ms, first)
+        stats.first_token_ms = _ewma(stats.first_token_ms, first_token_ms, first)
+        stats.samples += 1
+        stats.save()
+    return stats
+
+
+def median_expected_ms(model):
+    """Median expected time over the nodes measured for ``model``, or None."""
+    values = [
+        stats.expected_ms
+        for stats in NodeModelStats.objects.filter(model=model, samples__gt=0)
+    ]
+    return statistics.median(values) if values else None
+
+
+def record_failure(node, model):
+    """Fold a failed or timed-out job into the node's averages as a slow run."""
+    median = median_expected_ms(model)
+    penalty = median * FAILURE_PENALTY_FACTOR if median else FAILURE_PENALTY_MS
+    return record_result(node, model, None, penalty)
+
+
+def fastest_node(nodes, model):
+    """Return the node expected to finish a ``model`` job soonest, or None."""
+    nodes = list(nodes)
+    if not nodes:
+        return None
+    expected = {
+        stats.node_id: stats.expected_ms
+        for stats in NodeModelStats.objects.filter(model=model, samples__gt=0)
+    }
+    unmeasured = [node for node in nodes if node.id not in expected]
+    if unmeasured and random.random() < EXPLORATION_RATE:
+        return random.choice(unmeasured)
+    prior = statistics.median(expected.values()) if expected else 0
+    # Ties (e.g. several unmeasured nodes) are broken at random
+    return min(nodes, key=lambda node: (expected.get(node.id, prior), random.random()))
+
+
+def choose_node(model, owner_id, exclude=()):
+    """Return (node, channel_name) of the best node for a job, or None.
+
+    Eligible nodes are present, serve ``model``, are not owned by the job's
+    owner and are not in ``exclude`` (node ids).
+    """
+    alive = get_presence().alive()
+    nodes = active_nodes().exclude(owner_id=owner_id).exclude(node_id__in=exclude)
+    node = fastest_node(
+        [node for node in nodes
+         if node.node_id in alive and model in node.gpu_info.get("models", [])],
+        model,
+    )
+    return (node, alive[node.node_id]) if node else None
@@ -0,0 +1,120 @@
+"""Resumable node sessions.
+
+``registered`` hands each node a resume token. When a node disconnects with
+jobs still in flight, its session is parked under that token for
+RESUME_GRACE seconds. If the node reconnects with the token in ``register``,
+it takes the session back and keeps its jobs. If the grace period runs out
+first, its jobs that are unfinished and not taken by another node are
+offered to the network again.
+"""
+import asyncio
+import json
+import logging
+import secrets
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .dispatch import redispatch_pending
+
+logger = logging.getLogger(__name__)
+
+# Seconds a disconnected node's in-flight jobs wait for it to resume
+RESUME_GRACE = 120
+
+# Prune a connection's in-flight set against the DB once it grows this large
+IN_FLIGHT_PRUNE_AT = 256
+
+_KEY_PREFIX = "resume:"
+
+
+def new_resume_token():
+    """Return a fresh opaque resume token."""
+    return secrets.token_urlsafe(24)
+
+
+class MemorySessions:
+    """In-process parked sessions, suitable for single-process deployments."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def park(self, node_id, token, task_ids):
+        """Hold ``task_ids`` for the node until claimed."""
+        with self._lock:
+            self._sessions[(node_id, token)] = list(task_ids)
+
+    def claim(self, node_id, token):
+        """Take a parked session back. Returns its task ids, or None if there is none."""
+        with self._lock:
+            return self._sessions.pop((node_id, token), None)
+
+
+class RedisSessions:
+    """Parked sessions in the channel-layer Redis, shared by every ASGI worker."""
+
+    def __init__(self, url, ttl=RESUME_GRACE * 2):
+        import redis  # pylint: disable=import-outside-toplevel
+        # Outlives the grace period so the expiry task always finds the session
+        self.ttl = ttl
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+
+    @staticmethod
+    def _key(node_id, token):
+        return f"{_KEY_PREFIX}{node_id}:{token}"
+
+    def park(self, node_id, token, task_ids):
+        """Hold ``task_ids`` for the node until claimed."""
+        self._redis.set(self._key(node_id, token), json.dumps(list(task_ids)), ex=self.ttl)
+
+    def claim(self, node_id, token):
+        """Take a parked session back. Returns its task ids, or None if there is none."""
+        pipe = self._redis.pipeline()
+        pipe.get(self._key(node_id, token))
+        pipe.delete(self._key(node_id, token))
+        value, _ = pipe.execute()
+        return json.loads(value) if value is not None else None
+
+
+_sessions = None  # pylint: disable=invalid-name
+
+
+def get_sessions():
+    """Return the process-wide session store (Redis when REDIS_URL is set)."""
+    global _sessions  # pylint: disable=global-statement
+    if _sessions is None:
+        if settings.REDIS_URL:
+            _sessions = RedisSessions(settings.REDIS_URL)
+        else:
+            _sessions = MemorySessions()
+    return _sessions
+
+
+async def _expire(node_id, token, delay):
+    await asyncio.sleep(delay)
+    task_ids = await sync_to_async(get_sessions().claim)(node_id, token)
+    if not task_ids:
+        return  # resumed in time
+    redispatched = 0
+    for task_id in task_ids:
+        if await redispatch_pending(task_id, node_id=node_id):
+            redispatched += 1
+    logger.info(
+        "Node %s did not resume; re-dispatched %d of %d job(s)",
+        node_id, redispatched, len(task_ids),
+    )
+
+
+async def park_session(node_id, token, task_ids, grace=RESUME_GRACE):
+    """Park a disconnected node's jobs and re-dispatch them if it is not back in time."""
+    await sync_to_async(get_sessions().park)(node_id, token, task_ids)
+    asyncio.ensure_future(_expire(node_id, token, grace))
+
+
+async def resume_session(node_id, token):
+    """Claim a parked session for a reconnecting node. Returns its task ids (maybe empty)."""
+    if not token:
+        return []
+    return await sync_to_async(get_sessions().claim)(node_id, token) or []
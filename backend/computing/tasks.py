@@ -1,49 +1,120 @@
-"""Celery tasks for computing job matchmaking and dispatch."""
+"""Celery tasks for computing job matchmaking and reconciliation."""
 from datetime import timedelta
 
 from asgiref.sync import async_to_sync
 from celery import shared_task
 from channels.layers import get_channel_layer
+from django.db.models import Q
 from django.utils import timezone
 
-from .models import Job, Node
+from payments.services import EscrowService, HOLD_EXPIRY
+from .dispatch import dispatch_job, hand_over_followers_of, job_payload
+from .models import Job
+from .presence import deactivate_absent_nodes, get_presence
+from .scoring import choose_node
+
+# Jobs younger than this may still be on their first dispatch
+JOB_LEASE = timedelta(minutes=1)
+
+# Agents that do not send job_accept run a job while it stays PENDING, for up
+# to their 600 s inference timeout; PENDING jobs younger than this may still
+# be running on such a node
+PENDING_LEASE = timedelta(minutes=11)
+
+# Jobs re-offered per query while reconciling
+RECONCILE_BATCH_SIZE = 200
+
+_UNFINISHED = ("PENDING", "RUNNING")
 
 
 @shared_task
 def find_node_for_job(job_id):
-    """Find the best available node for a job (simplified matchmaking)."""
+    """Assign a PENDING job to the eligible node expected to finish it soonest.
+
+    The job is offered to that node alone, as hedged dispatch does. If the
+    node rejects it or disconnects, the job goes back to the network.
+    """
     try:
         job = Job.objects.get(id=job_id)
-        if job.status != 'PENDING':
-            return None
-
-        # Check active nodes with heartbeat in last 30s
-        cutoff = timezone.now() - timedelta(seconds=30)
-        node = Node.objects.filter(
-            is_active=True, last_heartbeat__gte=cutoff
-        ).first()
-
-        if node:
-            job.node = node
-            job.status = 'RUNNING'
-            job.save()
-
-            # Send Job to Node via WebSocket
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f"user_{node.owner.id}_nodes",
-                {
-                    "type": "send_job",
-                    "job": {
-                        "id": job.id,
-                        "task_type": job.task_type,
-                        "input_data": job.input_data
-                    }
-                }
-            )
-            return f"Assigned Job {job.id} to Node {node.id}"
+    except Job.DoesNotExist:
+        return "Job not found"
+    if job.status != 'PENDING':
+        return None
 
+    input_data = job.input_data if isinstance(job.input_data, dict) else {}
+    chosen = choose_node(input_data.get("model", ""), job.user_id)
+    if chosen is None:
         return "No nodes available"
+    node, channel_name = chosen
+    if not Job.objects.filter(id=job.id, status='PENDING').update(status='RUNNING', node=node):
+        return None
 
-    except Job.DoesNotExist:
-        return "Job not found"
+    async_to_sync(get_channel_layer().send)(channel_name, {
+        "type": "job_dispatch", "job_data": job_payload(job), "targeted": True,
+    })
+    return f"Assigned Job {job.id} to Node {node.id}"
+
+
+@shared_task
+def reconcile_jobs(
+    lease_seconds=JOB_LEASE.total_seconds(),
+    batch_size=RECONCILE_BATCH_SIZE,
+    pending_seconds=PENDING_LEASE.total_seconds(),
+):
+    """Fail or re-offer unfinished jobs that no connection is looking after.
+
+    Jobs past their hold expiry are failed and refunded. RUNNING jobs older
+    than the lease are left with the node that accepted them while that node
+    is present, whichever process serves it; otherwise they are reset to
+    PENDING and offered to the network again. PENDING jobs are only re-offered
+    once older than ``pending_seconds``, when no node can still be running
+    them without having accepted them. Re-offers go out in batches. Nodes
+    whose presence lapsed are marked inactive. Safe to run at any time,
+    including during a rolling deploy.
+    """
+    now = timezone.now()
+    failed = EscrowService.release_expired()
+    # Jobs submitted without a hold expire on the same schedule
+    expired = list(
+        Job.objects.filter(status__in=_UNFINISHED, created_at__lt=now - HOLD_EXPIRY)
+        .values_list("id", flat=True)
+    )
+    failed += Job.objects.filter(id__in=expired, status__in=_UNFINISHED).update(
+        status="FAILED",
+        result={"error": "Job expired before completion"},
+        completed_at=now,
+    )
+    hand_over_followers_of(expired)
+    deactivated = deactivate_absent_nodes()
+
+    alive = get_presence().alive()
+    overdue = (
+        Q(status="RUNNING", created_at__lt=now - timedelta(seconds=lease_seconds))
+        | Q(status="PENDING", created_at__lt=now - timedelta(seconds=pending_seconds))
+    )
+    requeued, last_id = 0, 0
+    while True:
+        batch = list(
+            Job.objects.filter(overdue, id__gt=last_id)
+            # Followers are answered by their leader's run while it lasts
+            .exclude(leader__status__in=_UNFINISHED)
+            .select_related("node")
+            .order_by("id")[:batch_size]
+        )
+        if not batch:
+            break
+        last_id = batch[-1].id
+        orphans = [
+            job for job in batch
+            if job.status == "PENDING" or job.node is None or job.node.node_id not in alive
+        ]
+        Job.objects.filter(id__in=[job.id for job in orphans], status="RUNNING").update(
+            status="PENDING", node=None,
+        )
+        for job in orphans:
+            async_to_sync(dispatch_job)(job_payload(job))
+        requeued += len(orphans)
+    return (
+        f"Re-offered {requeued} job(s), failed {failed} expired, "
+        f"marked {deactivated} node(s) inactive"
+    )
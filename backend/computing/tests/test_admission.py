@@ -0,0 +1,64 @@
+"""
+Test Suite: Registration Admission
+Covers: token bucket admission, spread retry hints, retry_later over the WebSocket
+"""
+import pytest
+from channels.testing import WebsocketCommunicator
+
+from computing import admission
+from computing.consumers import GPUConsumer
+
+
+class FakeClock:
+    """Monotonic clock the test advances by hand."""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRegistrationLimiter:
+    """Tests for RegistrationLimiter."""
+
+    def test_burst_then_rejects(self):  # pylint: disable=missing-function-docstring
+        limiter = admission.RegistrationLimiter(rate=10, burst=3, clock=FakeClock())
+        assert [limiter.acquire() for _ in range(3)] == [0, 0, 0]
+        assert limiter.acquire() > 0
+
+    def test_retry_hints_are_spread(self):  # pylint: disable=missing-function-docstring
+        limiter = admission.RegistrationLimiter(rate=10, burst=1, clock=FakeClock())
+        limiter.acquire()
+        hints = [limiter.acquire() for _ in range(3)]
+        assert hints == pytest.approx([0.1, 0.2, 0.3])
+
+    def test_tokens_refill(self):  # pylint: disable=missing-function-docstring
+        clock = FakeClock()
+        limiter = admission.RegistrationLimiter(rate=10, burst=1, clock=clock)
+        limiter.acquire()
+        assert limiter.acquire() > 0
+        clock.now += 0.15
+        assert limiter.acquire() == 0
+
+    def test_hint_is_capped(self):  # pylint: disable=missing-function-docstring
+        limiter = admission.RegistrationLimiter(rate=0.001, burst=1, clock=FakeClock())
+        limiter.acquire()
+        assert limiter.acquire() == admission.MAX_RETRY_AFTER
+
+
+class TestRetryLater:
+    """A register over the limit gets a retry hint and is closed."""
+
+    async def test_register_over_limit(self, monkeypatch):  # pylint: disable=missing-function-docstring
+        limiter = admission.RegistrationLimiter(rate=2, burst=1, clock=FakeClock())
+        limiter.acquire()
+        monkeypatch.setattr(admission, "_limiter", limiter)
+        communicator = WebsocketCommunicator(GPUConsumer.as_asgi(), "/ws/computing/")
+        await communicator.connect()
+        await communicator.send_json_to({
+            "type": "register", "node_id": "storm-node", "auth_token": "gpc_x",
+        })
+        response = await communicator.receive_json_from(timeout=5)
+        assert response == {"type": "retry_later", "retry_after": 0.5}
+        assert (await communicator.receive_output(timeout=5))["type"] == "websocket.close"
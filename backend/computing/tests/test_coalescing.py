@@ -0,0 +1,175 @@
+"""
+Test Suite: Request Coalescing
+Covers: followers of in-flight jobs, completing/handing over followers, coalescing metrics
+"""
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from computing import dispatch
+from computing.consumers import GPUConsumer
+from computing.models import Job, Node
+from computing.presence import get_presence
+from computing.result_cache import CACHED_JOB_COST, cache_key
+from computing.tasks import reconcile_jobs
+from core.models import User
+from payments.models import Hold
+from payments.services import EscrowService
+
+
+@pytest.mark.django_db
+class TestCoalescedSubmission:
+    """Tests for attaching identical submissions to an in-flight job."""
+
+    def setup_method(self):
+        self.client = APIClient()
+        self.provider = User.objects.create_user(
+            username='coalesce_provider', password='p', wallet_balance=Decimal('10.00'),
+        )
+        Node.objects.create(node_id="coalesce-node", owner=self.provider, name="GPU", is_active=True)
+        get_presence().touch({"coalesce-node": "test-channel"})
+
+    def _submit(self, username, **data):
+        user = User.objects.create_user(
+            username=username, password='p', wallet_balance=Decimal('10.00'),
+        )
+        self.client.force_authenticate(user=user)
+        with patch("computing.views.dispatch_job", new=AsyncMock()) as send:
+            resp = self.client.post(reverse('submit-job'), {"model": "llama3", **data}, format='json')
+        assert resp.status_code == 201
+        return resp.data, send
+
+    def test_identical_job_follows_without_dispatch(self):  # pylint: disable=missing-function-docstring
+        first, _ = self._submit("first", prompt="Hi")
+        second, send = self._submit("second", prompt="Hi")
+        assert second["coalesced_with"] == first["job_id"]
+        send.assert_not_awaited()
+        follower = Job.objects.get(id=second["job_id"])
+        assert follower.status == "PENDING" and follower.leader_id == first["job_id"]
+        assert Hold.objects.get(job=follower).status == "HELD"
+
+    def test_different_options_get_their_own_run(self):  # pylint: disable=missing-function-docstring
+        self._submit("first", prompt="Hi", options={"temperature": 0})
+        second, send = self._submit("second", prompt="Hi", options={"temperature": 1})
+        assert "coalesced_with" not in second
+        send.assert_awaited_once()
+
+    def test_finished_job_is_not_followed(self):  # pylint: disable=missing-function-docstring
+        first, _ = self._submit("first", prompt="Hi")
+        Job.objects.filter(id=first["job_id"]).update(status="COMPLETED")
+        second, send = self._submit("second", prompt="Hi")
+        assert "coalesced_with" not in second
+        send.assert_awaited_once()
+
+    def test_provider_may_follow_a_run_on_own_node(self):  # pylint: disable=missing-function-docstring
+        other = User.objects.create_user(username='other_provider', password='p')
+        Node.objects.create(node_id="other-node", owner=other, name="GPU", is_active=True)
+        get_presence().touch({"other-node": "other-channel"})
+        first, _ = self._submit("first", prompt="Hi")
+        Job.objects.filter(id=first["job_id"]).update(
+            status="RUNNING", node=Node.objects.get(node_id="coalesce-node"),
+        )
+        self.client.force_authenticate(user=self.provider)
+        with patch("computing.views.dispatch_job", new=AsyncMock()):
+            resp = self.client.post(
+                reverse('submit-job'), {"model": "llama3", "prompt": "Hi"}, format='json',
+            )
+        assert resp.status_code == 201
+        assert resp.data["coalesced_with"] == first["job_id"]
+
+
+@pytest.mark.django_db
+class TestLeaderOutcome:
+    """Tests for finishing or handing over followers when the leader ends."""
+
+    def setup_method(self):
+        self.key = cache_key("llama3", "Hi")
+        self.leader = self._job("leader_user")
+        self.followers = [self._job(f"follower_{i}", leader=self.leader) for i in range(3)]
+        self.provider = User.objects.create_user(username='outcome_provider', password='p')
+
+    def _job(self, username, leader=None):
+        user = User.objects.create_user(
+            username=username, password='p', wallet_balance=Decimal('10.00'),
+        )
+        job = Job.objects.create(
+            user=user, task_type="inference", status="PENDING", cost=Decimal("1.00"),
+            input_data={"prompt": "Hi", "model": "llama3"},
+            coalesce_key=self.key, leader=leader,
+        )
+        EscrowService.reserve(user, job, Decimal("1.00"))
+        return job
+
+    def test_completion_answers_followers_at_cached_price(self):  # pylint: disable=missing-function-docstring
+        done = async_to_sync(GPUConsumer()._complete_job)(  # pylint: disable=protected-access
+            self.leader.id, {"output": "Hello"}, self.provider.id,
+        )
+        assert sorted(done) == [job.id for job in self.followers]
+        for job in self.followers:
+            job.refresh_from_db()
+            assert job.status == "COMPLETED"
+            assert job.result == {"output": "Hello", "coalesced": True}
+            assert job.cost == CACHED_JOB_COST
+            hold = Hold.objects.get(job=job)
+            assert hold.status == "CAPTURED" and hold.provider_id is None
+            assert hold.amount == CACHED_JOB_COST
+        assert Hold.objects.get(job=self.leader).provider_id == self.provider.id
+
+    def test_cancelled_follower_is_left_alone(self):  # pylint: disable=missing-function-docstring
+        self.followers[0].cancel()
+        done = async_to_sync(GPUConsumer()._complete_job)(  # pylint: disable=protected-access
+            self.leader.id, {"output": "Hello"}, self.provider.id,
+        )
+        assert self.followers[0].id not in done
+        self.followers[0].refresh_from_db()
+        assert self.followers[0].status == "CANCELLED"
+
+    def test_failed_leader_hands_over_to_oldest_follower(self):  # pylint: disable=missing-function-docstring
+        Job.objects.filter(id=self.leader.id).update(status="FAILED")
+        layer = MagicMock(group_send=AsyncMock())
+        with patch("computing.dispatch.get_channel_layer", return_value=layer):
+            successor = async_to_sync(dispatch.hand_over_followers)(self.leader.id)
+        first, *rest = self.followers
+        assert successor == first.id
+        assert layer.group_send.await_args.args[1]["job_data"]["task_id"] == first.id
+        first.refresh_from_db()
+        assert first.leader_id is None
+        assert all(job.leader_id == first.id for job in Job.objects.filter(id__in=[j.id for j in rest]))
+
+    def test_hand_over_without_followers_is_a_no_op(self):  # pylint: disable=missing-function-docstring
+        layer = MagicMock(group_send=AsyncMock())
+        with patch("computing.dispatch.get_channel_layer", return_value=layer):
+            assert async_to_sync(dispatch.hand_over_followers)(self.followers[0].id) is None
+        layer.group_send.assert_not_awaited()
+
+    def test_expired_leader_hands_over_to_oldest_follower(self):  # pylint: disable=missing-function-docstring
+        Hold.objects.filter(job=self.leader).update(created_at=timezone.now() - timedelta(hours=2))
+        layer = MagicMock(group_send=AsyncMock())
+        with patch("computing.dispatch.get_channel_layer", return_value=layer):
+            assert EscrowService.release_expired() == 1
+        self.leader.refresh_from_db()
+        assert self.leader.status == "FAILED"
+        first = self.followers[0]
+        assert layer.group_send.await_args.args[1]["job_data"]["task_id"] == first.id
+        first.refresh_from_db()
+        assert first.leader_id is None and first.status == "PENDING"
+
+    def test_reconcile_skips_followers_of_unfinished_leader(self):  # pylint: disable=missing-function-docstring
+        Job.objects.all().update(created_at=timezone.now() - timedelta(minutes=15))
+        with patch("computing.tasks.dispatch_job", new=AsyncMock()) as send:
+            reconcile_jobs(lease_seconds=60)
+        assert [call.args[0]["task_id"] for call in send.await_args_list] == [self.leader.id]
+
+    def test_network_stats_count_saved_runs(self):  # pylint: disable=missing-function-docstring
+        async_to_sync(GPUConsumer()._complete_job)(  # pylint: disable=protected-access
+            self.leader.id, {"output": "Hello"}, self.provider.id,
+        )
+        resp = APIClient().get(reverse('network-stats'))
+        assert resp.data["completed_jobs"] == 4
+        assert resp.data["coalesced_jobs"] == 3
@@ -1,9 +1,12 @@
 """Tests for the computing task matchmaking system."""
+from unittest.mock import AsyncMock, MagicMock, patch
+
 import pytest
 
 from django.contrib.auth import get_user_model
 
 from computing.models import Job, Node
+from computing.presence import get_presence
 from computing.tasks import find_node_for_job
 
 User = get_user_model()
@@ -20,8 +23,10 @@ class TestComputingSystem:
             owner=self.provider,
             node_id='gpu-worker-1',
             name='My RTX 4090',
+            gpu_info={'models': ['llama-3']},
             is_active=True
         )
+        get_presence().touch({'gpu-worker-1': 'test-channel'})
 
     def test_job_matchmaking(self):
         """A pending job is assigned to an active node."""
@@ -32,12 +37,15 @@ class TestComputingSystem:
             status='PENDING'
         )
 
-        result = find_node_for_job(job.id)
+        layer = MagicMock(send=AsyncMock())
+        with patch('computing.tasks.get_channel_layer', return_value=layer):
+            result = find_node_for_job(job.id)
 
         job.refresh_from_db()
         assert job.status == 'RUNNING'
         assert job.node == self.node
         assert result == f"Assigned Job {job.id} to Node {self.node.id}"
+        assert layer.send.await_args.args[0] == 'test-channel'
 
     def test_no_nodes_available(self):
         """Job stays PENDING when no active nodes exist."""
@@ -13,6 +13,9 @@ from computing.consumers import (
     PROVIDER_SHARE,
 )
 from computing.models import Job, Node
+from computing.presence import get_presence
+from payments.models import Hold
+from payments.services import EscrowService
 
 User = get_user_model()
 
@@ -41,6 +44,7 @@ class TestGPUConsumerSyncHelpers:
             gpu_info={"models": ["llama2", {"name": "mistral"}]},
             is_active=True,
         )
+        get_presence().touch({"node-sync-1": "test-channel"})
 
     # _get_models_sync_shared
     def test_get_models_sync_shared_aggregates(self):
@@ -65,6 +69,7 @@ class TestGPUConsumerSyncHelpers:
             owner=self.provider, node_id="node-sync-2", name="Sync Node 2",
             gpu_info={"models": ["llama2"]}, is_active=True,
         )
+        get_presence().touch({"node-sync-2": "test-channel"})
         consumer = GPUConsumer()
         models = consumer._get_models_sync_shared()
         llama_entry = next(m for m in models if m["name"] == "llama2")
@@ -102,29 +107,53 @@ class TestGPUConsumerDBHelpers:
             gpu_info={"models": ["llama2"]},
             is_active=True,
         )
+        get_presence().touch({"node-db-1": "test-channel"})
 
-    def test_validate_token_returns_none_for_empty(self):
-        """_validate_token returns None for empty token."""
+    def test_resolve_token_returns_none_for_empty(self):
+        """_resolve_token returns None for empty token."""
         from asgiref.sync import async_to_sync
         consumer = GPUConsumer()
-        result = async_to_sync(consumer._validate_token)("")
+        result = async_to_sync(consumer._resolve_token)("")
         assert result is None
 
-    def test_validate_token_returns_none_for_invalid(self):
-        """_validate_token returns None for invalid token."""
+    def test_resolve_token_returns_none_for_invalid(self):
+        """_resolve_token returns None for invalid token."""
         from asgiref.sync import async_to_sync
         consumer = GPUConsumer()
-        result = async_to_sync(consumer._validate_token)("gpc_invalidtoken")
+        result = async_to_sync(consumer._resolve_token)("gpc_invalidtoken")
         assert result is None
 
-    def test_validate_token_returns_user_id_for_valid(self):
-        """_validate_token returns user_id for valid AgentToken."""
+    def test_resolve_token_returns_ids_for_valid(self):
+        """_resolve_token returns (user_id, token_id) for a valid AgentToken."""
         from asgiref.sync import async_to_sync
         from core.models import AgentToken
-        _, raw = AgentToken.generate(self.provider, label="test-agent")
+        token, raw = AgentToken.generate(self.provider, label="test-agent")
         consumer = GPUConsumer()
-        result = async_to_sync(consumer._validate_token)(raw)
-        assert result == self.provider.id
+        result = async_to_sync(consumer._resolve_token)(raw)
+        assert result == (self.provider.id, token.id)
+
+    def test_resolve_token_is_cached(self, django_assert_num_queries):
+        """A second resolve of the same token only checks is_active by primary key."""
+        from asgiref.sync import async_to_sync
+        from core.models import AgentToken
+        agent_token, raw = AgentToken.generate(self.provider, label="cached")
+        consumer = GPUConsumer()
+        first = async_to_sync(consumer._resolve_token)(raw)
+        assert first == (self.provider.id, agent_token.id)
+        with django_assert_num_queries(1):
+            assert async_to_sync(consumer._resolve_token)(raw) == first
+
+    def test_resolve_token_rejects_cached_token_revoked_elsewhere(self):
+        """A token revoked while cached in a process with no node on it is refused."""
+        from asgiref.sync import async_to_sync
+        from core.models import AgentToken
+        from core.token_cache import token_cache
+        agent_token, raw = AgentToken.generate(self.provider, label="elsewhere")
+        consumer = GPUConsumer()
+        assert async_to_sync(consumer._resolve_token)(raw)
+        AgentToken.objects.filter(pk=agent_token.pk).update(is_active=False)
+        assert async_to_sync(consumer._resolve_token)(raw) is None
+        assert token_cache.get(AgentToken.hash_token(raw)) is None
 
     def test_register_node_creates_new(self):
         """_register_node creates a new Node record."""
@@ -180,12 +209,37 @@ class TestGPUConsumerDBHelpers:
             task_type="inference", input_data={"model": "llama2", "prompt": "hi"},
             status="RUNNING",
         )
+        Hold.objects.create(user=self.consumer_user, job=job, amount=JOB_COST)
         consumer = GPUConsumer()
         async_to_sync(consumer._complete_job)(
             job.id, {"output": "result"}, self.provider.id,
         )
+        # Wallets only move once the settlement worker runs
+        self.provider.refresh_from_db()
+        assert self.provider.wallet_balance == Decimal("100.00")
+        assert Hold.objects.get(job=job).status == "CAPTURED"
+
+        EscrowService.settle()
         self.provider.refresh_from_db()
+        self.consumer_user.refresh_from_db()
         assert self.provider.wallet_balance == Decimal("100.00") + PROVIDER_SHARE
+        assert self.consumer_user.wallet_balance == Decimal("50.00") - JOB_COST
+
+    def test_complete_job_ignores_duplicate_result(self):
+        """A second result for a finished job does not capture twice."""
+        from asgiref.sync import async_to_sync
+        job = Job.objects.create(
+            user=self.consumer_user, node=self.node,
+            task_type="inference", input_data={"model": "llama2", "prompt": "hi"},
+            status="RUNNING",
+        )
+        Hold.objects.create(user=self.consumer_user, job=job, amount=JOB_COST)
+        consumer = GPUConsumer()
+        async_to_sync(consumer._complete_job)(job.id, {"output": "a"}, self.provider.id)
+        async_to_sync(consumer._complete_job)(job.id, {"output": "b"}, self.provider.id)
+        job.refresh_from_db()
+        assert job.result == {"output": "a"}
+        assert EscrowService.settle() == 1
 
     def test_complete_job_nonexistent(self):
         """_complete_job handles nonexistent job gracefully."""
@@ -209,6 +263,20 @@ class TestGPUConsumerDBHelpers:
         assert job.result == {"error": "GPU OOM"}
         assert job.completed_at is not None
 
+    def test_fail_job_releases_hold(self):
+        """_fail_job releases the hold so the consumer is not charged."""
+        from asgiref.sync import async_to_sync
+        job = Job.objects.create(
+            user=self.consumer_user, node=self.node,
+            task_type="inference", input_data={"prompt": "test"},
+            status="RUNNING",
+        )
+        Hold.objects.create(user=self.consumer_user, job=job, amount=JOB_COST)
+        consumer = GPUConsumer()
+        async_to_sync(consumer._fail_job)(job.id, {"error": "GPU OOM"})
+        assert Hold.objects.get(job=job).status == "RELEASED"
+        assert EscrowService.available_balance(self.consumer_user) == Decimal("50.00")
+
     def test_fail_job_nonexistent(self):
         """_fail_job handles nonexistent job gracefully."""
         from asgiref.sync import async_to_sync
@@ -259,6 +327,28 @@ class TestGPUConsumerDBHelpers:
         assert data["job_data"]["prompt"] == "raw string input"
         assert data["job_data"]["model"] == "unknown"
 
+    def test_apply_models_update_diff(self):
+        """_apply_models_update adds and removes models in gpu_info."""
+        from asgiref.sync import async_to_sync
+        consumer = GPUConsumer()
+        changed = async_to_sync(consumer._apply_models_update)(
+            "node-db-1", ["mistral"], ["llama2"],
+        )
+        assert changed is True
+        self.node.refresh_from_db()
+        assert self.node.gpu_info["models"] == ["mistral"]
+
+    def test_apply_models_update_noop(self):
+        """_apply_models_update reports no change for an empty diff or unknown node."""
+        from asgiref.sync import async_to_sync
+        consumer = GPUConsumer()
+        assert async_to_sync(consumer._apply_models_update)(
+            "node-db-1", ["llama2"], [],
+        ) is False
+        assert async_to_sync(consumer._apply_models_update)(
+            "no-such-node", ["mistral"], [],
+        ) is False
+
 
 # ---------------------------------------------------------------------------
 # GPUConsumer – job_dispatch method
@@ -294,6 +384,25 @@ class TestGPUConsumerJobDispatch:
         })
 
 
+    @pytest.mark.asyncio
+    async def test_job_cancel_forwarded_to_capable_node(self):
+        """job_cancel reaches nodes that negotiated the cancel capability."""
+        from unittest.mock import AsyncMock
+        consumer = GPUConsumer()
+        consumer.provider_user_id = 42
+        consumer.in_flight = {7}
+        consumer.targeted = {7}
+        consumer.capabilities = frozenset({"cancel"})
+        consumer._send_message = AsyncMock()
+        await consumer.job_cancel({"task_id": 7})
+        consumer._send_message.assert_awaited_once_with({"type": "job_cancel", "task_id": 7})
+        assert consumer.in_flight == set()
+
+        consumer.capabilities = frozenset()
+        consumer._send_message.reset_mock()
+        await consumer.job_cancel({"task_id": 7})
+        consumer._send_message.assert_not_awaited()
+
 # ---------------------------------------------------------------------------
 # DashboardConsumer – sync helper tests
 # ---------------------------------------------------------------------------
@@ -312,6 +421,7 @@ class TestDashboardConsumerSyncHelpers:
             gpu_info={"models": [{"name": "phi-3"}, "gemma"]},
             is_active=True,
         )
+        get_presence().touch({"dash-node-1": "test-channel"})
 
     def test_get_models_sync(self):
         """_get_models_sync aggregates models from active nodes."""
@@ -345,6 +455,7 @@ class TestDashboardConsumerDBHelpers:
             owner=self.user, node_id="dash-db-1", name="Dash DB",
             gpu_info={"models": ["llama2"]}, is_active=True,
         )
+        get_presence().touch({"dash-db-1": "test-channel"})
 
     def test_get_balance(self):
         """_get_balance returns the user's wallet balance."""
@@ -493,6 +604,146 @@ class TestGPUConsumerWebSocket:
         assert response["type"] == "auth_error"
         await communicator.disconnect()
 
+    async def test_revocation_is_pushed_to_registered_node(self):
+        """A token_revoked event disconnects the node using that token."""
+        from channels.db import database_sync_to_async
+        from channels.layers import get_channel_layer
+        from core.models import AgentToken
+
+        @database_sync_to_async
+        def make_token():
+            user = User.objects.create_user(username="revokee", password="p")
+            return AgentToken.generate(user, label="ws")
+
+        agent_token, raw = await make_token()
+        communicator = WebsocketCommunicator(
+            GPUConsumer.as_asgi(), "/ws/computing/",
+        )
+        await communicator.connect()
+        await communicator.send_json_to({
+            "type": "register",
+            "node_id": "revoke-node",
+            "gpu_info": {"models": []},
+            "auth_token": raw,
+        })
+        response = await communicator.receive_json_from(timeout=5)
+        assert response["type"] == "registered"
+
+        await get_channel_layer().group_send(
+            f"agent_token_{agent_token.id}",
+            {"type": "token_revoked", "token_id": agent_token.id},
+        )
+        response = await communicator.receive_json_from(timeout=5)
+        assert response["type"] == "auth_error"
+        await communicator.disconnect()
+
+    async def test_register_negotiates_compressed_framing(self):
+        """An agent offering zlib gets large messages as compressed binary frames."""
+        import zlib
+        from channels.db import database_sync_to_async
+        from channels.layers import get_channel_layer
+        from core.models import AgentToken
+
+        @database_sync_to_async
+        def make_token():
+            user = User.objects.create_user(username="zlib_provider", password="p")
+            return AgentToken.generate(user, label="ws")[1]
+
+        raw = await make_token()
+        communicator = WebsocketCommunicator(
+            GPUConsumer.as_asgi(), "/ws/computing/",
+        )
+        await communicator.connect()
+        await communicator.send_json_to({
+            "type": "register",
+            "node_id": "zlib-node",
+            "gpu_info": {"models": []},
+            "auth_token": raw,
+            "protocol_version": 3,
+            "capabilities": ["compression", "telepathy"],
+            "encodings": ["zlib", "json"],
+        })
+        response = await communicator.receive_json_from(timeout=5)
+        assert response["type"] == "registered"
+        assert response["protocol_version"] == 3
+        assert response["capabilities"] == ["compression"]
+        assert response["encoding"] == "zlib"
+
+        prompt = "x" * 5000
+        await get_channel_layer().group_send("gpu_nodes", {
+            "type": "job_dispatch",
+            "job_data": {"task_id": 1, "owner_id": -1, "model": "m", "prompt": prompt},
+        })
+        frame = await communicator.receive_output(timeout=5)
+        assert "bytes" in frame and frame.get("text") is None
+        message = json.loads(zlib.decompress(frame["bytes"]))
+        assert message["job_data"]["prompt"] == prompt
+        await communicator.disconnect()
+
+    async def test_legacy_agent_gets_plain_json(self):
+        """A v2.1 register (no protocol_version) keeps the legacy JSON protocol."""
+        from channels.db import database_sync_to_async
+        from core.models import AgentToken
+
+        @database_sync_to_async
+        def make_token():
+            user = User.objects.create_user(username="legacy_provider", password="p")
+            return AgentToken.generate(user, label="ws")[1]
+
+        raw = await make_token()
+        communicator = WebsocketCommunicator(
+            GPUConsumer.as_asgi(), "/ws/computing/",
+        )
+        await communicator.connect()
+        await communicator.send_json_to({
+            "type": "register",
+            "node_id": "legacy-node",
+            "gpu_info": {"models": []},
+            "auth_token": raw,
+            "encodings": ["zlib"],
+        })
+        response = await communicator.receive_json_from(timeout=5)
+        assert response["type"] == "registered"
+        assert response["protocol_version"] == 2
+        assert response["capabilities"] == []
+        assert response["encoding"] == "json"
+        await communicator.disconnect()
+
+    async def test_job_result_is_acknowledged(self):
+        """With result_ack negotiated, every job_result is answered with an ack."""
+        from channels.db import database_sync_to_async
+        from core.models import AgentToken
+
+        @database_sync_to_async
+        def make_token():
+            user = User.objects.create_user(username="ack_provider", password="p")
+            return AgentToken.generate(user, label="ws")[1]
+
+        raw = await make_token()
+        communicator = WebsocketCommunicator(
+            GPUConsumer.as_asgi(), "/ws/computing/",
+        )
+        await communicator.connect()
+        await communicator.send_json_to({
+            "type": "register",
+            "node_id": "ack-node",
+            "gpu_info": {"models": []},
+            "auth_token": raw,
+            "protocol_version": 3,
+            "capabilities": ["result_ack"],
+        })
+        response = await communicator.receive_json_from(timeout=5)
+        assert response["capabilities"] == ["result_ack"]
+
+        # A replay for a job that is already finished (or unknown) is still acked
+        await communicator.send_json_to({
+            "type": "job_result",
+            "result": {"task_id": 99999, "status": "success", "response": "ok"},
+        })
+        ack = await communicator.receive_json_from(timeout=5)
+        assert ack == {"type": "job_result_ack", "task_id": 99999}
+        await communicator.disconnect()
+
     async def test_pong_message_handled(self):
         """GPUConsumer handles pong messages without error."""
         communicator = WebsocketCommunicator(
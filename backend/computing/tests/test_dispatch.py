@@ -0,0 +1,132 @@
+"""
+Test Suite: Job Dispatch
+Covers: job payloads, re-dispatch of jobs rejected by busy nodes, job acceptance
+"""
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from channels.db import database_sync_to_async
+
+from computing import dispatch
+from computing.consumers import GPUConsumer
+from computing.models import Job, Node
+from core.models import User
+
+
+def _make_job(status="PENDING"):
+    user = User.objects.create_user(username=f"dispatch_{status}", password="p")
+    return Job.objects.create(
+        user=user, task_type="inference", status=status,
+        input_data={"prompt": "hi", "model": "llama3"},
+    )
+
+
+@pytest.mark.django_db(transaction=True)
+class TestRedispatch:
+    """Tests for schedule_redispatch."""
+
+    async def test_pending_job_is_offered_again(self):  # pylint: disable=missing-function-docstring
+        job = await database_sync_to_async(_make_job)()
+        layer = MagicMock(group_send=AsyncMock())
+        with patch("computing.dispatch.get_channel_layer", return_value=layer):
+            assert dispatch.schedule_redispatch(job.id, delay=0)
+            assert not dispatch.schedule_redispatch(job.id, delay=0)
+            await asyncio.sleep(0.2)
+        layer.group_send.assert_awaited_once_with("gpu_nodes", {
+            "type": "job_dispatch",
+            "job_data": {"task_id": job.id, "owner_id": job.user_id,
+                         "model": "llama3", "prompt": "hi"},
+        })
+        assert job.id not in dispatch._scheduled  # pylint: disable=protected-access
+
+    async def test_finished_job_is_not_offered_again(self):  # pylint: disable=missing-function-docstring
+        job = await database_sync_to_async(_make_job)("COMPLETED")
+        layer = MagicMock(group_send=AsyncMock())
+        with patch("computing.dispatch.get_channel_layer", return_value=layer):
+            dispatch.schedule_redispatch(job.id, delay=0)
+            await asyncio.sleep(0.2)
+        layer.group_send.assert_not_awaited()
+
+    async def test_job_accepted_elsewhere_is_not_offered_again(self):  # pylint: disable=missing-function-docstring
+        job = await database_sync_to_async(_make_job)()
+        layer = MagicMock(group_send=AsyncMock())
+        with patch("computing.dispatch.get_channel_layer", return_value=layer):
+            dispatch.schedule_redispatch(job.id, delay=0.1)
+            await _receive({"accept"}, "idle-node", {"type": "job_accept", "task_id": job.id})
+            await asyncio.sleep(0.3)
+        layer.group_send.assert_not_awaited()
+
+    async def test_job_assigned_to_rejecting_node_is_released(self):  # pylint: disable=missing-function-docstring
+        job = await database_sync_to_async(_make_job)()
+        node = await database_sync_to_async(Node.objects.create)(
+            owner_id=job.user_id, node_id="assigned-node", name="Assigned",
+        )
+        await database_sync_to_async(Job.objects.filter(pk=job.pk).update)(status="RUNNING", node=node)
+        layer = MagicMock(group_send=AsyncMock())
+        with patch("computing.dispatch.get_channel_layer", return_value=layer):
+            dispatch.schedule_redispatch(job.id, delay=0, node_id="assigned-node")
+            await asyncio.sleep(0.2)
+        layer.group_send.assert_awaited_once()
+        await database_sync_to_async(job.refresh_from_db)()
+        assert job.status == "PENDING" and job.node_id is None
+
+
+async def _receive(capabilities, node_id, message):
+    consumer = GPUConsumer()
+    consumer.node_id = node_id
+    consumer.encoding = "json"
+    consumer.capabilities = frozenset(capabilities)
+    consumer.in_flight = set()
+    consumer.targeted = set()
+    await consumer.receive(text_data=json.dumps(message))
+    return consumer
+
+
+@pytest.mark.django_db(transaction=True)
+class TestJobAccept:
+    """Tests for job_accept handling in GPUConsumer."""
+
+    def _setup(self):
+        job = _make_job()
+        Node.objects.create(node_id="first-node", owner=job.user, name="GPU")
+        Node.objects.create(node_id="second-node", owner=job.user, name="GPU")
+        return job
+
+    async def test_first_accept_takes_the_job(self):  # pylint: disable=missing-function-docstring
+        job = await database_sync_to_async(self._setup)()
+        for node_id in ("first-node", "second-node"):
+            await _receive({"accept"}, node_id, {"type": "job_accept", "task_id": job.id})
+        job = await database_sync_to_async(Job.objects.select_related("node").get)(id=job.id)
+        assert job.status == "RUNNING"
+        assert job.node.node_id == "first-node"
+
+    async def test_accept_ignored_without_capability(self):  # pylint: disable=missing-function-docstring
+        job = await database_sync_to_async(self._setup)()
+        await _receive(set(), "first-node", {"type": "job_accept", "task_id": job.id})
+        await database_sync_to_async(job.refresh_from_db)()
+        assert job.status == "PENDING" and job.node_id is None
+
+
+class TestJobReject:
+    """Tests for job_reject handling in GPUConsumer."""
+
+    async def _receive_reject(self, capabilities):
+        consumer = GPUConsumer()
+        consumer.node_id = "busy-node"
+        consumer.encoding = "json"
+        consumer.capabilities = frozenset(capabilities)
+        consumer.in_flight = set()
+        consumer.targeted = set()
+        with patch("computing.consumers.schedule_redispatch") as schedule:
+            await consumer.receive(text_data='{"type": "job_reject", "task_id": 7, "retry_after": 2}')
+        return schedule
+
+    async def test_reject_from_capacity_node_schedules_redispatch(self):  # pylint: disable=missing-function-docstring
+        schedule = await self._receive_reject({"capacity"})
+        schedule.assert_called_once_with(7, 2.0, node_id="busy-node")
+
+    async def test_reject_ignored_without_capability(self):  # pylint: disable=missing-function-docstring
+        schedule = await self._receive_reject(set())
+        schedule.assert_not_called()
@@ -0,0 +1,111 @@
+"""
+Test Suite: Draining
+Covers: node drain over the WebSocket, server drain hand-off and refused registrations
+"""
+import pytest
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+
+from computing import drain
+from computing.consumers import GPUConsumer
+from computing.dispatch import announce_cancellation
+from computing.models import Job, Node
+from computing.presence import get_presence
+from core.models import AgentToken, User
+
+
+@database_sync_to_async
+def _make_token(username):
+    user = User.objects.create_user(username=username, password="p")
+    return AgentToken.generate(user, label="ws")[1]
+
+
+async def _register(raw, node_id, capabilities=("drain",)):
+    communicator = WebsocketCommunicator(GPUConsumer.as_asgi(), "/ws/computing/")
+    await communicator.connect()
+    await communicator.send_json_to({
+        "type": "register",
+        "node_id": node_id,
+        "gpu_info": {"models": []},
+        "auth_token": raw,
+        "protocol_version": 3,
+        "capabilities": list(capabilities),
+    })
+    registered = await communicator.receive_json_from(timeout=5)
+    assert registered["type"] == "registered"
+    return communicator
+
+
+@pytest.mark.django_db(transaction=True)
+class TestNodeDrain:
+    """A draining node leaves dispatch but stays connected."""
+
+    async def test_drain_stops_dispatch(self):  # pylint: disable=missing-function-docstring
+        communicator = await _register(await _make_token("drain_provider"), "drain-node")
+        await communicator.send_json_to({"type": "drain"})
+        assert await communicator.receive_json_from(timeout=5) == {"type": "drain_ack"}
+
+        assert "drain-node" not in await database_sync_to_async(get_presence().alive)()
+        node = await database_sync_to_async(Node.objects.get)(node_id="drain-node")
+        assert not node.is_active
+
+        await get_channel_layer().group_send("gpu_nodes", {
+            "type": "job_dispatch",
+            "job_data": {"task_id": 1, "owner_id": -1, "model": "m", "prompt": "p"},
+        })
+        assert await communicator.receive_nothing(timeout=0.2)
+        await communicator.disconnect()
+
+    async def test_cancel_reaches_draining_node_once(self):  # pylint: disable=missing-function-docstring
+        communicator = await _register(
+            await _make_token("drain_cancel"), "drain-cancel-node", ("drain", "cancel"),
+        )
+        owner = await database_sync_to_async(User.objects.create_user)(username="drain_owner", password="p")
+        node = await database_sync_to_async(Node.objects.get)(node_id="drain-cancel-node")
+        jobs = [
+            await database_sync_to_async(Job.objects.create)(
+                user=owner, node=node, task_type="inference", status="CANCELLED",
+                input_data={"prompt": "p", "model": "m"},
+            )
+            for _ in range(2)
+        ]
+
+        # Connected: the gpu_nodes broadcast reaches it, the direct copy is skipped
+        await announce_cancellation(jobs[0])
+        assert await communicator.receive_json_from(timeout=5) == {
+            "type": "job_cancel", "task_id": jobs[0].id,
+        }
+        assert await communicator.receive_nothing(timeout=0.2)
+
+        await communicator.send_json_to({"type": "drain"})
+        assert await communicator.receive_json_from(timeout=5) == {"type": "drain_ack"}
+        # Draining: out of gpu_nodes, reached through its own group
+        await announce_cancellation(jobs[1])
+        assert await communicator.receive_json_from(timeout=5) == {
+            "type": "job_cancel", "task_id": jobs[1].id,
+        }
+        assert await communicator.receive_nothing(timeout=0.2)
+        await communicator.disconnect()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestServerDrain:
+    """A draining process hands nodes off and refuses new ones."""
+
+    async def test_nodes_are_handed_off(self, monkeypatch):  # pylint: disable=missing-function-docstring
+        monkeypatch.setattr(drain, "_draining", False)
+        communicator = await _register(await _make_token("handoff_provider"), "handoff-node")
+        await drain.drain_server(spread=0)
+        assert drain.is_draining()
+        assert await communicator.receive_json_from(timeout=5) == {
+            "type": "reconnect", "retry_after": drain.DRAIN_RETRY_AFTER,
+        }
+        assert (await communicator.receive_output(timeout=5))["type"] == "websocket.close"
+
+        late = WebsocketCommunicator(GPUConsumer.as_asgi(), "/ws/computing/")
+        await late.connect()
+        await late.send_json_to({"type": "register", "node_id": "late-node", "auth_token": "gpc_x"})
+        assert await late.receive_json_from(timeout=5) == {
+            "type": "retry_later", "retry_after": drain.DRAIN_RETRY_AFTER,
+        }
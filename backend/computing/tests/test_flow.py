@@ -9,7 +9,10 @@ from django.urls import reverse
 from rest_framework.test import APIClient
 
 from computing.models import Job, Node
+from computing.presence import get_presence
 from core.models import User
+from payments.models import Hold
+from payments.services import EscrowService
 
 
 @pytest.mark.django_db
@@ -30,6 +33,7 @@ class TestJobSubmissionAPI:
             node_id="node-1", owner=self.provider,
             name="Test GPU", gpu_info={"model": "RTX 4090"}, is_active=True
         )
+        get_presence().touch({"node-1": "test-channel"})
         # Authenticate as consumer
         self.client.force_authenticate(user=self.consumer)
 
@@ -63,18 +67,31 @@ class TestJobSubmissionAPI:
         job = Job.objects.first()
         assert job.cost == Decimal('1.00')
 
-    def test_credit_deducted_on_submit(self):  # pylint: disable=missing-function-docstring
+    def test_credit_reserved_on_submit(self):  # pylint: disable=missing-function-docstring
         self.client.post(reverse('submit-job'), {"prompt": "X"}, format='json')
         self.consumer.refresh_from_db()
-        assert self.consumer.wallet_balance == Decimal('9.00')
+        assert self.consumer.wallet_balance == Decimal('10.00')
+        assert EscrowService.available_balance(self.consumer) == Decimal('9.00')
+        hold = Hold.objects.get(job=Job.objects.first())
+        assert hold.status == 'HELD'
+        assert hold.amount == Decimal('1.00')
 
-    def test_multiple_jobs_deduct_correctly(self):  # pylint: disable=missing-function-docstring
+    def test_multiple_jobs_reserve_correctly(self):  # pylint: disable=missing-function-docstring
         for i in range(3):
             self.client.post(reverse('submit-job'), {"prompt": f"Job {i}"}, format='json')
         self.consumer.refresh_from_db()
-        assert self.consumer.wallet_balance == Decimal('7.00')
+        assert EscrowService.available_balance(self.consumer) == Decimal('7.00')
         assert Job.objects.filter(user=self.consumer).count() == 3
 
+    def test_outstanding_holds_block_overspending(self):  # pylint: disable=missing-function-docstring
+        self.consumer.wallet_balance = Decimal('2.00')
+        self.consumer.save()
+        for i in range(2):
+            self.client.post(reverse('submit-job'), {"prompt": f"Job {i}"}, format='json')
+        resp = self.client.post(reverse('submit-job'), {"prompt": "One too many"}, format='json')
+        assert resp.status_code == 402
+        assert Job.objects.count() == 2
+
     def test_default_model_is_llama(self):  # pylint: disable=missing-function-docstring
         self.client.post(reverse('submit-job'), {"prompt": "Hello"}, format='json')
         job = Job.objects.first()
@@ -112,6 +129,8 @@ class TestJobSubmissionAPI:
         self.client.post(reverse('submit-job'), {"prompt": "Test"}, format='json')
         self.consumer.refresh_from_db()
         assert self.consumer.wallet_balance == Decimal('0.50')
+        assert not Hold.objects.exists()
+        assert not Job.objects.exists()
 
     # --- Auth ---
     def test_unauthenticated_returns_401(self):  # pylint: disable=missing-function-docstring
@@ -140,3 +159,54 @@ class TestJobSubmissionAPI:
         resp = self.client.get(reverse('job-list'))
         assert len(resp.data) == 1
         assert resp.data[0]['prompt'] == 'Theirs'
+
+
+@pytest.mark.django_db
+class TestResultCacheSubmission:
+    """Tests for opt-in result caching in JobSubmissionView."""
+
+    def setup_method(self):
+        self.client = APIClient()
+        self.consumer = User.objects.create_user(
+            username='cache_consumer', password='p', wallet_balance=Decimal('10.00'),
+        )
+        self.client.force_authenticate(user=self.consumer)
+
+    @pytest.fixture(autouse=True)
+    def _cache(self, monkeypatch):
+        from computing import result_cache
+        self.cache = result_cache.MemoryResultCache(max_bytes=1024, ttl=60)
+        monkeypatch.setattr(result_cache, '_cache', self.cache)
+
+    def test_hit_completes_at_cached_price(self):  # pylint: disable=missing-function-docstring
+        from computing.result_cache import CACHED_JOB_COST, cache_key
+        self.cache.put(cache_key('llama3', 'Hi', {'temperature': 0}), 'Hello!')
+        resp = self.client.post(reverse('submit-job'), {
+            "prompt": "Hi", "model": "llama3", "options": {"temperature": 0}, "cache": True,
+        }, format='json')
+        assert resp.status_code == 201
+        assert resp.data == {"status": "completed", "job_id": resp.data['job_id'], "cached": True}
+        job = Job.objects.get(id=resp.data['job_id'])
+        assert job.status == 'COMPLETED'
+        assert job.result == {"output": "Hello!", "cached": True}
+        assert job.cost == CACHED_JOB_COST
+        hold = Hold.objects.get(job=job)
+        assert hold.status == 'CAPTURED' and hold.provider_id is None
+        assert self.cache.stats()['hits'] == 1
+
+    def test_miss_is_dispatched_with_cache_key(self):  # pylint: disable=missing-function-docstring
+        provider = User.objects.create_user(username='cache_provider', password='p')
+        Node.objects.create(node_id="cache-node", owner=provider, name="GPU", is_active=True)
+        get_presence().touch({"cache-node": "test-channel"})
+        resp = self.client.post(reverse('submit-job'), {"prompt": "Hi", "cache": True}, format='json')
+        assert resp.data['status'] == 'submitted'
+        job = Job.objects.get(id=resp.data['job_id'])
+        assert job.input_data['cache_key']
+        assert self.cache.stats()['misses'] == 1
+
+    def test_without_opt_in_cache_is_not_used(self):  # pylint: disable=missing-function-docstring
+        from computing.result_cache import cache_key
+        self.cache.put(cache_key('llama3.2:latest', 'Hi'), 'Hello!')
+        resp = self.client.post(reverse('submit-job'), {"prompt": "Hi"}, format='json')
+        assert resp.status_code == 400  # no nodes: the cache was not consulted
+        assert self.cache.stats() == {"hits": 0, "misses": 0, "entries": 1, "bytes": 6}
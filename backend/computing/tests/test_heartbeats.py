@@ -0,0 +1,102 @@
+"""
+Test Suite: Batched Heartbeats and Node Presence
+Covers: buffering, presence refresh without DB writes, expiry, active-node queries,
+periodic deactivation of absent nodes
+"""
+import asyncio
+
+import pytest
+from channels.db import database_sync_to_async
+
+from computing import heartbeats, presence
+from computing.heartbeats import HeartbeatBuffer
+from computing.models import Node
+from computing.presence import MemoryPresence, active_nodes, deactivate_absent_nodes
+from core.models import User
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """A fresh in-memory presence store installed as the process-wide one."""
+    fresh = MemoryPresence()
+    monkeypatch.setattr(presence, '_presence', fresh)
+    return fresh
+
+
+@pytest.mark.django_db
+class TestHeartbeatBuffer:
+    """Tests for the per-process heartbeat buffer."""
+
+    def test_flush_refreshes_presence_without_db_writes(  # pylint: disable=missing-function-docstring
+        self, store, django_assert_num_queries
+    ):
+        buffer = HeartbeatBuffer()
+        for i in range(200):
+            buffer.record(f"hb-{i}", f"channel-{i}")
+        buffer.record("hb-0", "channel-0")
+        with django_assert_num_queries(0):
+            assert buffer.flush() == 200
+        alive = store.alive()
+        assert len(alive) == 200
+        assert alive["hb-7"] == "channel-7"
+
+    def test_discarded_heartbeat_is_not_flushed(self, store):  # pylint: disable=missing-function-docstring
+        buffer = HeartbeatBuffer()
+        buffer.record("gone", "channel")
+        buffer.discard("gone")
+        assert buffer.flush() == 0
+        assert not store.alive()
+
+
+@pytest.mark.django_db
+class TestNodePresence:
+    """Tests for presence-backed liveness."""
+
+    def setup_method(self):
+        self.owner = User.objects.create_user(username='presence_owner', password='p')
+        for node_id in ("p-1", "p-2"):
+            Node.objects.create(
+                owner=self.owner, node_id=node_id, name=node_id,
+                gpu_info={}, is_active=True,
+            )
+
+    def test_active_nodes_reads_presence(self, store):  # pylint: disable=missing-function-docstring
+        store.touch({"p-1": "channel-1"})
+        assert list(active_nodes().values_list('node_id', flat=True)) == ["p-1"]
+
+    def test_expired_presence_drops_node(self, store, monkeypatch):  # pylint: disable=missing-function-docstring
+        store.touch({"p-1": "channel-1", "p-2": "channel-2"})
+        now = presence.time.monotonic()
+        monkeypatch.setattr(presence.time, 'monotonic', lambda: now + presence.PRESENCE_TTL + 1)
+        assert not active_nodes().exists()
+
+    def test_remove_is_immediate(self, store):  # pylint: disable=missing-function-docstring
+        store.touch({"p-1": "channel-1"})
+        store.remove("p-1")
+        assert not active_nodes().exists()
+
+    def test_absent_nodes_are_deactivated(self, store):  # pylint: disable=missing-function-docstring
+        store.touch({"p-1": "channel-1"})
+        assert deactivate_absent_nodes() == 1
+        assert list(Node.objects.filter(is_active=True).values_list('node_id', flat=True)) == ["p-1"]
+        assert deactivate_absent_nodes() == 0
+
+
+@pytest.mark.django_db(transaction=True)
+async def test_flusher_deactivates_absent_nodes(store, monkeypatch):  # pylint: disable=missing-function-docstring,redefined-outer-name
+    buffer = HeartbeatBuffer()
+    monkeypatch.setattr(heartbeats, 'heartbeat_buffer', buffer)
+    owner = await database_sync_to_async(User.objects.create_user)(username='flush_owner', password='p')
+    for node_id in ("f-1", "f-2"):
+        await database_sync_to_async(Node.objects.create)(
+            owner=owner, node_id=node_id, name=node_id, gpu_info={}, is_active=True,
+        )
+    buffer.record("f-1", "channel-1")
+    task = asyncio.ensure_future(heartbeats._flush_forever(0.05))  # pylint: disable=protected-access
+    await asyncio.sleep(0.3)
+    task.cancel()
+    active = await database_sync_to_async(
+        lambda: set(Node.objects.filter(is_active=True).values_list('node_id', flat=True))
+    )()
+    assert active == {"f-1"}
+    assert "f-1" in store.alive()
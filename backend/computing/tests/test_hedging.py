@@ -0,0 +1,322 @@
+"""
+Test Suite: Hedged Dispatch
+Covers: percentile/budget helpers, single-node offers, hedge timer, re-offers of unhedged
+jobs, failed attempts, loser scoring and cancellation, p99 stats
+"""
+import asyncio
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.db import database_sync_to_async
+from django.utils import timezone
+
+from computing import dispatch, hedging
+from computing.consumers import GPUConsumer
+from computing.models import Job, Node, NodeModelStats
+from computing.presence import get_presence
+from computing.scoring import FAILURE_PENALTY_MS, record_result
+from core.models import User
+
+
+class TestHelpers:
+    """Tests for percentile and HedgeBudget."""
+
+    def test_percentile_is_nearest_rank(self):  # pylint: disable=missing-function-docstring
+        values = list(range(1, 101))
+        assert hedging.percentile(values, 99) == 99
+        assert hedging.percentile(values, 50) == 50
+        assert hedging.percentile([7], 99) == 7
+
+    def test_budget_is_earned_by_dispatches(self):  # pylint: disable=missing-function-docstring
+        budget = hedging.HedgeBudget(ratio=0.5, burst=2)
+        assert not budget.spend()
+        budget.earn()
+        budget.earn()
+        assert budget.spend()
+        assert not budget.spend()
+
+    def test_budget_saves_up_to_burst(self):  # pylint: disable=missing-function-docstring
+        budget = hedging.HedgeBudget(ratio=1, burst=2)
+        for _ in range(5):
+            budget.earn()
+        assert [budget.spend() for _ in range(3)] == [True, True, False]
+
+
+@pytest.fixture
+def hedge_state(monkeypatch, settings):
+    """Hedging on, no holdout, fresh per-process state."""
+    settings.HEDGE_ENABLED = True
+    settings.HEDGE_HOLDOUT_PERCENT = 0
+    monkeypatch.setattr(hedging, "_attempts", {})
+    monkeypatch.setattr(hedging, "_delays", {})
+    monkeypatch.setattr(hedging, "_budget", hedging.HedgeBudget(ratio=1))
+    layer = MagicMock(send=AsyncMock(), group_send=AsyncMock())
+    with patch("computing.hedging.get_channel_layer", return_value=layer), \
+            patch("computing.dispatch.get_channel_layer", return_value=layer):
+        yield layer
+
+
+def _setup_nodes():
+    owner = User.objects.create_user(username="hedge_owner", password="p", wallet_balance=Decimal("5"))
+    provider = User.objects.create_user(username="hedge_provider", password="p")
+    for node_id, models, node_owner in (
+        ("fast", ["llama3"], provider),
+        ("slow", ["llama3"], provider),
+        ("other-model", ["mistral"], provider),
+        ("own", ["llama3"], owner),
+    ):
+        Node.objects.create(
+            node_id=node_id, owner=node_owner, name=node_id, is_active=True,
+            gpu_info={"models": models},
+        )
+        get_presence().touch({node_id: f"channel-{node_id}"})
+    job = Job.objects.create(
+        user=owner, task_type="inference", input_data={"prompt": "hi", "model": "llama3"},
+    )
+    return dispatch.job_payload(job)
+
+
+@pytest.mark.django_db(transaction=True)
+class TestOffer:
+    """Tests for hedged dispatch offers."""
+
+    async def test_job_goes_to_one_eligible_node(self, hedge_state):  # pylint: disable=missing-function-docstring,redefined-outer-name
+        job_data = await database_sync_to_async(_setup_nodes)()
+        with patch("computing.hedging.hedge_delay", new=AsyncMock(return_value=60)):
+            await dispatch.dispatch_job(job_data)
+        hedge_state.group_send.assert_not_awaited()
+        channel, message = hedge_state.send.await_args.args
+        assert channel in ("channel-fast", "channel-slow")
+        assert message == {"type": "job_dispatch", "job_data": job_data, "targeted": True}
+
+    async def test_job_goes_to_fastest_node(self, hedge_state):  # pylint: disable=missing-function-docstring,redefined-outer-name
+        job_data = await database_sync_to_async(_setup_nodes)()
+        for node_id, duration_ms in (("fast", 500), ("slow", 9000)):
+            node = await database_sync_to_async(Node.objects.get)(node_id=node_id)
+            await database_sync_to_async(record_result)(node, "llama3", 0, duration_ms)
+        with patch("computing.hedging.hedge_delay", new=AsyncMock(return_value=60)):
+            await hedging.offer(job_data)
+        assert hedge_state.send.await_args.args[0] == "channel-fast"
+
+    async def test_reoffers_skip_nodes_already_tried(self, hedge_state):  # pylint: disable=missing-function-docstring,redefined-outer-name
+        job_data = await database_sync_to_async(_setup_nodes)()
+        with patch("computing.hedging.hedge_delay", new=AsyncMock(return_value=60)):
+            assert await hedging.offer(job_data)
+            assert await hedging.offer(job_data)
+            assert not await hedging.offer(job_data)
+        channels = {call.args[0] for call in hedge_state.send.await_args_list}
+        assert channels == {"channel-fast", "channel-slow"}
+
+    async def test_no_eligible_node_falls_back_to_broadcast(self, hedge_state):  # pylint: disable=missing-function-docstring,redefined-outer-name
+        job_data = await database_sync_to_async(_setup_nodes)()
+        job_data["model"] = "phi3"
+        await dispatch.dispatch_job(job_data)
+        hedge_state.send.assert_not_awaited()
+        hedge_state.group_send.assert_awaited_once()
+
+    async def test_slow_job_is_hedged_once(self, hedge_state):  # pylint: disable=missing-function-docstring,redefined-outer-name
+        job_data = await database_sync_to_async(_setup_nodes)()
+        with patch("computing.hedging.hedge_delay", new=AsyncMock(return_value=0)):
+            await hedging.offer(job_data)
+            await asyncio.sleep(0.2)
+        assert hedge_state.send.await_count == 2
+        job = await database_sync_to_async(Job.objects.get)(id=job_data["task_id"])
+        assert job.hedged_at is not None
+        # Being slower than the percentile is not a penalty until the hedge wins
+        assert not await database_sync_to_async(NodeModelStats.objects.exists)()
+        assert job_data["task_id"] not in hedging._attempts  # pylint: disable=protected-access
+
+    async def test_finished_job_is_not_hedged(self, hedge_state):  # pylint: disable=missing-function-docstring,redefined-outer-name
+        job_data = await database_sync_to_async(_setup_nodes)()
+        with patch("computing.hedging.hedge_delay", new=AsyncMock(return_value=0.1)):
+            await hedging.offer(job_data)
+            await database_sync_to_async(
+                Job.objects.filter(id=job_data["task_id"]).update,
+            )(status="COMPLETED")
+            await asyncio.sleep(0.3)
+        assert hedge_state.send.await_count == 1
+
+    async def test_spent_budget_and_holdout_are_not_hedged(self, hedge_state, settings):  # pylint: disable=missing-function-docstring,redefined-outer-name
+        job_data = await database_sync_to_async(_setup_nodes)()
+        # Accepted by a node that is still present
+        await database_sync_to_async(
+            Job.objects.filter(id=job_data["task_id"]).update,
+        )(status="RUNNING", node=await database_sync_to_async(Node.objects.get)(node_id="fast"))
+        hedging._budget = hedging.HedgeBudget(ratio=0)  # pylint: disable=protected-access
+        with patch("computing.hedging.hedge_delay", new=AsyncMock(return_value=0)):
+            await hedging.offer(job_data)
+            await asyncio.sleep(0.2)
+            hedging._budget = hedging.HedgeBudget(ratio=1)  # pylint: disable=protected-access
+            settings.HEDGE_HOLDOUT_PERCENT = 100
+            await hedging.offer(job_data)
+            await asyncio.sleep(0.2)
+        assert hedge_state.send.await_count == 2  # two first offers, no hedges
+
+    async def test_unhedged_job_nobody_took_is_reoffered(self, hedge_state, settings):  # pylint: disable=missing-function-docstring,redefined-outer-name
+        settings.HEDGE_HOLDOUT_PERCENT = 100
+        job_data = await database_sync_to_async(_setup_nodes)()
+        with patch("computing.hedging.hedge_delay", new=AsyncMock(return_value=0)):
+            await hedging.offer(job_data)
+            await asyncio.sleep(0.2)
+        channels = [call.args[0] for call in hedge_state.send.await_args_list]
+        assert sorted(channels) == ["channel-fast", "channel-slow"]
+        job = await database_sync_to_async(Job.objects.get)(id=job_data["task_id"])
+        assert job.hedged_at is None
+        # The node that never took the job timed out and is scored as slow
+        first = channels[0].removeprefix("channel-")
+        stats = await database_sync_to_async(NodeModelStats.objects.get)(node__node_id=first)
+        assert stats.duration_ms == FAILURE_PENALTY_MS
+
+    async def test_job_of_departed_node_is_reoffered(self, hedge_state):  # pylint: disable=missing-function-docstring,redefined-outer-name
+        job_data = await database_sync_to_async(_setup_nodes)()
+        hedging._budget = hedging.HedgeBudget(ratio=0)  # pylint: disable=protected-access
+        with patch("computing.hedging.hedge_delay", new=AsyncMock(return_value=0.1)):
+            await hedging.offer(job_data)
+            first = hedge_state.send.await_args.args[0].removeprefix("channel-")
+            await database_sync_to_async(Job.objects.filter(id=job_data["task_id"]).update)(
+                status="RUNNING", node=await database_sync_to_async(Node.objects.get)(node_id=first),
+            )
+            await sync_to_async(get_presence().remove)(first)
+            await asyncio.sleep(0.3)
+        assert hedge_state.send.await_count == 2
+        job = await database_sync_to_async(Job.objects.get)(id=job_data["task_id"])
+        assert job.status == "PENDING" and job.node_id is None
+
+    async def test_disconnect_redispatches_targeted_jobs(self, hedge_state):  # pylint: disable=missing-function-docstring,redefined-outer-name
+        job_data = await database_sync_to_async(_setup_nodes)()
+        fast = await database_sync_to_async(Node.objects.get)(node_id="fast")
+        await database_sync_to_async(Job.objects.filter(id=job_data["task_id"]).update)(
+            status="RUNNING", node=fast,
+        )
+        consumer = GPUConsumer()
+        consumer.channel_layer = MagicMock(group_discard=AsyncMock())
+        consumer.channel_name, consumer.group_name = "channel-fast", "gpu_nodes"
+        consumer.node_id, consumer.agent_token_id, consumer.provider_user_id = "fast", None, None
+        consumer.resume_token, consumer.in_flight = None, set()
+        consumer.targeted = {job_data["task_id"]}
+        consumer._mark_node_inactive = AsyncMock()  # pylint: disable=protected-access
+        consumer._broadcast_dashboard_update = AsyncMock()  # pylint: disable=protected-access
+        # Prefer the departing node, so only its absence from presence steers the job away
+        await database_sync_to_async(record_result)(fast, "llama3", 0, 100)
+        slow = await database_sync_to_async(Node.objects.get)(node_id="slow")
+        await database_sync_to_async(record_result)(slow, "llama3", 0, 9000)
+        with patch("computing.hedging.hedge_delay", new=AsyncMock(return_value=60)):
+            await consumer.disconnect(1000)
+        assert hedge_state.send.await_args.args[0] == "channel-slow"
+        job = await database_sync_to_async(Job.objects.get)(id=job_data["task_id"])
+        assert job.status == "PENDING" and job.node_id is None
+
+    async def test_failed_attempt_waits_for_the_other(self, hedge_state):  # pylint: disable=missing-function-docstring,redefined-outer-name
+        job_data = await database_sync_to_async(_setup_nodes)()
+        job_id = job_data["task_id"]
+        assert not await hedging.hold_failure(job_id, "fast", {"error": "oom"})
+        await database_sync_to_async(Job.objects.filter(id=job_id).update)(hedged_at=timezone.now())
+
+        assert await hedging.hold_failure(job_id, "fast", {"error": "oom"})
+        # A replayed result from the same node keeps waiting
+        assert await hedging.hold_failure(job_id, "fast", {"error": "oom"})
+        job = await database_sync_to_async(Job.objects.get)(id=job_id)
+        assert job.status == "PENDING"
+        assert job.result == {"failed_attempt": {"node": "fast", "error": "oom"}}
+        assert not await hedging.hold_failure(job_id, "slow", {"error": "oom"})
+
+    async def test_failed_result_leaves_hedged_twin_running(self, hedge_state):  # pylint: disable=missing-function-docstring,redefined-outer-name
+        job_data = await database_sync_to_async(_setup_nodes)()
+        job_id = job_data["task_id"]
+        await database_sync_to_async(Job.objects.filter(id=job_id).update)(hedged_at=timezone.now())
+
+        def node_consumer(node_id):
+            consumer = GPUConsumer()
+            consumer.node_id, consumer.provider_user_id = node_id, None
+            consumer.in_flight, consumer.targeted = set(), set()
+            consumer.encoding, consumer.capabilities = "json", frozenset()
+            consumer._broadcast_dashboard_update = AsyncMock()  # pylint: disable=protected-access
+            consumer._notify_job_completion = AsyncMock()  # pylint: disable=protected-access
+            return consumer
+
+        failed = {"type": "job_result", "result": {"task_id": job_id, "status": "failed", "error": "oom"}}
+        await node_consumer("fast").receive(text_data=json.dumps(failed))
+        job = await database_sync_to_async(Job.objects.get)(id=job_id)
+        assert job.status == "PENDING"
+        hedge_state.group_send.assert_not_awaited()
+
+        done = {"type": "job_result", "result": {"task_id": job_id, "status": "success", "response": "ok"}}
+        await node_consumer("slow").receive(text_data=json.dumps(done))
+        job = await database_sync_to_async(Job.objects.get)(id=job_id)
+        assert job.status == "COMPLETED" and job.result == {"output": "ok"}
+        hedge_state.group_send.assert_awaited_once_with(
+            "gpu_nodes", {"type": "job_cancel", "task_id": job_id},
+        )
+
+    async def test_accepted_node_beaten_by_its_hedge_is_scored_slow(self, hedge_state):  # pylint: disable=missing-function-docstring,redefined-outer-name
+        job_data = await database_sync_to_async(_setup_nodes)()
+        job_id = job_data["task_id"]
+        fast = await database_sync_to_async(Node.objects.get)(node_id="fast")
+        await database_sync_to_async(Job.objects.filter(id=job_id).update)(status="RUNNING", node=fast)
+        # Not hedged: nobody lost
+        await hedging.record_loser(job_id, "slow")
+        assert not await database_sync_to_async(NodeModelStats.objects.exists)()
+
+        await database_sync_to_async(Job.objects.filter(id=job_id).update)(hedged_at=timezone.now())
+        await hedging.record_loser(job_id, "fast")
+        assert not await database_sync_to_async(NodeModelStats.objects.exists)()
+        await hedging.record_loser(job_id, "slow")
+        stats = await database_sync_to_async(NodeModelStats.objects.get)(node__node_id="fast")
+        assert stats.duration_ms == FAILURE_PENALTY_MS
+
+    async def test_hedged_job_losers_are_cancelled(self, hedge_state):  # pylint: disable=missing-function-docstring,redefined-outer-name
+        job_data = await database_sync_to_async(_setup_nodes)()
+        await hedging.cancel_losers(job_data["task_id"])
+        hedge_state.group_send.assert_not_awaited()
+        await database_sync_to_async(
+            Job.objects.filter(id=job_data["task_id"]).update,
+        )(hedged_at=timezone.now())
+        await hedging.cancel_losers(job_data["task_id"])
+        hedge_state.group_send.assert_awaited_once_with(
+            "gpu_nodes", {"type": "job_cancel", "task_id": job_data["task_id"]},
+        )
+
+
+@pytest.mark.django_db
+class TestHedgeDelayAndStats:
+    """Tests for hedge_delay and stats."""
+
+    def setup_method(self):
+        self.user = User.objects.create_user(username="stats_user", password="p")
+
+    def _completed(self, seconds, model="llama3", hedged=False):
+        now = timezone.now()
+        job = Job.objects.create(
+            user=self.user, task_type="inference", status="COMPLETED",
+            input_data={"prompt": "hi", "model": model}, completed_at=now,
+            hedged_at=now if hedged else None,
+        )
+        Job.objects.filter(pk=job.pk).update(created_at=now - timedelta(seconds=seconds))
+        return job
+
+    def test_delay_is_model_percentile(self, hedge_state, settings):  # pylint: disable=missing-function-docstring,redefined-outer-name,unused-argument
+        settings.HEDGE_PERCENTILE = 90
+        for seconds in range(1, 31):
+            self._completed(seconds)
+        assert round(async_to_sync(hedging.hedge_delay)("llama3")) == 27
+        assert async_to_sync(hedging.hedge_delay)("mistral") == hedging.HEDGE_DEFAULT_DELAY
+
+    def test_stats_compare_p99_with_holdout(self, hedge_state, monkeypatch):  # pylint: disable=missing-function-docstring,redefined-outer-name,unused-argument
+        jobs = {seconds: self._completed(seconds, hedged=seconds == 3) for seconds in (1, 2, 3, 4, 40, 45)}
+        holdout = {jobs[40].id, jobs[45].id}
+        monkeypatch.setattr(hedging, "is_holdout", lambda job_id: job_id in holdout)
+        assert hedging.stats() == {
+            "enabled": True,
+            "hedged_jobs": 1,
+            "p99_ms": 4000,
+            "holdout_p99_ms": 45000,
+            "p99_improvement_ms": 41000,
+        }
+
+    def test_stats_disabled(self, settings):  # pylint: disable=missing-function-docstring
+        settings.HEDGE_ENABLED = False
+        assert hedging.stats() == {"enabled": False}
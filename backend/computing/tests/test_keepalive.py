@@ -0,0 +1,86 @@
+"""
+Test Suite: Keep-alive Scheduler
+Covers: bucket spreading, pings, batched heartbeats and last_used bumps
+"""
+import pytest
+from channels.db import database_sync_to_async
+
+from computing import keepalive
+from computing.heartbeats import HeartbeatBuffer
+from computing.keepalive import KeepAliveScheduler
+from core.models import LAST_USED_RESOLUTION, AgentToken, User
+
+
+class FakeConnection:
+    """Stands in for a GPUConsumer."""
+
+    def __init__(self, node_id="unknown", agent_token_id=None):
+        self.node_id = node_id
+        self.channel_name = f"channel.{node_id}"
+        self.agent_token_id = agent_token_id
+        self.draining = False
+        self.sent = []
+        self.revoked = False
+
+    async def send(self, text):  # pylint: disable=missing-function-docstring
+        self.sent.append(text)
+
+    async def token_revoked(self, event):  # pylint: disable=missing-function-docstring,unused-argument
+        self.revoked = True
+
+
+class TestBuckets:
+    """Tests for spreading connections over buckets."""
+
+    async def test_connections_are_spread_evenly(self):  # pylint: disable=missing-function-docstring
+        scheduler = KeepAliveScheduler(buckets=4)
+        connections = [FakeConnection() for _ in range(8)]
+        for connection in connections:
+            scheduler.add(connection)
+        assert len(scheduler) == 8
+        assert [len(bucket) for bucket in scheduler._buckets] == [2, 2, 2, 2]  # pylint: disable=protected-access
+
+        scheduler.remove(connections[0])
+        assert len(scheduler) == 7
+        scheduler._task.cancel()  # pylint: disable=protected-access
+
+
+@pytest.mark.django_db(transaction=True)
+class TestTick:
+    """Tests for the work done on each tick."""
+
+    async def test_tick_pings_and_heartbeats_without_token_queries(  # pylint: disable=missing-function-docstring
+        self, monkeypatch
+    ):
+        buffer = HeartbeatBuffer()
+        monkeypatch.setattr(keepalive, 'heartbeat_buffer', buffer)
+        monkeypatch.setattr(keepalive, '_mark_tokens_used', None)
+        user = await database_sync_to_async(User.objects.create_user)(username='ka_user', password='p')
+        token, _ = await database_sync_to_async(AgentToken.generate)(user)
+
+        ok = FakeConnection("ka-1", token.id)
+        other = FakeConnection("ka-2", token.id)
+        anonymous = FakeConnection()
+        await KeepAliveScheduler().tick([ok, other, anonymous])
+
+        assert all(c.sent == ['{"type": "ping"}'] for c in (ok, other, anonymous))
+        assert not ok.revoked
+        assert buffer._pending == {"ka-1": "channel.ka-1", "ka-2": "channel.ka-2"}  # pylint: disable=protected-access
+
+    async def test_tick_bumps_stale_last_used_once_per_resolution(  # pylint: disable=missing-function-docstring
+        self, monkeypatch
+    ):
+        user = await database_sync_to_async(User.objects.create_user)(username='ka_used', password='p')
+        token, _ = await database_sync_to_async(AgentToken.generate)(user)
+        scheduler = KeepAliveScheduler()
+        await scheduler.tick([FakeConnection("ka-3", token.id)])
+        await database_sync_to_async(token.refresh_from_db)()
+        assert token.last_used is None
+
+        monkeypatch.setattr(
+            keepalive.time, 'monotonic',
+            lambda: scheduler._last_used_flushed + LAST_USED_RESOLUTION.total_seconds(),  # pylint: disable=protected-access
+        )
+        await scheduler.tick([FakeConnection("ka-3", token.id)])
+        await database_sync_to_async(token.refresh_from_db)()
+        assert token.last_used is not None
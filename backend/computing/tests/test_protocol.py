@@ -0,0 +1,84 @@
+"""
+Test Suite: Agent Wire Protocol
+Covers: version/capability and encoding negotiation, JSON/zlib/msgpack framing
+"""
+import pytest
+
+from computing import protocol
+from computing.protocol import (
+    COMPRESS_MIN_BYTES, PROTOCOL_VERSION, decode, encode, negotiate,
+    negotiate_capabilities,
+)
+
+
+class TestCapabilities:
+    """Tests for the protocol version and capability handshake."""
+
+    def test_legacy_register_gets_no_capabilities(self):  # pylint: disable=missing-function-docstring
+        assert negotiate_capabilities({"capabilities": ["compression"]}) == (2, frozenset())
+
+    def test_common_capabilities_are_enabled(self):  # pylint: disable=missing-function-docstring
+        version, capabilities = negotiate_capabilities({
+            "protocol_version": PROTOCOL_VERSION,
+            "capabilities": ["compression", "unknown-feature"],
+        })
+        assert version == PROTOCOL_VERSION
+        assert capabilities == {"compression"}
+
+    def test_newer_agent_is_served_the_server_version(self):  # pylint: disable=missing-function-docstring
+        version, _ = negotiate_capabilities({"protocol_version": PROTOCOL_VERSION + 5})
+        assert version == PROTOCOL_VERSION
+
+    def test_garbage_version_is_treated_as_legacy(self):  # pylint: disable=missing-function-docstring
+        assert negotiate_capabilities({"protocol_version": "v3"})[0] == 2
+
+
+class TestNegotiation:
+    """Tests for picking an encoding from the agent's offer."""
+
+    def test_first_supported_offer_wins(self):  # pylint: disable=missing-function-docstring
+        assert negotiate(["brotli", "zlib", "json"]) == "zlib"
+
+    def test_missing_offer_falls_back_to_json(self):  # pylint: disable=missing-function-docstring
+        assert negotiate(None) == "json"
+        assert negotiate(["brotli"]) == "json"
+
+    def test_msgpack_requires_the_package(self, monkeypatch):  # pylint: disable=missing-function-docstring
+        monkeypatch.setattr(protocol, 'msgpack', None)
+        assert negotiate(["msgpack", "zlib"]) == "zlib"
+
+
+class TestFraming:
+    """Tests for encoding and decoding frames."""
+
+    def test_json_is_always_text(self):  # pylint: disable=missing-function-docstring
+        message = {"type": "job_result", "result": {"response": "y" * 5000}}
+        text, data = encode(message, "json")
+        assert data is None
+        assert decode(text, None, "json") == message
+
+    def test_zlib_compresses_only_large_messages(self):  # pylint: disable=missing-function-docstring
+        small = {"type": "pong"}
+        assert encode(small, "zlib") == ('{"type": "pong"}', None)
+
+        large = {"type": "job_result", "result": {"response": "y" * COMPRESS_MIN_BYTES}}
+        text, data = encode(large, "zlib")
+        assert text is None
+        assert len(data) < COMPRESS_MIN_BYTES
+        assert decode(None, data, "zlib") == large
+
+    def test_msgpack_round_trip(self):  # pylint: disable=missing-function-docstring
+        pytest.importorskip("msgpack")
+        message = {"type": "job_result", "result": {"task_id": 3, "response": "ok"}}
+        text, data = encode(message, "msgpack")
+        assert text is None
+        assert decode(None, data, "msgpack") == message
+
+    def test_text_frames_are_json_under_any_encoding(self):  # pylint: disable=missing-function-docstring
+        assert decode('{"type": "pong"}', None, "msgpack") == {"type": "pong"}
+
+    def test_malformed_binary_frame_raises_value_error(self):  # pylint: disable=missing-function-docstring
+        with pytest.raises(ValueError):
+            decode(None, b"not zlib", "zlib")
+        with pytest.raises(ValueError):
+            decode(None, b"\x00", "json")
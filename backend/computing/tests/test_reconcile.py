@@ -0,0 +1,127 @@
+"""
+Test Suite: Job Reconciliation
+Covers: reconcile_jobs re-offer/fail rules, the management command, the startup hook
+"""
+import asyncio
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from computing import presence, reconcile
+from computing.models import Job, Node
+from computing.tasks import reconcile_jobs
+from core.models import User
+from payments.models import Hold
+from payments.services import EscrowService
+
+
+@pytest.mark.django_db
+class TestReconcileJobs:
+    """Tests for the reconcile_jobs task."""
+
+    def setup_method(self):
+        self.user = User.objects.create_user(
+            username="reconcile_user", password="p", wallet_balance=Decimal("10.00"),
+        )
+        self.layer = MagicMock(group_send=AsyncMock())
+
+    def _job(self, status, age):
+        job = Job.objects.create(
+            user=self.user, task_type="inference", status=status,
+            input_data={"prompt": "hi", "model": "llama3"},
+        )
+        Job.objects.filter(pk=job.pk).update(created_at=timezone.now() - age)
+        return job
+
+    def _run(self, **kwargs):
+        with patch("computing.dispatch.get_channel_layer", return_value=self.layer):
+            return reconcile_jobs(**kwargs)
+
+    def test_orphaned_jobs_are_reset_and_offered(self):  # pylint: disable=missing-function-docstring
+        running = self._job("RUNNING", timedelta(minutes=5))
+        pending = self._job("PENDING", timedelta(minutes=15))
+        young = self._job("PENDING", timedelta(seconds=5))
+        self._job("COMPLETED", timedelta(minutes=5))
+
+        summary = self._run(batch_size=1)
+
+        assert summary.startswith("Re-offered 2 job(s)")
+        offered = [c.args[1]["job_data"]["task_id"] for c in self.layer.group_send.await_args_list]
+        assert offered == [running.id, pending.id]
+        running.refresh_from_db()
+        assert running.status == "PENDING"
+        young.refresh_from_db()
+        assert young.status == "PENDING"
+
+    def test_pending_job_a_legacy_node_may_be_running_is_left_alone(self):  # pylint: disable=missing-function-docstring
+        recent = self._job("PENDING", timedelta(minutes=5))
+
+        assert self._run().startswith("Re-offered 0 job(s)")
+        self.layer.group_send.assert_not_awaited()
+        assert self._run(pending_seconds=60).startswith("Re-offered 1 job(s)")
+        assert self.layer.group_send.await_args.args[1]["job_data"]["task_id"] == recent.id
+
+    def test_running_job_is_left_with_its_present_node(self, monkeypatch):  # pylint: disable=missing-function-docstring
+        monkeypatch.setattr(presence, "_presence", presence.MemoryPresence())
+        served = self._job("RUNNING", timedelta(minutes=5))
+        stranded = self._job("RUNNING", timedelta(minutes=5))
+        for job, node_id in ((served, "served-node"), (stranded, "gone-node")):
+            node = Node.objects.create(owner=self.user, node_id=node_id, name=node_id, is_active=True)
+            Job.objects.filter(pk=job.pk).update(node=node)
+        # The node may be connected to another web process; presence is shared
+        presence.get_presence().touch({"served-node": "other-process-channel"})
+
+        assert self._run().startswith("Re-offered 1 job(s)")
+
+        offered = [c.args[1]["job_data"]["task_id"] for c in self.layer.group_send.await_args_list]
+        assert offered == [stranded.id]
+        served.refresh_from_db()
+        assert served.status == "RUNNING" and served.node.node_id == "served-node"
+        stranded.refresh_from_db()
+        assert stranded.status == "PENDING" and stranded.node is None
+
+    def test_expired_jobs_are_failed_and_refunded(self):  # pylint: disable=missing-function-docstring
+        held = self._job("RUNNING", timedelta(hours=2))
+        EscrowService.reserve(self.user, held, Decimal("1.00"))
+        Hold.objects.filter(job=held).update(created_at=timezone.now() - timedelta(hours=2))
+        unheld = self._job("PENDING", timedelta(hours=2))
+
+        self._run()
+
+        for job in (held, unheld):
+            job.refresh_from_db()
+            assert job.status == "FAILED"
+        assert Hold.objects.get(job=held).status == "RELEASED"
+        self.layer.group_send.assert_not_awaited()
+
+    def test_absent_nodes_are_marked_inactive(self):  # pylint: disable=missing-function-docstring
+        node = Node.objects.create(owner=self.user, node_id="ghost-node", name="Ghost", is_active=True)
+        assert "1 node(s) inactive" in self._run()
+        node.refresh_from_db()
+        assert not node.is_active
+
+    def test_command_prints_summary(self):  # pylint: disable=missing-function-docstring
+        self._job("PENDING", timedelta(minutes=15))
+        out = StringIO()
+        with patch("computing.dispatch.get_channel_layer", return_value=self.layer):
+            call_command("reconcile_jobs", "--lease", "60", stdout=out)
+        assert out.getvalue().startswith("Re-offered 1 job(s)")
+
+
+class TestStartupReconcile:
+    """Tests for the ASGI startup hook."""
+
+    async def test_reconciles_once_after_first_connection(self):  # pylint: disable=missing-function-docstring
+        app = AsyncMock()
+        wrapper = reconcile.StartupReconcile(app, delay=0)
+        with patch("computing.reconcile.reconcile_jobs", return_value="done") as task:
+            await wrapper({"type": "http"}, None, None)
+            await wrapper({"type": "http"}, None, None)
+            await asyncio.sleep(0.1)
+        assert app.await_count == 2
+        task.assert_called_once()
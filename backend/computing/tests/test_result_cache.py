@@ -0,0 +1,77 @@
+"""
+Test Suite: Result Cache
+Covers: cache keys, LRU size eviction, TTL expiry, hit/miss counters, filling on completion
+"""
+from decimal import Decimal
+
+import pytest
+from asgiref.sync import async_to_sync
+
+from computing import result_cache
+from computing.consumers import GPUConsumer
+from computing.models import Job
+from computing.result_cache import MemoryResultCache, cache_key
+from core.models import User
+
+
+class TestCacheKey:
+    """Tests for cache_key."""
+
+    def test_option_order_does_not_matter(self):  # pylint: disable=missing-function-docstring
+        assert cache_key("m", "p", {"a": 1, "b": 2}) == cache_key("m", "p", {"b": 2, "a": 1})
+
+    def test_every_field_counts(self):  # pylint: disable=missing-function-docstring
+        base = cache_key("m", "p", {"a": 1})
+        assert base != cache_key("m2", "p", {"a": 1})
+        assert base != cache_key("m", "p2", {"a": 1})
+        assert base != cache_key("m", "p", {"a": 2})
+        assert cache_key("m", "p") == cache_key("m", "p", {})
+
+
+class TestMemoryResultCache:
+    """Tests for the in-process LRU."""
+
+    def test_least_recently_used_is_evicted_by_size(self):  # pylint: disable=missing-function-docstring
+        cache = MemoryResultCache(max_bytes=10, ttl=60)
+        cache.put("a", "aaaa")
+        cache.put("b", "bbbb")
+        assert cache.get("a") == "aaaa"  # a is now most recent
+        cache.put("c", "cccc")
+        assert cache.get("b") is None
+        assert cache.get("a") == "aaaa"
+        assert cache.stats() == {"hits": 2, "misses": 1, "entries": 2, "bytes": 8}
+
+    def test_oversized_output_is_not_stored(self):  # pylint: disable=missing-function-docstring
+        cache = MemoryResultCache(max_bytes=3, ttl=60)
+        cache.put("a", "toolong")
+        assert cache.get("a") is None
+
+    def test_expired_entries_miss(self):  # pylint: disable=missing-function-docstring
+        cache = MemoryResultCache(max_bytes=100, ttl=-1)
+        cache.put("a", "x")
+        assert cache.get("a") is None
+        assert cache.stats()["bytes"] == 0
+
+
+@pytest.mark.django_db
+class TestCacheFill:
+    """Completed opted-in jobs fill the cache."""
+
+    def test_completion_stores_output(  # pylint: disable=missing-function-docstring
+        self, monkeypatch, django_capture_on_commit_callbacks
+    ):
+        cache = MemoryResultCache(max_bytes=100, ttl=60)
+        monkeypatch.setattr(result_cache, "_cache", cache)
+        user = User.objects.create_user(username="fill_user", password="p")
+        cached = Job.objects.create(
+            user=user, task_type="inference", cost=Decimal("1.00"),
+            input_data={"model": "m", "prompt": "p", "cache_key": "k1"},
+        )
+        plain = Job.objects.create(
+            user=user, task_type="inference", input_data={"model": "m", "prompt": "q"},
+        )
+        with django_capture_on_commit_callbacks(execute=True):
+            async_to_sync(GPUConsumer()._complete_job)(cached.id, {"output": "answer"}, None)
+            async_to_sync(GPUConsumer()._complete_job)(plain.id, {"output": "other"}, None)
+        assert cache.get("k1") == "answer"
+        assert cache.stats()["entries"] == 1
@@ -0,0 +1,143 @@
+"""
+Test Suite: Latency-Aware Node Scoring
+Covers: EWMA updates, failure penalties, fastest-node choice and exploration, timings from
+job results, the admin endpoint
+"""
+import pytest
+from asgiref.sync import async_to_sync
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from computing import scoring
+from computing.consumers import GPUConsumer
+from computing.models import Job, Node, NodeModelStats
+from computing.scoring import (
+    EWMA_ALPHA, FAILURE_PENALTY_FACTOR, FAILURE_PENALTY_MS, fastest_node, record_failure,
+    record_result,
+)
+from core.models import User
+
+
+@pytest.mark.django_db
+class TestScoring:
+    """Tests for record_result and fastest_node."""
+
+    def setup_method(self):
+        self.provider = User.objects.create_user(username="scoring_provider", password="p")
+        self.nodes = {
+            node_id: Node.objects.create(
+                node_id=node_id, owner=self.provider, name=node_id, is_active=True,
+                gpu_info={"models": ["llama3"]},
+            )
+            for node_id in ("quick", "sluggish", "fresh")
+        }
+
+    def test_first_result_sets_the_averages(self):  # pylint: disable=missing-function-docstring
+        stats = record_result(self.nodes["quick"], "llama3", 100, 2000, 300)
+        assert (stats.queue_ms, stats.duration_ms, stats.first_token_ms) == (100, 2000, 300)
+        assert stats.samples == 1 and stats.expected_ms == 2100
+
+    def test_later_results_are_blended(self):  # pylint: disable=missing-function-docstring
+        record_result(self.nodes["quick"], "llama3", 100, 2000, 300)
+        stats = record_result(self.nodes["quick"], "llama3", 600, 1000, None)
+        assert stats.queue_ms == pytest.approx(100 + EWMA_ALPHA * 500)
+        assert stats.duration_ms == pytest.approx(2000 - EWMA_ALPHA * 1000)
+        assert stats.first_token_ms == 300  # no sample: unchanged
+        assert NodeModelStats.objects.get(node=self.nodes["quick"], model="llama3").samples == 2
+
+    def test_models_are_scored_separately(self):  # pylint: disable=missing-function-docstring
+        record_result(self.nodes["quick"], "llama3", 0, 1000)
+        record_result(self.nodes["quick"], "mistral", 0, 9000)
+        assert NodeModelStats.objects.filter(node=self.nodes["quick"]).count() == 2
+
+    def test_fastest_node_has_lowest_expected_time(self):  # pylint: disable=missing-function-docstring
+        record_result(self.nodes["quick"], "llama3", 50, 1000)
+        record_result(self.nodes["sluggish"], "llama3", 5000, 1000)
+        nodes = [self.nodes["quick"], self.nodes["sluggish"]]
+        assert fastest_node(nodes, "llama3") == self.nodes["quick"]
+
+    def test_unmeasured_node_scores_the_model_median(self, monkeypatch):  # pylint: disable=missing-function-docstring
+        monkeypatch.setattr(scoring, "EXPLORATION_RATE", 0)
+        record_result(self.nodes["quick"], "llama3", 0, 1000)
+        record_result(self.nodes["sluggish"], "llama3", 0, 9000)
+        assert fastest_node(self.nodes.values(), "llama3") == self.nodes["quick"]
+        nodes = [self.nodes["sluggish"], self.nodes["fresh"]]
+        assert fastest_node(nodes, "llama3") == self.nodes["fresh"]  # 5000 < 9000
+
+    def test_exploration_tries_an_unmeasured_node(self, monkeypatch):  # pylint: disable=missing-function-docstring
+        record_result(self.nodes["quick"], "llama3", 0, 1000)
+        record_result(self.nodes["sluggish"], "llama3", 0, 9000)
+        monkeypatch.setattr(scoring.random, "random", lambda: 0.0)
+        assert fastest_node(self.nodes.values(), "llama3") == self.nodes["fresh"]
+        monkeypatch.setattr(scoring.random, "random", lambda: 0.99)
+        assert fastest_node(self.nodes.values(), "llama3") == self.nodes["quick"]
+
+    def test_failure_is_a_penalty_run(self):  # pylint: disable=missing-function-docstring
+        stats = record_failure(self.nodes["fresh"], "llama3")
+        assert stats.duration_ms == FAILURE_PENALTY_MS and stats.samples == 1
+        record_result(self.nodes["quick"], "llama3", 0, 1000)
+        record_result(self.nodes["sluggish"], "llama3", 0, 2000)
+        stats = record_failure(self.nodes["quick"], "llama3")
+        # Median of 1000, 2000 and 60000 is 2000
+        assert stats.duration_ms == pytest.approx(
+            1000 + EWMA_ALPHA * (2000 * FAILURE_PENALTY_FACTOR - 1000),
+        )
+
+    def test_no_nodes(self):  # pylint: disable=missing-function-docstring
+        assert fastest_node([], "llama3") is None
+
+
+@pytest.mark.django_db
+class TestRecordTimings:
+    """Tests for GPUConsumer._record_timings."""
+
+    def setup_method(self):
+        provider = User.objects.create_user(username="timing_provider", password="p")
+        self.node = Node.objects.create(node_id="timing-node", owner=provider, name="GPU")
+        self.job = Job.objects.create(
+            user=provider, task_type="inference", input_data={"prompt": "hi", "model": "llama3"},
+        )
+        self.consumer = GPUConsumer()
+        self.consumer.node_id = "timing-node"
+
+    def _record(self, result):
+        async_to_sync(self.consumer._record_timings)(self.job.id, result)  # pylint: disable=protected-access
+
+    def test_result_timings_are_recorded(self):  # pylint: disable=missing-function-docstring
+        self._record({"status": "success", "duration_ms": 1500, "queue_wait_ms": 20, "first_token_ms": 90})
+        stats = NodeModelStats.objects.get(node=self.node, model="llama3")
+        assert (stats.queue_ms, stats.first_token_ms, stats.duration_ms) == (20, 90, 1500)
+
+    def test_results_without_timings_are_ignored(self):  # pylint: disable=missing-function-docstring
+        self._record({"status": "success"})
+        self._record({"status": "success", "duration_ms": "slow"})
+        assert not NodeModelStats.objects.exists()
+
+    def test_failed_result_is_a_penalty(self):  # pylint: disable=missing-function-docstring
+        self._record({"status": "failed", "error": "out of memory"})
+        stats = NodeModelStats.objects.get(node=self.node, model="llama3")
+        assert stats.duration_ms == FAILURE_PENALTY_MS
+
+
+@pytest.mark.django_db
+class TestNodeModelStatsView:
+    """Tests for GET /api/computing/node-stats/."""
+
+    def test_admin_sees_scores_fastest_first(self):  # pylint: disable=missing-function-docstring
+        provider = User.objects.create_user(username="view_provider", password="p")
+        for node_id, duration in (("slow-gpu", 9000), ("fast-gpu", 1000)):
+            node = Node.objects.create(node_id=node_id, owner=provider, name=node_id)
+            record_result(node, "llama3", 0, duration)
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(
+            username="admin", password="p", is_staff=True,
+        ))
+        resp = client.get(reverse("node-stats"))
+        assert resp.status_code == 200
+        assert [row["node_id"] for row in resp.data] == ["fast-gpu", "slow-gpu"]
+        assert resp.data[0]["expected_ms"] == 1000 and resp.data[0]["samples"] == 1
+
+    def test_non_admin_is_forbidden(self):  # pylint: disable=missing-function-docstring
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username="plain", password="p"))
+        assert client.get(reverse("node-stats")).status_code == 403
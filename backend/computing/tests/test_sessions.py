@@ -0,0 +1,139 @@
+"""
+Test Suite: Session Resumption
+Covers: parked sessions, grace-period re-dispatch, resume over the WebSocket
+"""
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+
+from computing import sessions
+from computing.consumers import GPUConsumer
+from computing.models import Job, Node
+from core.models import AgentToken, User
+
+
+@pytest.fixture(name="store")
+def _store(monkeypatch):
+    store = sessions.MemorySessions()
+    monkeypatch.setattr(sessions, "_sessions", store)
+    return store
+
+
+class TestMemorySessions:
+    """Tests for the in-process session store."""
+
+    def test_claim_returns_parked_jobs_once(self):  # pylint: disable=missing-function-docstring
+        store = sessions.MemorySessions()
+        store.park("node-a", "tok", [1, 2])
+        assert store.claim("node-a", "tok") == [1, 2]
+        assert store.claim("node-a", "tok") is None
+
+    def test_claim_requires_matching_node(self):  # pylint: disable=missing-function-docstring
+        store = sessions.MemorySessions()
+        store.park("node-a", "tok", [1])
+        assert store.claim("node-b", "tok") is None
+        assert store.claim("node-a", "tok") == [1]
+
+
+@pytest.mark.django_db(transaction=True)
+class TestGracePeriod:
+    """Tests for parked sessions that are not resumed."""
+
+    async def test_unclaimed_jobs_are_redispatched(self, store):  # pylint: disable=missing-function-docstring
+        @database_sync_to_async
+        def make_jobs():
+            user = User.objects.create_user(username="grace_owner", password="p")
+            pending = Job.objects.create(user=user, task_type="inference", input_data={})
+            done = Job.objects.create(
+                user=user, task_type="inference", input_data={}, status="COMPLETED",
+            )
+            return pending.id, done.id
+
+        pending_id, done_id = await make_jobs()
+        layer = MagicMock(group_send=AsyncMock())
+        with patch("computing.dispatch.get_channel_layer", return_value=layer):
+            await sessions.park_session("node-a", "tok", [pending_id, done_id], grace=0)
+            await asyncio.sleep(0.2)
+        layer.group_send.assert_awaited_once()
+        assert layer.group_send.await_args[0][1]["job_data"]["task_id"] == pending_id
+        assert store.claim("node-a", "tok") is None
+
+    async def test_resumed_session_is_not_redispatched(self, store):  # pylint: disable=missing-function-docstring
+        layer = MagicMock(group_send=AsyncMock())
+        with patch("computing.dispatch.get_channel_layer", return_value=layer):
+            await sessions.park_session("node-a", "tok", [1], grace=0.1)
+            assert await sessions.resume_session("node-a", "tok") == [1]
+            await asyncio.sleep(0.2)
+        layer.group_send.assert_not_awaited()
+
+    async def test_jobs_the_node_accepted_are_released(self, store):  # pylint: disable=missing-function-docstring,unused-argument
+        @database_sync_to_async
+        def make_jobs():
+            user = User.objects.create_user(username="grace_provider", password="p")
+            ids = []
+            for node_id in ("node-a", "node-b"):
+                node = Node.objects.create(node_id=node_id, owner=user, name=node_id)
+                ids.append(Job.objects.create(
+                    user=user, task_type="inference", input_data={}, status="RUNNING", node=node,
+                ).id)
+            return ids
+
+        mine, taken_elsewhere = await make_jobs()
+        layer = MagicMock(group_send=AsyncMock())
+        with patch("computing.dispatch.get_channel_layer", return_value=layer):
+            await sessions.park_session("node-a", "tok", [mine, taken_elsewhere], grace=0)
+            await asyncio.sleep(0.2)
+        layer.group_send.assert_awaited_once()
+        assert layer.group_send.await_args[0][1]["job_data"]["task_id"] == mine
+        job = await database_sync_to_async(Job.objects.get)(id=mine)
+        assert job.status == "PENDING" and job.node_id is None
+
+
+@pytest.mark.django_db(transaction=True)
+class TestResumeOverWebSocket:
+    """A reconnecting node gets its in-flight jobs back."""
+
+    async def _register(self, raw, resume_token=None):
+        communicator = WebsocketCommunicator(GPUConsumer.as_asgi(), "/ws/computing/")
+        await communicator.connect()
+        await communicator.send_json_to({
+            "type": "register",
+            "node_id": "resume-node",
+            "gpu_info": {"models": []},
+            "auth_token": raw,
+            "protocol_version": 3,
+            "capabilities": ["resume"],
+            "resume_token": resume_token,
+        })
+        return communicator, await communicator.receive_json_from(timeout=5)
+
+    async def test_reconnect_rebinds_in_flight_jobs(self, store):  # pylint: disable=missing-function-docstring
+        from channels.layers import get_channel_layer
+
+        @database_sync_to_async
+        def setup():
+            provider = User.objects.create_user(username="resume_provider", password="p")
+            owner = User.objects.create_user(username="resume_owner", password="p")
+            job = Job.objects.create(user=owner, task_type="inference", input_data={})
+            return AgentToken.generate(provider, label="ws")[1], owner.id, job.id
+
+        raw, owner_id, job_id = await setup()
+        communicator, registered = await self._register(raw)
+        token = registered["resume_token"]
+        assert registered["resumed"] == []
+
+        await get_channel_layer().group_send("gpu_nodes", {
+            "type": "job_dispatch",
+            "job_data": {"task_id": job_id, "owner_id": owner_id, "model": "m", "prompt": "p"},
+        })
+        await communicator.receive_json_from(timeout=5)
+        await communicator.disconnect()
+        await asyncio.sleep(0.1)
+
+        communicator, registered = await self._register(raw, resume_token=token)
+        assert registered["resumed"] == [job_id]
+        assert registered["resume_token"] != token
+        await communicator.disconnect()
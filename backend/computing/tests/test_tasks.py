@@ -7,6 +7,8 @@ from django.test import TestCase
 from django.utils import timezone
 
 from computing.models import Job, Node
+from computing.presence import get_presence
+from computing.scoring import record_result
 from computing.tasks import find_node_for_job
 
 User = get_user_model()
@@ -21,38 +23,66 @@ class FindNodeForJobTests(TestCase):
             username="taskuser", password="p",
             wallet_balance=Decimal("100.00"),
         )
+        self.provider = User.objects.create_user(
+            username="taskprovider", password="p",
+        )
         self.node = Node.objects.create(
-            owner=self.user,
+            owner=self.provider,
             node_id="task-node-1",
             name="Task Node",
             gpu_info={"models": ["llama2"]},
             is_active=True,
             last_heartbeat=timezone.now(),
         )
+        get_presence().touch({"task-node-1": "test-channel"})
 
-    def test_assigns_pending_job_to_node(self):
-        """find_node_for_job assigns a PENDING job to an active node."""
-        job = Job.objects.create(
+    def _job(self, status="PENDING", model="llama2"):
+        return Job.objects.create(
             user=self.user, task_type="inference",
-            input_data={"prompt": "hello"}, status="PENDING",
+            input_data={"prompt": "hello", "model": model}, status=status,
         )
+
+    def _find(self, job_id):
         with patch("computing.tasks.get_channel_layer") as mock_cl:
             mock_layer = MagicMock()
-            mock_layer.group_send = AsyncMock()
+            mock_layer.send = AsyncMock()
             mock_cl.return_value = mock_layer
-            result = find_node_for_job(job.id)
+            return find_node_for_job(job_id), mock_layer.send
+
+    def test_assigns_pending_job_to_node(self):
+        """find_node_for_job assigns a PENDING job to an active node."""
+        job = self._job()
+        result, send = self._find(job.id)
 
         job.refresh_from_db()
         self.assertEqual(job.status, "RUNNING")
         self.assertEqual(job.node, self.node)
         self.assertIn("Assigned", result)
+        channel, message = send.await_args.args
+        self.assertEqual(channel, "test-channel")
+        self.assertEqual(message["type"], "job_dispatch")
+        self.assertEqual(message["job_data"]["task_id"], job.id)
+        self.assertTrue(message["targeted"])
+
+    def test_picks_fastest_node(self):
+        """find_node_for_job prefers the node expected to finish soonest."""
+        fast = Node.objects.create(
+            owner=self.provider, node_id="task-node-2", name="Fast Node",
+            gpu_info={"models": ["llama2"]}, is_active=True,
+        )
+        get_presence().touch({"task-node-2": "fast-channel"})
+        record_result(self.node, "llama2", 0, 9000)
+        record_result(fast, "llama2", 0, 500)
+        job = self._job()
+        with patch("computing.scoring.random.random", return_value=0.99):
+            _, send = self._find(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.node, fast)
+        self.assertEqual(send.await_args.args[0], "fast-channel")
 
     def test_skips_non_pending_job(self):
         """find_node_for_job returns None for non-PENDING job."""
-        job = Job.objects.create(
-            user=self.user, task_type="inference",
-            input_data={"prompt": "hello"}, status="RUNNING",
-        )
+        job = self._job(status="RUNNING")
         result = find_node_for_job(job.id)
         self.assertIsNone(result)
 
@@ -60,29 +90,29 @@ class FindNodeForJobTests(TestCase):
         """find_node_for_job returns message when no nodes available."""
         self.node.is_active = False
         self.node.save()
-        job = Job.objects.create(
-            user=self.user, task_type="inference",
-            input_data={"prompt": "hello"}, status="PENDING",
-        )
+        job = self._job()
         result = find_node_for_job(job.id)
         self.assertEqual(result, "No nodes available")
 
+    def test_skips_nodes_without_model_or_owned_by_requester(self):
+        """Nodes that lack the model, or belong to the job's owner, are not eligible."""
+        Node.objects.create(
+            owner=self.user, node_id="own-node", name="Own Node",
+            gpu_info={"models": ["mistral"]}, is_active=True,
+        )
+        get_presence().touch({"own-node": "own-channel"})
+        job = self._job(model="mistral")
+        self.assertEqual(find_node_for_job(job.id), "No nodes available")
+
     def test_nonexistent_job(self):
         """find_node_for_job returns message for nonexistent job."""
         result = find_node_for_job(99999)
         self.assertEqual(result, "Job not found")
 
     def test_ignores_stale_node(self):
-        """find_node_for_job ignores nodes with old heartbeat."""
-        from datetime import timedelta
-        # Make the only node's heartbeat stale
-        Node.objects.all().update(
-            last_heartbeat=timezone.now() - timedelta(minutes=5),
-        )
-        job = Job.objects.create(
-            user=self.user, task_type="inference",
-            input_data={"prompt": "hello"}, status="PENDING",
-        )
+        """find_node_for_job ignores nodes whose presence has lapsed."""
+        get_presence().remove("task-node-1")
+        job = self._job()
         result = find_node_for_job(job.id)
         self.assertEqual(result, "No nodes available")
         job.refresh_from_db()
@@ -1,12 +1,17 @@
 """Tests for computing module views."""
+import json
 from decimal import Decimal
+from unittest.mock import patch
 
+from asgiref.sync import async_to_sync
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from ..consumers import GPUConsumer
 from ..models import Node, Job
+from ..presence import get_presence
 
 User = get_user_model()
 
@@ -27,6 +32,7 @@ class AvailableModelsViewTests(TestCase):
             gpu_info={'models': ['llama3.2:latest', 'gemma3:270m']},
             is_active=True,
         )
+        get_presence().touch({'test-node-1': 'test-channel'})
 
     def test_models_endpoint_returns_200(self):
         """Available models endpoint returns 200 without auth."""
@@ -73,6 +79,7 @@ class NetworkStatsViewTests(TestCase):
             gpu_info={'models': ['llama3.2:latest']},
             is_active=True,
         )
+        get_presence().touch({'stats-node': 'test-channel'})
 
     def test_stats_endpoint_returns_200(self):
         """Network stats returns 200 without auth."""
@@ -119,6 +126,7 @@ class JobListViewTests(TestCase):
             gpu_info={'count': 1},
             is_active=True,
         )
+        get_presence().touch({'test-node-2': 'test-channel'})
         self.job = Job.objects.create(
             user=self.user, node=self.node,
             task_type='inference',
@@ -193,3 +201,140 @@ class ProviderStatsViewTests(TestCase):
             '/api/computing/provider-stats/?days=7',
         )
         self.assertEqual(response.data['period_days'], 7)
+
+
+class JobExportViewTests(TestCase):
+    """Tests for GET /api/computing/export/jobs/"""
+
+    def setUp(self):
+        """Set up test data."""
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='consumer', password='pass'
+        )
+        self.provider = User.objects.create_user(
+            username='provider', password='pass'
+        )
+        self.node = Node.objects.create(
+            owner=self.provider,
+            node_id='export-node',
+            name='Export Node',
+            is_active=True,
+        )
+        get_presence().touch({'export-node': 'test-channel'})
+        for i in range(2):
+            Job.objects.create(
+                user=self.user, node=self.node,
+                task_type='inference',
+                input_data={'prompt': f'prompt {i}', 'model': 'llama2'},
+            )
+
+    def _rows(self, response):
+        body = b''.join(response.streaming_content).decode()
+        return [json.loads(line) for line in body.splitlines()]
+
+    def test_export_streams_submitted_jobs(self):
+        """Consumers export the jobs they submitted."""
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get('/api/computing/export/jobs/?output=ndjson')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = self._rows(response)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['input_data']['prompt'], 'prompt 0')
+        self.assertEqual(rows[0]['node__node_id'], 'export-node')
+
+    def test_export_served_jobs_for_provider(self):
+        """role=provider exports jobs served on the user's nodes."""
+        self.client.force_authenticate(user=self.provider)
+        response = self.client.get('/api/computing/export/jobs/?output=ndjson')
+        self.assertEqual(self._rows(response), [])
+        response = self.client.get(
+            '/api/computing/export/jobs/?output=ndjson&role=provider',
+        )
+        self.assertEqual(len(self._rows(response)), 2)
+
+    def test_export_credits_the_node_that_completed_the_job(self):
+        """Jobs completed by legacy (non-accept) nodes show up in their provider's export."""
+        other = Node.objects.create(owner=self.user, node_id='first-taker', name='Other')
+        job = Job.objects.create(
+            user=self.user, task_type='inference', status='RUNNING', node=other,
+            input_data={'prompt': 'legacy', 'model': 'llama2'},
+        )
+        unassigned = Job.objects.create(
+            user=self.user, task_type='inference',
+            input_data={'prompt': 'legacy 2', 'model': 'llama2'},
+        )
+        for job_id in (job.id, unassigned.id):
+            async_to_sync(GPUConsumer()._complete_job)(  # pylint: disable=protected-access
+                job_id, {'output': 'ok'}, self.provider.id, node_id='export-node',
+            )
+        self.client.force_authenticate(user=self.provider)
+        response = self.client.get(
+            '/api/computing/export/jobs/?output=ndjson&role=provider',
+        )
+        served = {row['id'] for row in self._rows(response)}
+        self.assertIn(job.id, served)
+        self.assertIn(unassigned.id, served)
+
+    def test_export_csv_header(self):
+        """CSV export starts with the column header."""
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get('/api/computing/export/jobs/')
+        first = next(iter(response.streaming_content)).decode()
+        self.assertTrue(first.startswith('id,status,task_type'))
+
+
+class JobCancelViewTests(TestCase):
+    """Tests for POST /api/computing/jobs/<id>/cancel/"""
+
+    def setUp(self):
+        """Set up test data."""
+        from payments.services import EscrowService
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='consumer', password='pass',
+            wallet_balance=Decimal('10.00'),
+        )
+        self.job = Job.objects.create(
+            user=self.user, task_type='inference', cost=Decimal('1.00'),
+            input_data={'prompt': 'long story', 'model': 'llama2'},
+        )
+        EscrowService.reserve(self.user, self.job, Decimal('1.00'))
+
+    def test_owner_cancels_and_hold_is_released(self):
+        """Cancelling marks the job CANCELLED and releases its hold."""
+        from payments.models import Hold
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(f'/api/computing/jobs/{self.job.id}/cancel/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, 'CANCELLED')
+        self.assertEqual(Hold.objects.get(job=self.job).status, 'RELEASED')
+
+    def test_other_user_cannot_cancel(self):
+        """Only the job owner can cancel it."""
+        other = User.objects.create_user(username='other', password='pass')
+        self.client.force_authenticate(user=other)
+        response = self.client.post(f'/api/computing/jobs/{self.job.id}/cancel/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_finished_job_cannot_be_cancelled(self):
+        """A finished job returns 409 and keeps its status."""
+        Job.objects.filter(pk=self.job.pk).update(status='COMPLETED')
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(f'/api/computing/jobs/{self.job.id}/cancel/')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, 'COMPLETED')
+
+    def test_conflict_reports_the_status_that_won(self):
+        """A job finishing while the request is in flight is reported as finished."""
+        def finish_first(job):
+            Job.objects.filter(pk=job.pk).update(status='COMPLETED')
+            return False
+
+        self.client.force_authenticate(user=self.user)
+        with patch.object(Job, 'cancel', autospec=True, side_effect=finish_first):
+            response = self.client.post(f'/api/computing/jobs/{self.job.id}/cancel/')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['error'], 'Job already completed')
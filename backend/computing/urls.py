@@ -1,15 +1,18 @@
 """URL configuration for the computing module."""
 from django.urls import path
 from .views import (
-    JobSubmissionView, JobDetailView, JobListView,
-    AvailableModelsView, NetworkStatsView, ProviderStatsView,
+    JobSubmissionView, JobDetailView, JobCancelView, JobListView,
+    AvailableModelsView, NetworkStatsView, NodeModelStatsView, ProviderStatsView, JobExportView,
 )
 
 urlpatterns = [
     path('submit-job/', JobSubmissionView.as_view(), name='submit-job'),
     path('jobs/', JobListView.as_view(), name='job-list'),
     path('jobs/<int:job_id>/', JobDetailView.as_view(), name='job-detail'),
+    path('jobs/<int:job_id>/cancel/', JobCancelView.as_view(), name='job-cancel'),
     path('models/', AvailableModelsView.as_view(), name='available-models'),
     path('stats/', NetworkStatsView.as_view(), name='network-stats'),
+    path('node-stats/', NodeModelStatsView.as_view(), name='node-stats'),
     path('provider-stats/', ProviderStatsView.as_view(), name='provider-stats'),
+    path('export/jobs/', JobExportView.as_view(), name='export-jobs'),
 ]
@@ -2,13 +2,20 @@
 from decimal import Decimal
 
 from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from rest_framework import views, status
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, AllowAny
 from rest_framework.response import Response
 
-from .models import Job, Node
+from core.exports import ExportView
+from payments.services import EscrowService
+from .dispatch import announce_cancellation, dispatch_job, job_payload
+from .hedging import stats as hedging_stats
+from .models import Job, NodeModelStats
+from .presence import active_nodes
+from .result_cache import CACHED_JOB_COST, cache_key, get_result_cache
 
 
 class JobSubmissionView(views.APIView):
@@ -16,20 +23,38 @@ class JobSubmissionView(views.APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        """Create a job, deduct credits, and dispatch to GPU nodes."""
+        """Create a job, reserve credits, and dispatch to GPU nodes."""
         user = request.user
 
         prompt = request.data.get("prompt")
         model = request.data.get("model", "llama3.2:latest")
+        options = request.data.get("options") or {}
+        use_cache = str(request.data.get("cache", "")).lower() in ("true", "1")
 
         if not prompt:
             return Response(
                 {"error": "Prompt is required"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        if not isinstance(options, dict):
+            return Response(
+                {"error": "Options must be an object"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        input_data = {"prompt": prompt, "model": model}
+        if options:
+            input_data["options"] = options
+        key = cache_key(model, prompt, options)
+        if use_cache:
+            output = get_result_cache().get(key)
+            if output is not None:
+                return self._complete_from_cache(user, input_data, output)
+            # The node's answer is cached when it reports back
+            input_data["cache_key"] = key
 
         # Ensure there are active nodes NOT owned by this user
-        other_nodes = Node.objects.filter(is_active=True).exclude(owner=user)
+        other_nodes = active_nodes().exclude(owner=user)
         if not other_nodes.exists():
             return Response(
                 {"error": "No available third-party nodes. "
@@ -37,42 +62,69 @@ class JobSubmissionView(views.APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # Check Balance (Simple PoC: 1 credit per job)
+        # Reserve the cost in escrow (Simple PoC: 1 credit per job)
         job_cost = Decimal('1.00')
-        if user.wallet_balance < job_cost:
+        try:
+            with transaction.atomic():
+                # An identical job already in flight answers this one too.
+                # Concurrent first submissions may each lead; that only
+                # costs the extra runs coalescing would have saved.
+                # Followers pay no provider, so following a run on the
+                # submitter's own node earns them nothing.
+                leader = Job.in_flight_leader(key)
+                job = Job.objects.create(
+                    user=user,
+                    task_type="inference",
+                    input_data=input_data,
+                    status="PENDING",
+                    cost=job_cost,
+                    coalesce_key=key,
+                    leader=leader,
+                )
+                EscrowService.reserve(user, job, job_cost)
+        except ValueError:
             return Response(
                 {"error": "Insufficient funds"},
                 status=status.HTTP_402_PAYMENT_REQUIRED,
             )
 
-        user.wallet_balance -= job_cost
-        user.save()
-
-        job = Job.objects.create(
-            user=user,
-            task_type="inference",
-            input_data={"prompt": prompt, "model": model},
-            status="PENDING",
-            cost=job_cost,
-        )
+        if leader:
+            return Response(
+                {"status": "submitted", "job_id": job.id, "coalesced_with": leader.id},
+                status=status.HTTP_201_CREATED,
+            )
 
         # Dispatch to all connected GPU provider nodes
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            "gpu_nodes",
-            {
-                "type": "job_dispatch",
-                "job_data": {
-                    "task_id": job.id,
-                    "owner_id": user.id,
-                    "model": model,
-                    "prompt": prompt
-                }
-            }
-        )
+        async_to_sync(dispatch_job)(job_payload(job))
 
         return Response({"status": "submitted", "job_id": job.id}, status=status.HTTP_201_CREATED)
 
+    def _complete_from_cache(self, user, input_data, output):
+        """Create an already-completed job charged at the cached price."""
+        try:
+            with transaction.atomic():
+                job = Job.objects.create(
+                    user=user,
+                    task_type="inference",
+                    input_data=input_data,
+                    status="COMPLETED",
+                    cost=CACHED_JOB_COST,
+                    result={"output": output, "cached": True},
+                    completed_at=timezone.now(),
+                )
+                EscrowService.reserve(user, job, CACHED_JOB_COST)
+                # No provider ran it: the settled hold goes to the platform account
+                EscrowService.capture(job.id, None)
+        except ValueError:
+            return Response(
+                {"error": "Insufficient funds"},
+                status=status.HTTP_402_PAYMENT_REQUIRED,
+            )
+        return Response(
+            {"status": "completed", "job_id": job.id, "cached": True},
+            status=status.HTTP_201_CREATED,
+        )
+
 
 class JobDetailView(views.APIView):
     """Retrieve details for a single job."""
@@ -96,6 +148,25 @@ class JobDetailView(views.APIView):
         })
 
 
+class JobCancelView(views.APIView):
+    """Cancel an unfinished job."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, job_id):
+        """Cancel the job, release its hold and tell the nodes to stop work on it."""
+        job = get_object_or_404(Job, id=job_id)
+        if job.user != request.user:
+            return Response({"error": "Unauthorized"}, status=status.HTTP_403_FORBIDDEN)
+        if not job.cancel():
+            job.refresh_from_db(fields=["status"])
+            return Response(
+                {"error": f"Job already {job.status.lower()}"},
+                status=status.HTTP_409_CONFLICT,
+            )
+        async_to_sync(announce_cancellation)(job)
+        return Response({"status": "cancelled", "job_id": job.id})
+
+
 class JobListView(views.APIView):
     """List all jobs for the authenticated user."""
     permission_classes = [IsAuthenticated]
@@ -125,10 +196,10 @@ class AvailableModelsView(views.APIView):
 
     def get(self, _request):
         """Return models available across all active nodes."""
-        active_nodes = Node.objects.filter(is_active=True)
+        nodes = active_nodes()
         model_map = {}
 
-        for node in active_nodes:
+        for node in nodes:
             models = node.gpu_info.get("models", [])
             for m in models:
                 if m not in model_map:
@@ -143,7 +214,7 @@ class AvailableModelsView(views.APIView):
         models_list = sorted(model_map.values(), key=lambda x: -x["providers"])
         return Response({
             "models": models_list,
-            "total_nodes": active_nodes.count(),
+            "total_nodes": nodes.count(),
         })
 
 
@@ -153,24 +224,56 @@ class NetworkStatsView(views.APIView):
 
     def get(self, _request):
         """Return public network-wide statistics."""
-        active_nodes = Node.objects.filter(is_active=True).count()
+        nodes = list(active_nodes())
         total_jobs = Job.objects.count()
         completed_jobs = Job.objects.filter(status="COMPLETED").count()
+        # Followers completed from their leader's run never reached a GPU
+        coalesced_jobs = Job.objects.filter(
+            status="COMPLETED", leader__isnull=False,
+        ).count()
 
         # Collect unique models
         all_models = set()
-        for node in Node.objects.filter(is_active=True):
+        for node in nodes:
             for m in node.gpu_info.get("models", []):
                 all_models.add(m)
 
         return Response({
-            "active_nodes": active_nodes,
+            "active_nodes": len(nodes),
             "total_jobs": total_jobs,
             "completed_jobs": completed_jobs,
+            "coalesced_jobs": coalesced_jobs,
             "available_models": len(all_models),
+            "result_cache": get_result_cache().stats(),
+            "hedging": hedging_stats(),
         })
 
 
+class NodeModelStatsView(views.APIView):
+    """Admin view of the per-(node, model) latency averages used to pick nodes."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, _request):
+        """Return every node's averages, fastest first within each model."""
+        rows = sorted(
+            NodeModelStats.objects.select_related("node"),
+            key=lambda stats: (stats.model, stats.expected_ms),
+        )
+        return Response([{
+            "node_id": stats.node.node_id,
+            "node_name": stats.node.name,
+            "model": stats.model,
+            "queue_ms": round(stats.queue_ms, 1),
+            "first_token_ms": (
+                round(stats.first_token_ms, 1) if stats.first_token_ms is not None else None
+            ),
+            "duration_ms": round(stats.duration_ms, 1),
+            "expected_ms": round(stats.expected_ms, 1),
+            "samples": stats.samples,
+            "updated_at": stats.updated_at,
+        } for stats in rows])
+
+
 class ProviderStatsView(views.APIView):
     """Authenticated endpoint returning comprehensive provider metrics."""
     permission_classes = [IsAuthenticated]
@@ -181,3 +284,17 @@ class ProviderStatsView(views.APIView):
         days = int(request.query_params.get("days", 30))
         stats = get_provider_stats(request.user, days)
         return Response(stats)
+
+
+class JobExportView(ExportView):
+    """Stream job history: jobs submitted, or with ``role=provider`` jobs served."""
+    columns = (
+        "id", "status", "task_type", "input_data", "cost",
+        "node__node_id", "created_at", "completed_at",
+    )
+    filename = "jobs"
+
+    def get_queryset(self, request):
+        if request.query_params.get("role") == "provider":
+            return Job.objects.filter(node__owner=request.user)
+        return Job.objects.filter(user=request.user)
@@ -14,12 +14,13 @@ from channels.routing import (  # pylint: disable=wrong-import-position
 )
 
 import computing.routing  # pylint: disable=wrong-import-position
+from computing.reconcile import StartupReconcile  # pylint: disable=wrong-import-position
 
-application = ProtocolTypeRouter({
+application = StartupReconcile(ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": AuthMiddlewareStack(
         URLRouter(
             computing.routing.websocket_urlpatterns
         )
     ),
-})
+}))
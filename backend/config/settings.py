@@ -222,6 +222,35 @@ if not os.environ.get("CELERY_BROKER_URL"):
     CELERY_TASK_ALWAYS_EAGER = True
     CELERY_TASK_EAGER_PROPAGATES = True
 
+# PAYMENTS
+# Record provider earnings as unpaid JobSettlement rows and credit wallets with
+# one summary CreditLog per provider every PAYOUT_FLUSH_INTERVAL seconds.
+PAYOUT_AGGREGATION = os.environ.get("PAYOUT_AGGREGATION", "False") == "True"
+PAYOUT_FLUSH_INTERVAL = int(os.environ.get("PAYOUT_FLUSH_INTERVAL", "60"))
+
+# NODE REGISTRATION
+# Registrations admitted per second (per ASGI process) and the burst allowed
+# above that; agents over the limit are told when to retry.
+NODE_REGISTER_RATE = float(os.environ.get("NODE_REGISTER_RATE", "20"))
+NODE_REGISTER_BURST = int(os.environ.get("NODE_REGISTER_BURST", "40"))
+
+# RESULT CACHE
+# Jobs submitted with "cache": true reuse answers to identical requests.
+# The local cache evicts least-recently-used entries above RESULT_CACHE_MAX_BYTES;
+# with Redis, size is bounded by the server's maxmemory policy.
+RESULT_CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", "86400"))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# HEDGED DISPATCH
+# With HEDGE_ENABLED a job goes to one node, and to a second one if no result
+# arrives within the model's HEDGE_PERCENTILE latency. Duplicates are capped
+# at HEDGE_BUDGET of dispatches; HEDGE_HOLDOUT_PERCENT of jobs are never
+# hedged so the p99 gain can be measured against them.
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "False") == "True"
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "95"))
+HEDGE_BUDGET = float(os.environ.get("HEDGE_BUDGET", "0.05"))
+HEDGE_HOLDOUT_PERCENT = int(os.environ.get("HEDGE_HOLDOUT_PERCENT", "5"))
+
 # CHANNELS
 REDIS_URL = os.environ.get("REDIS_URL")
 if REDIS_URL:
@@ -0,0 +1,170 @@
+"""Streaming CSV / NDJSON exports shared by the history export endpoints."""
+import csv
+import json
+from datetime import datetime, time
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import permissions, status, views
+from rest_framework.response import Response
+
+# Rows fetched per server-side cursor round trip
+EXPORT_CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for csv.writer."""
+
+    def write(self, value):
+        """Return the formatted line instead of buffering it."""
+        return value
+
+
+def parse_date_range(params):
+    """
+    Parses optional ``since`` / ``until`` query params (ISO date or datetime).
+    A bare ``until`` date includes that whole day.
+    Raises ValueError for unparseable values.
+    """
+    bounds = []
+    for key, day_time in (("since", time.min), ("until", time.max)):
+        raw = params.get(key)
+        if not raw:
+            bounds.append(None)
+            continue
+        value = parse_datetime(raw)
+        if value is None:
+            day = parse_date(raw)
+            if day is None:
+                raise ValueError(f"Invalid '{key}' date: {raw}")
+            value = datetime.combine(day, day_time)
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        bounds.append(value)
+    return tuple(bounds)
+
+
+def filter_date_range(queryset, field, since, until):
+    """Restrict a queryset to rows whose ``field`` lies in [since, until]."""
+    if since:
+        queryset = queryset.filter(**{f"{field}__gte": since})
+    if until:
+        queryset = queryset.filter(**{f"{field}__lte": until})
+    return queryset
+
+
+def _to_json(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _line_encoder(columns, output):
+    """Return (header line or None, function turning a row into a line)."""
+    if output == "ndjson":
+        def encode(row):
+            return json.dumps(dict(zip(columns, row)), default=_to_json, ensure_ascii=False) + "\n"
+        return None, encode
+    writer = csv.writer(_Echo())
+
+    def encode_csv(row):
+        return writer.writerow([_csv_cell(value) for value in row])
+    return writer.writerow(columns), encode_csv
+
+
+def _sync_lines(queryset, columns, output):
+    header, encode = _line_encoder(columns, output)
+    if header is not None:
+        yield header
+    for row in queryset.values_list(*columns).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield encode(row)
+
+
+async def _async_lines(queryset, columns, output):
+    """Fetch rows in keyset-paginated chunks off the event loop and yield lines."""
+    header, encode = _line_encoder(columns, output)
+    if header is not None:
+        yield header
+    rows = queryset.values_list("pk", *columns).order_by("pk")
+    last_pk = None
+    while True:
+        page = rows if last_pk is None else rows.filter(pk__gt=last_pk)
+        chunk = await sync_to_async(list)(page[:EXPORT_CHUNK_SIZE])
+        for row in chunk:
+            yield encode(row[1:])
+        if len(chunk) < EXPORT_CHUNK_SIZE:
+            return
+        last_pk = chunk[-1][0]
+
+
+def stream_export(queryset, columns, output, filename, is_async=False):
+    """
+    Streams ``queryset`` as CSV or NDJSON without loading it into memory.
+    ``columns`` are the field names passed to values_list(); rows are read
+    in EXPORT_CHUNK_SIZE batches. With ``is_async`` (ASGI) the body is an
+    async iterator, so Django streams it instead of buffering it whole
+    through sync_to_async; otherwise a server-side cursor is used.
+    """
+    if is_async:
+        lines = _async_lines(queryset, columns, output)
+    else:
+        lines = _sync_lines(queryset, columns, output)
+    response = StreamingHttpResponse(lines, content_type=CONTENT_TYPES[output])
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{output}"'
+    return response
+
+
+class ExportView(views.APIView):
+    """Base view streaming the user's rows as CSV (default) or NDJSON.
+
+    Query params: ``output`` (csv|ndjson), ``since`` and ``until``.
+    Subclasses set ``columns``, ``date_field``, ``filename`` and implement
+    ``get_queryset``.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    columns = ()
+    date_field = "created_at"
+    filename = "export"
+
+    def get_queryset(self, request):
+        """Return the rows visible to the requesting user."""
+        raise NotImplementedError
+
+    def get(self, request):
+        """Stream the filtered rows in the requested format."""
+        output = request.query_params.get("output", "csv")
+        if output not in CONTENT_TYPES:
+            return Response(
+                {"error": "output must be 'csv' or 'ndjson'"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            since, until = parse_date_range(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = filter_date_range(
+            self.get_queryset(request), self.date_field, since, until,
+        ).order_by("id")
+        return stream_export(
+            queryset, self.columns, output, self.filename,
+            is_async=isinstance(request._request, ASGIRequest),  # pylint: disable=protected-access
+        )
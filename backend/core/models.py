@@ -1,10 +1,15 @@
 """Core models — custom User and AgentToken for GPU provider auth."""
 import hashlib
 import secrets
+from datetime import timedelta
 from decimal import Decimal
 
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
+
+# AgentToken.last_used is only rewritten once it is older than this
+LAST_USED_RESOLUTION = timedelta(minutes=5)
 
 
 class User(AbstractUser):
@@ -72,10 +77,20 @@ class AgentToken(models.Model):
                 token_hash=token_hash,
                 is_active=True
             )
-            # Update last_used
-            from django.utils import timezone  # pylint: disable=import-outside-toplevel
-            token.last_used = timezone.now()
-            token.save(update_fields=['last_used'])
+            # Coarse last_used: skip the write while the stored value is fresh
+            now = timezone.now()
+            if token.last_used is None or token.last_used < now - LAST_USED_RESOLUTION:
+                cls.mark_used([token.pk], now)
+                token.last_used = now
             return token
         except cls.DoesNotExist:
             return None
+
+    @classmethod
+    def mark_used(cls, token_ids, now=None):
+        """Set last_used on the tokens whose stored value is stale (one UPDATE)."""
+        now = now or timezone.now()
+        return cls.objects.filter(id__in=token_ids).filter(
+            models.Q(last_used__isnull=True)
+            | models.Q(last_used__lt=now - LAST_USED_RESOLUTION)
+        ).update(last_used=now)
@@ -2,11 +2,13 @@
 Test Suite: Core User Model and AgentToken
 Covers: User creation, password hashing, wallet defaults, token generation/validation
 """
+from datetime import timedelta
 from decimal import Decimal
 
 import pytest
+from django.utils import timezone
 
-from core.models import User, AgentToken
+from core.models import LAST_USED_RESOLUTION, User, AgentToken
 
 
 @pytest.mark.django_db
@@ -69,6 +71,19 @@ class TestAgentToken:
         assert result.user == self.user
         assert result.last_used is not None
 
+    def test_validate_skips_write_while_last_used_is_fresh(self, django_assert_num_queries):
+        """validate() is read-only until last_used is LAST_USED_RESOLUTION old."""
+        agent_token, raw = AgentToken.generate(self.user)
+        first = AgentToken.validate(raw).last_used
+        with django_assert_num_queries(1):
+            assert AgentToken.validate(raw).last_used == first
+
+        stale = timezone.now() - LAST_USED_RESOLUTION - timedelta(seconds=1)
+        AgentToken.objects.filter(pk=agent_token.pk).update(last_used=stale)
+        AgentToken.validate(raw)
+        agent_token.refresh_from_db()
+        assert agent_token.last_used > stale
+
     def test_validate_returns_none_for_invalid(self):
         """validate() returns None for invalid token."""
         result = AgentToken.validate("gpc_doesnotexist123")
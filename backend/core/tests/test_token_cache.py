@@ -0,0 +1,32 @@
+"""Tests for the in-process agent token validation cache."""
+from unittest.mock import patch
+
+from core.token_cache import TokenCache, revocation_group
+
+
+def test_put_and_get():  # pylint: disable=missing-function-docstring
+    cache = TokenCache(ttl=60)
+    cache.put("hash", 7, 3)
+    assert cache.get("hash") == (7, 3)
+    assert cache.get("other") is None
+
+
+def test_entries_expire_after_ttl():  # pylint: disable=missing-function-docstring
+    cache = TokenCache(ttl=60)
+    with patch("core.token_cache.time.monotonic", return_value=1000.0):
+        cache.put("hash", 7, 3)
+    with patch("core.token_cache.time.monotonic", return_value=1061.0):
+        assert cache.get("hash") is None
+
+
+def test_evict_by_token_id():  # pylint: disable=missing-function-docstring
+    cache = TokenCache()
+    cache.put("a", 7, 3)
+    cache.put("b", 7, 4)
+    cache.evict(3)
+    assert cache.get("a") is None
+    assert cache.get("b") == (7, 4)
+
+
+def test_revocation_group_name():  # pylint: disable=missing-function-docstring
+    assert revocation_group(12) == "agent_token_12"
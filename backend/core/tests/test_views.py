@@ -1,4 +1,6 @@
 """Tests for core views (auth, profile, health check, agent tokens)."""
+from unittest.mock import AsyncMock, MagicMock, patch
+
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 from rest_framework import status
@@ -222,3 +224,21 @@ class AgentTokenRevokeViewTests(TestCase):
         )
         response = self.client.get('/api/core/agent-token/list/')
         self.assertEqual(len(response.data), 0)
+
+    def test_revoke_pushes_revocation_to_connected_agents(self):
+        """Revoking sends token_revoked to the token's channel-layer group."""
+        layer = MagicMock()
+        layer.group_send = AsyncMock()
+        with patch("core.views.get_channel_layer", return_value=layer):
+            self.client.post(f'/api/core/agent-token/{self.token_id}/revoke/')
+        layer.group_send.assert_awaited_once_with(
+            f"agent_token_{self.token_id}",
+            {"type": "token_revoked", "token_id": self.token_id},
+        )
+
+    def test_revoke_evicts_cached_token(self):
+        """Revoking drops the token from this process's validation cache."""
+        from core.token_cache import token_cache
+        token_cache.put("somehash", self.user.id, self.token_id)
+        self.client.post(f'/api/core/agent-token/{self.token_id}/revoke/')
+        self.assertIsNone(token_cache.get("somehash"))
@@ -0,0 +1,60 @@
+"""In-process TTL cache of validated agent tokens.
+
+Revocations are pushed to connected agents through the channel layer (see
+``AgentTokenRevokeView``), which evicts the entry in every process with a node
+connected on the token. Other processes may still hold it until it expires, so
+registration re-checks ``is_active`` on a cache hit.
+"""
+import threading
+import time
+
+# How long a validated token is trusted without another DB lookup (seconds)
+TOKEN_CACHE_TTL = 60
+
+
+class TokenCache:
+    """Maps token hashes to (user_id, token_id) for TOKEN_CACHE_TTL seconds."""
+
+    def __init__(self, ttl=TOKEN_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, token_hash):
+        """Return (user_id, token_id) for a cached token, or None."""
+        with self._lock:
+            entry = self._entries.get(token_hash)
+            if entry is None:
+                return None
+            user_id, token_id, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[token_hash]
+                return None
+            return user_id, token_id
+
+    def put(self, token_hash, user_id, token_id):
+        """Cache a freshly validated token."""
+        with self._lock:
+            self._entries[token_hash] = (
+                user_id, token_id, time.monotonic() + self.ttl,
+            )
+
+    def evict(self, token_id):
+        """Drop every entry for a token id (called on revocation)."""
+        with self._lock:
+            for token_hash, entry in list(self._entries.items()):
+                if entry[1] == token_id:
+                    del self._entries[token_hash]
+
+    def clear(self):
+        """Drop all entries."""
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+def revocation_group(token_id):
+    """Channel-layer group joined by every consumer using the token."""
+    return f"agent_token_{token_id}"
@@ -1,10 +1,13 @@
 """Views for the core module — registration, profiles, and agent tokens."""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from rest_framework import generics, permissions, views, status
 from rest_framework.response import Response
 
 from .models import AgentToken
+from .token_cache import revocation_group, token_cache
 from .serializers import RegisterSerializer, UserSerializer
 
 User = get_user_model()
@@ -79,6 +82,12 @@ class AgentTokenRevokeView(views.APIView):
             token = AgentToken.objects.get(id=token_id, user=request.user, is_active=True)
             token.is_active = False
             token.save()
+            # Disconnect agents using this token right away, in any process
+            token_cache.evict(token.id)
+            async_to_sync(get_channel_layer().group_send)(
+                revocation_group(token.id),
+                {"type": "token_revoked", "token_id": token.id},
+            )
             return Response({"status": "revoked", "id": token_id})
         except AgentToken.DoesNotExist:
             return Response(
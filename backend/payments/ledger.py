@@ -0,0 +1,208 @@
+"""Double-entry ledger with periodic per-account balance snapshots.
+
+Every wallet change is recorded as a balanced ``LedgerEntry``. An account's
+balance is its latest ``BalanceSnapshot`` plus the postings made after the
+snapshot's watermark, so reads stay bounded however long the history gets.
+"""
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from .models import (
+    BalanceSnapshot, LedgerAccount, LedgerCheckpoint, LedgerEntry, Posting,
+)
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+# System accounts balancing the user wallets
+OPENING_ACCOUNT = "system:opening"    # balances that existed before the ledger
+EXTERNAL_ACCOUNT = "system:external"  # deposits and withdrawals
+PAYOUTS_ACCOUNT = "system:payouts"    # aggregated earnings awaiting a payout flush
+PLATFORM_ACCOUNT = "system:platform"  # captured job payments with no provider
+
+# Postings younger than this are left for the next run, so ids allocated by
+# transactions that had not committed yet are never skipped.
+SAFETY_LAG = timedelta(minutes=1)
+
+# Maximum entries verified per consistency-check run
+CHECK_BATCH_SIZE = 1000
+
+
+class LedgerService:
+    """Post balanced entries, read balances, snapshot and verify the ledger."""
+
+    @staticmethod
+    def system_account(code):
+        """Return (creating if needed) a system account by code."""
+        return LedgerAccount.objects.get_or_create(code=code)[0]
+
+    @staticmethod
+    def wallet_accounts(user_ids):
+        """
+        Returns {user_id: LedgerAccount}, opening accounts for new wallets.
+        A new account is opened with the user's stored wallet balance, so
+        call this before changing wallet_balance in the same transaction.
+        """
+        user_ids = set(user_ids)
+        accounts = {
+            account.user_id: account
+            for account in LedgerAccount.objects.filter(user_id__in=user_ids)
+        }
+        missing = user_ids - accounts.keys()
+        if missing:
+            opening = LedgerService.system_account(OPENING_ACCOUNT)
+            legs = []
+            balances = User.objects.filter(pk__in=missing).values_list(
+                "pk", "wallet_balance",
+            )
+            for user_id, balance in balances:
+                account = LedgerAccount.objects.create(
+                    code=f"wallet:{user_id}", user_id=user_id,
+                )
+                accounts[user_id] = account
+                legs += [(account, balance), (opening, -balance)]
+            if legs:
+                LedgerService.post("Opening balances", legs)
+        return accounts
+
+    @staticmethod
+    def wallet_account(user_id):
+        """Return the wallet account for one user."""
+        return LedgerService.wallet_accounts([user_id])[user_id]
+
+    @staticmethod
+    @transaction.atomic
+    def post(description, legs):
+        """
+        Records a journal entry from (account, amount) legs.
+        Raises ValueError if the amounts do not sum to zero.
+        """
+        total = sum((amount for _, amount in legs), Decimal("0.00"))
+        if total != 0:
+            raise ValueError(f"Unbalanced ledger entry ({total})")
+        entry = LedgerEntry.objects.create(description=description)
+        Posting.objects.bulk_create([
+            Posting(entry=entry, account=account, amount=amount)
+            for account, amount in legs if amount
+        ])
+        return entry
+
+    @staticmethod
+    def balance(account, at=None):
+        """Return an account's balance now, or as of the datetime ``at``."""
+        snapshots = BalanceSnapshot.objects.filter(account=account)
+        postings = Posting.objects.filter(account=account)
+        if at is not None:
+            snapshots = snapshots.filter(created_at__lte=at)
+            postings = postings.filter(created_at__lte=at)
+
+        base = Decimal("0.00")
+        snapshot = snapshots.order_by("-last_posting_id").first()
+        if snapshot:
+            base = snapshot.balance
+            postings = postings.filter(id__gt=snapshot.last_posting_id)
+        tail = postings.aggregate(total=Sum("amount"))["total"]
+        return base + (tail or Decimal("0.00"))
+
+    @staticmethod
+    @transaction.atomic
+    def take_snapshots():
+        """
+        Snapshots every account posted to since the previous run.
+        Returns the number of snapshots written.
+        """
+        checkpoint = LedgerCheckpoint.objects.select_for_update().get_or_create(
+            name="snapshots",
+        )[0]
+        high = Posting.objects.filter(
+            id__gt=checkpoint.position,
+            created_at__lte=timezone.now() - SAFETY_LAG,
+        ).aggregate(high=Max("id"))["high"]
+        if not high:
+            return 0
+
+        tails = dict(
+            Posting.objects.filter(id__gt=checkpoint.position, id__lte=high)
+            .values_list("account_id")
+            .annotate(total=Sum("amount"))
+        )
+        latest = BalanceSnapshot.objects.filter(
+            account_id=OuterRef("pk"),
+        ).order_by("-last_posting_id")
+        previous = dict(
+            LedgerAccount.objects.filter(id__in=tails)
+            .annotate(previous=Subquery(latest.values("balance")[:1]))
+            .values_list("id", "previous")
+        )
+        BalanceSnapshot.objects.bulk_create([
+            BalanceSnapshot(
+                account_id=account_id,
+                last_posting_id=high,
+                balance=(previous.get(account_id) or Decimal("0.00")) + total,
+            )
+            for account_id, total in tails.items()
+        ])
+        checkpoint.position = high
+        checkpoint.save()
+        return len(tails)
+
+    @staticmethod
+    @transaction.atomic
+    def check_consistency(batch_size=CHECK_BATCH_SIZE):
+        """
+        Verifies the entries recorded since the previous run: each must
+        balance, and each wallet they touched must match wallet_balance.
+        Returns a list of problems found (empty when consistent).
+        """
+        checkpoint = LedgerCheckpoint.objects.select_for_update().get_or_create(
+            name="consistency",
+        )[0]
+        entries = list(
+            LedgerEntry.objects.filter(
+                id__gt=checkpoint.position,
+                created_at__lte=timezone.now() - SAFETY_LAG,
+            )
+            .order_by("id")
+            .annotate(total=Sum("postings__amount"))
+            .values_list("id", "total")[:batch_size]
+        )
+        if not entries:
+            return []
+
+        problems = [
+            f"Entry {entry_id} is unbalanced ({total})"
+            for entry_id, total in entries if total
+        ]
+        first, last = entries[0][0], entries[-1][0]
+        touched = LedgerAccount.objects.filter(
+            user__isnull=False,
+            postings__entry_id__gte=first,
+            postings__entry_id__lte=last,
+        ).distinct().order_by("user_id")
+        for account in touched:
+            # Lock the wallet first: a settlement in flight commits its
+            # postings and wallet write together before both are read here
+            wallet_balance = (
+                User.objects.select_for_update()
+                .values_list("wallet_balance", flat=True)
+                .get(pk=account.user_id)
+            )
+            balance = LedgerService.balance(account)
+            if balance != wallet_balance:
+                problems.append(
+                    f"{account.code} ledger balance {balance} != "
+                    f"wallet_balance {wallet_balance}"
+                )
+
+        for problem in problems:
+            logger.error("Ledger inconsistency: %s", problem)
+        checkpoint.position = last
+        checkpoint.save()
+        return problems
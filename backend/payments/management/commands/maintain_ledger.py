@@ -0,0 +1,12 @@
+"""Snapshot ledger balances and run the incremental consistency check."""
+from django.core.management.base import BaseCommand
+
+from payments.tasks import maintain_ledger
+
+
+class Command(BaseCommand):
+    """Intended to run periodically, e.g. from cron every few minutes."""
+    help = "Write ledger balance snapshots and verify new entries."
+
+    def handle(self, *args, **options):
+        self.stdout.write(maintain_ledger())
@@ -0,0 +1,40 @@
+"""Run the escrow settlement worker once or on an interval."""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from payments.services import SETTLEMENT_BATCH_SIZE
+from payments.tasks import flush_payouts, settle_holds
+
+
+class Command(BaseCommand):
+    """Apply captured job holds to wallets and release expired ones.
+
+    With PAYOUT_AGGREGATION enabled, provider earnings are also flushed
+    every PAYOUT_FLUSH_INTERVAL seconds from this process.
+    """
+    help = "Settle captured escrow holds in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=SETTLEMENT_BATCH_SIZE,
+            help="Maximum holds applied per transaction.",
+        )
+        parser.add_argument(
+            "--interval", type=float, default=0,
+            help="Keep running, settling every N seconds (0 = run once).",
+        )
+
+    def handle(self, *args, **options):
+        last_flush = time.monotonic()
+        while True:
+            self.stdout.write(settle_holds(options["batch_size"]))
+            now = time.monotonic()
+            due = now - last_flush >= settings.PAYOUT_FLUSH_INTERVAL
+            if settings.PAYOUT_AGGREGATION and (due or not options["interval"]):
+                self.stdout.write(flush_payouts())
+                last_flush = now
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,27 @@
+# Generated by Django 6.0.2 on 2026-10-19 05:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('computing', '0001_initial'),
+        ('payments', '0002_hold'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobSettlement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='settlements', to='computing.job')),
+                ('provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='job_settlements', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
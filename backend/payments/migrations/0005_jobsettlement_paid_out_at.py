@@ -0,0 +1,22 @@
+# Generated by Django 6.0.2 on 2026-10-19 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jobsettlement',
+            name='paid_out_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='jobsettlement',
+            index=models.Index(fields=['paid_out_at', 'id'], name='payments_jo_paid_ou_9c0735_idx'),
+        ),
+    ]
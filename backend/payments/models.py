@@ -33,3 +33,138 @@ class CreditLog(models.Model):
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     description = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
+
+
+class Hold(models.Model):
+    """Escrowed funds reserved for a job until it completes, fails or expires.
+
+    Reserving a hold never touches ``User.wallet_balance``: the consumer's
+    available balance is the wallet balance minus outstanding holds. Captured
+    holds are applied to wallets in batches by ``EscrowService.settle``.
+    """
+
+    STATUS_CHOICES = (
+        ('HELD', 'Held'),
+        ('CAPTURED', 'Captured'),
+        ('RELEASED', 'Released'),
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name='holds',
+        on_delete=models.CASCADE,
+    )
+    provider = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name='captured_holds',
+        on_delete=models.SET_NULL, null=True, blank=True,
+    )
+    job = models.OneToOneField(
+        'computing.Job', related_name='hold', on_delete=models.CASCADE,
+    )
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='HELD')
+    created_at = models.DateTimeField(auto_now_add=True)
+    settled_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        """Index the lookups used by balance checks and the settlement worker."""
+        indexes = [
+            models.Index(fields=['user', 'settled_at']),
+            models.Index(fields=['status', 'settled_at']),
+        ]
+
+    def __str__(self):
+        return f"Hold {self.amount} for Job {self.job_id} - {self.status}"
+
+
+class JobSettlement(models.Model):
+    """Per-job record of a provider earning awaiting a payout flush.
+
+    Written instead of a per-job ``CreditLog`` when payout aggregation is
+    enabled. The provider's wallet is credited later by a summary flush,
+    which sets ``paid_out_at``; unpaid rows are the source of truth for
+    what is still owed.
+    """
+
+    job = models.ForeignKey(
+        'computing.Job', related_name='settlements', on_delete=models.CASCADE,
+    )
+    provider = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name='job_settlements',
+        on_delete=models.CASCADE,
+    )
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+    paid_out_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        """The payout flush scans unpaid rows in id order."""
+        indexes = [models.Index(fields=['paid_out_at', 'id'])]
+
+    def __str__(self):
+        return f"Settlement {self.amount} for Job {self.job_id}"
+
+
+class LedgerAccount(models.Model):
+    """A double-entry ledger account: one wallet per user plus system accounts."""
+
+    code = models.CharField(max_length=50, unique=True)
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, related_name='ledger_account',
+        on_delete=models.CASCADE, null=True, blank=True,
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.code
+
+
+class LedgerEntry(models.Model):
+    """A balanced journal entry grouping postings that sum to zero."""
+
+    description = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Entry {self.id}: {self.description}"
+
+
+class Posting(models.Model):
+    """One leg of a ledger entry; positive amounts credit the account."""
+
+    entry = models.ForeignKey(LedgerEntry, related_name='postings', on_delete=models.CASCADE)
+    account = models.ForeignKey(LedgerAccount, related_name='postings', on_delete=models.CASCADE)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        """Balance tails are read per account in posting order."""
+        indexes = [models.Index(fields=['account', 'id'])]
+
+    def __str__(self):
+        return f"{self.account} {self.amount}"
+
+
+class BalanceSnapshot(models.Model):
+    """An account's balance including every posting up to last_posting_id."""
+
+    account = models.ForeignKey(LedgerAccount, related_name='snapshots', on_delete=models.CASCADE)
+    last_posting_id = models.BigIntegerField()
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        """Latest snapshot per account is found by watermark."""
+        indexes = [models.Index(fields=['account', 'last_posting_id'])]
+
+    def __str__(self):
+        return f"{self.account} = {self.balance} @ {self.last_posting_id}"
+
+
+class LedgerCheckpoint(models.Model):
+    """Last id processed by an incremental ledger job (snapshots, checks)."""
+
+    name = models.CharField(max_length=50, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
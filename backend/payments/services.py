@@ -1,11 +1,27 @@
 """Business logic for wallet credits and payment processing."""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
 
-from .models import CreditLog, Transaction
+from .ledger import (
+    EXTERNAL_ACCOUNT, PAYOUTS_ACCOUNT, PLATFORM_ACCOUNT, LedgerService,
+)
+from .models import CreditLog, Hold, JobSettlement, Transaction
 
 User = get_user_model()
 
+# Holds still HELD after this long are released and their job failed
+HOLD_EXPIRY = timedelta(hours=1)
+
+# Maximum number of captured holds applied per settlement transaction
+SETTLEMENT_BATCH_SIZE = 500
+
 
 class CreditService:
     """Service class for processing transactions and credit transfers."""
@@ -20,9 +36,14 @@ class CreditService:
             if txn.status != 'PENDING':
                 return False
 
-            user = txn.user
+            # Lock the wallet row; the settlement worker writes it concurrently
+            user = User.objects.select_for_update().get(pk=txn.user_id)
             if txn.type == 'DEPOSIT':
-                user.wallet_balance += txn.amount
+                LedgerService.post(f"Deposit {txn.id}", [
+                    (LedgerService.wallet_account(user.id), txn.amount),
+                    (LedgerService.system_account(EXTERNAL_ACCOUNT), -txn.amount),
+                ])
+                delta = txn.amount
                 CreditLog.objects.create(
                     user=user,
                     amount=txn.amount,
@@ -30,21 +51,31 @@ class CreditService:
                 )
                 txn.status = 'SUCCESS'
             elif txn.type == 'WITHDRAWAL':
-                if user.wallet_balance < txn.amount:
+                # Funds reserved for unfinished jobs cannot be withdrawn
+                if EscrowService.available_balance(user) < txn.amount:
                     txn.status = 'FAILED'
                     txn.save()
                     return False
 
-                user.wallet_balance -= txn.amount
+                LedgerService.post(f"Withdrawal {txn.id}", [
+                    (LedgerService.wallet_account(user.id), -txn.amount),
+                    (LedgerService.system_account(EXTERNAL_ACCOUNT), txn.amount),
+                ])
+                delta = -txn.amount
                 CreditLog.objects.create(
                     user=user,
                     amount=-txn.amount,
                     description="Withdrawal request"
                 )
                 txn.status = 'SUCCESS'
+            else:
+                delta = Decimal("0.00")
 
             txn.save()
-            user.save()
+            if delta:
+                User.objects.filter(pk=user.pk).update(
+                    wallet_balance=F("wallet_balance") + delta,
+                )
             return True
         except Transaction.DoesNotExist:
             return False
@@ -55,21 +86,244 @@ class CreditService:
         """
         Transfers credits from Consumer (sender) to Provider (receiver).
         """
-        if sender.wallet_balance < amount:
+        # Lock both wallets in a fixed order so opposite transfers cannot deadlock
+        locked = {
+            user.pk: user for user in
+            User.objects.select_for_update().filter(pk__in=[sender.pk, receiver.pk]).order_by("pk")
+        }
+        if EscrowService.available_balance(locked[sender.pk]) < amount:
             raise ValueError("Insufficient funds")
 
-        sender.wallet_balance -= amount
-        sender.save()
+        accounts = LedgerService.wallet_accounts([sender.id, receiver.id])
+        LedgerService.post(f"Payment for Job {job_id}", [
+            (accounts[sender.id], -amount),
+            (accounts[receiver.id], amount),
+        ])
+
+        User.objects.filter(pk=sender.pk).update(wallet_balance=F("wallet_balance") - amount)
         CreditLog.objects.create(
             user=sender,
             amount=-amount,
             description=f"Payment for Job {job_id}",
         )
 
-        receiver.wallet_balance += amount
-        receiver.save()
+        User.objects.filter(pk=receiver.pk).update(wallet_balance=F("wallet_balance") + amount)
         CreditLog.objects.create(
             user=receiver,
             amount=amount,
             description=f"Earnings for Job {job_id}",
         )
+
+
+class EscrowService:
+    """Reserve, capture, release and settle job payment holds."""
+
+    @staticmethod
+    def held_amount(user):
+        """Return the total of the user's holds not yet settled."""
+        return Hold.objects.filter(
+            user=user, settled_at__isnull=True,
+        ).aggregate(total=Sum("amount"))["total"] or Decimal("0.00")
+
+    @staticmethod
+    def available_balance(user):
+        """Return the wallet balance minus outstanding holds."""
+        return user.wallet_balance - EscrowService.held_amount(user)
+
+    @staticmethod
+    @transaction.atomic
+    def reserve(user, job, amount):
+        """
+        Reserves funds for a job. Raises ValueError if the consumer's
+        available balance does not cover the amount.
+        """
+        # Lock the wallet row so concurrent submissions cannot overspend
+        locked = User.objects.select_for_update().get(pk=user.pk)
+        if EscrowService.available_balance(locked) < amount:
+            raise ValueError("Insufficient funds")
+        return Hold.objects.create(user=locked, job=job, amount=amount)
+
+    @staticmethod
+    def capture(job_id, provider_id):
+        """Mark a job's hold as owed to the provider. Returns True once per hold."""
+        return Hold.objects.filter(job_id=job_id, status="HELD").update(
+            status="CAPTURED", provider_id=provider_id,
+        ) > 0
+
+    @staticmethod
+    def capture_shared(job_ids, amount):
+        """Capture holds of jobs answered by another job's run at ``amount``.
+
+        No provider ran them, so the settled holds go to the platform account.
+        Returns the number of holds captured.
+        """
+        return Hold.objects.filter(job_id__in=job_ids, status="HELD").update(
+            status="CAPTURED", provider_id=None, amount=amount,
+        )
+
+    @staticmethod
+    def release(job_id):
+        """Return a job's held funds to the consumer. Returns True once per hold."""
+        return Hold.objects.filter(job_id=job_id, status="HELD").update(
+            status="RELEASED", settled_at=timezone.now(),
+        ) > 0
+
+    @staticmethod
+    @transaction.atomic
+    def release_expired(max_age=HOLD_EXPIRY):
+        """Release holds older than max_age and fail their unfinished jobs.
+
+        Followers still waiting on a failed job are handed to a new run.
+        """
+        from computing.dispatch import hand_over_followers_of  # pylint: disable=import-outside-toplevel
+        from computing.models import Job  # pylint: disable=import-outside-toplevel
+        now = timezone.now()
+        expired = Hold.objects.filter(status="HELD", created_at__lt=now - max_age)
+        job_ids = list(expired.values_list("job_id", flat=True))
+        if not job_ids:
+            return 0
+        Hold.objects.filter(job_id__in=job_ids, status="HELD").update(
+            status="RELEASED", settled_at=now,
+        )
+        unfinished = Job.objects.filter(id__in=job_ids, status__in=("PENDING", "RUNNING"))
+        failed = list(unfinished.values_list("id", flat=True))
+        unfinished.filter(id__in=failed).update(
+            status="FAILED",
+            result={"error": "Job expired before completion"},
+            completed_at=now,
+        )
+        hand_over_followers_of(failed)
+        return len(job_ids)
+
+    @staticmethod
+    @transaction.atomic
+    def settle(batch_size=SETTLEMENT_BATCH_SIZE):
+        """
+        Applies up to batch_size captured holds to wallets.
+        Each affected wallet row is written once for the whole batch.
+        Returns the number of holds settled.
+        """
+        holds = list(
+            Hold.objects.select_for_update(skip_locked=True)
+            .filter(status="CAPTURED", settled_at__isnull=True)
+            .select_related("job")
+            .order_by("id")[:batch_size]
+        )
+        if not holds:
+            return 0
+
+        aggregate = settings.PAYOUT_AGGREGATION
+        deltas = defaultdict(Decimal)
+        logs = []
+        job_settlements = []
+        for hold in holds:
+            input_data = hold.job.input_data
+            model_name = (
+                input_data.get("model", "unknown")
+                if isinstance(input_data, dict) else "unknown"
+            )
+            deltas[hold.user_id] -= hold.amount
+            logs.append(CreditLog(
+                user_id=hold.user_id,
+                amount=-hold.amount,
+                description=f"Spent: Job #{hold.job_id} (model: {model_name})",
+            ))
+            if hold.provider_id and aggregate:
+                job_settlements.append(JobSettlement(
+                    job_id=hold.job_id,
+                    provider_id=hold.provider_id,
+                    amount=hold.amount,
+                ))
+            elif hold.provider_id:
+                deltas[hold.provider_id] += hold.amount
+                logs.append(CreditLog(
+                    user_id=hold.provider_id,
+                    amount=hold.amount,
+                    description=(
+                        f"Earned: Job #{hold.job_id} completed"
+                        f" (model: {model_name})"
+                    ),
+                ))
+
+        accounts = LedgerService.wallet_accounts(deltas)
+        legs = [(accounts[user_id], delta) for user_id, delta in deltas.items()]
+        if job_settlements:
+            legs.append((
+                LedgerService.system_account(PAYOUTS_ACCOUNT),
+                sum(js.amount for js in job_settlements),
+            ))
+        unclaimed = sum(h.amount for h in holds if not h.provider_id)
+        if unclaimed:
+            legs.append((LedgerService.system_account(PLATFORM_ACCOUNT), unclaimed))
+        LedgerService.post(f"Settlement of {len(holds)} hold(s)", legs)
+
+        for user_id, delta in deltas.items():
+            if delta:
+                User.objects.filter(pk=user_id).update(
+                    wallet_balance=F("wallet_balance") + delta,
+                )
+        CreditLog.objects.bulk_create(logs)
+        if job_settlements:
+            JobSettlement.objects.bulk_create(job_settlements)
+        Hold.objects.filter(id__in=[h.id for h in holds]).update(
+            settled_at=timezone.now(),
+        )
+        return len(holds)
+
+
+class PayoutService:
+    """Aggregated provider payouts (enabled by settings.PAYOUT_AGGREGATION)."""
+
+    @staticmethod
+    def flush(batch_size=SETTLEMENT_BATCH_SIZE):
+        """
+        Credits providers with their unpaid JobSettlement rows, one wallet
+        write and one summary CreditLog per provider per batch.
+        Returns the number of providers paid.
+        """
+        paid = set()
+        while True:
+            providers, count = PayoutService._flush_batch(batch_size)
+            paid |= providers
+            if count < batch_size:
+                return len(paid)
+
+    @staticmethod
+    @transaction.atomic
+    def _flush_batch(batch_size):
+        """Pay out up to batch_size unpaid settlements. Returns (provider ids, rows paid)."""
+        settlements = list(
+            JobSettlement.objects.select_for_update(skip_locked=True)
+            .filter(paid_out_at__isnull=True)
+            .order_by("id")[:batch_size]
+        )
+        if not settlements:
+            return set(), 0
+        totals = defaultdict(lambda: [Decimal("0.00"), 0])
+        for settlement in settlements:
+            totals[settlement.provider_id][0] += settlement.amount
+            totals[settlement.provider_id][1] += 1
+
+        accounts = LedgerService.wallet_accounts(totals)
+        legs = [(accounts[provider_id], amount) for provider_id, (amount, _) in totals.items()]
+        legs.append((
+            LedgerService.system_account(PAYOUTS_ACCOUNT),
+            -sum(amount for _, amount in legs),
+        ))
+        LedgerService.post("Provider payout flush", legs)
+        for provider_id, (amount, _) in totals.items():
+            User.objects.filter(pk=provider_id).update(
+                wallet_balance=F("wallet_balance") + amount,
+            )
+        CreditLog.objects.bulk_create([
+            CreditLog(
+                user_id=provider_id,
+                amount=amount,
+                description=f"Earned: payout for {jobs} job(s)",
+            )
+            for provider_id, (amount, jobs) in totals.items()
+        ])
+        JobSettlement.objects.filter(id__in=[s.id for s in settlements]).update(
+            paid_out_at=timezone.now(),
+        )
+        return set(totals), len(settlements)
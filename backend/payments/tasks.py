@@ -0,0 +1,32 @@
+"""Celery tasks for escrow settlement, provider payouts and ledger upkeep."""
+from celery import shared_task
+
+from .ledger import LedgerService
+from .services import EscrowService, PayoutService, SETTLEMENT_BATCH_SIZE
+
+
+@shared_task
+def settle_holds(batch_size=SETTLEMENT_BATCH_SIZE):
+    """Release expired holds, then apply captured holds in batches."""
+    released = EscrowService.release_expired()
+    settled = 0
+    while True:
+        count = EscrowService.settle(batch_size)
+        settled += count
+        if count < batch_size:
+            break
+    return f"Settled {settled} hold(s), released {released} expired"
+
+
+@shared_task
+def flush_payouts():
+    """Credit providers with earnings settled since the last flush."""
+    return f"Paid out {PayoutService.flush()} provider(s)"
+
+
+@shared_task
+def maintain_ledger():
+    """Snapshot recently posted accounts and verify new ledger entries."""
+    snapshots = LedgerService.take_snapshots()
+    problems = LedgerService.check_consistency()
+    return f"Wrote {snapshots} snapshot(s), found {len(problems)} problem(s)"
@@ -0,0 +1,162 @@
+"""
+Test Suite: Double-entry Ledger
+Covers: balanced postings, wallet wiring, snapshots, incremental consistency check
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.utils import timezone
+
+from computing.models import Job
+from core.models import User
+from payments.ledger import LedgerService, OPENING_ACCOUNT
+from payments.models import BalanceSnapshot, LedgerEntry, Posting, Transaction
+from payments.services import CreditService, EscrowService
+
+
+def _age_ledger(minutes=5):
+    """Push existing entries and postings past the snapshot safety lag."""
+    past = timezone.now() - timedelta(minutes=minutes)
+    LedgerEntry.objects.update(created_at=past)
+    Posting.objects.update(created_at=past)
+
+
+@pytest.mark.django_db
+class TestLedgerPosting:
+    """Tests for balanced entries and wallet accounts."""
+
+    def setup_method(self):
+        self.user = User.objects.create_user(
+            username='ledger_user', password='p',
+            wallet_balance=Decimal('40.00')
+        )
+
+    def test_unbalanced_entry_rejected(self):  # pylint: disable=missing-function-docstring
+        account = LedgerService.wallet_account(self.user.id)
+        with pytest.raises(ValueError, match="Unbalanced"):
+            LedgerService.post("bad", [(account, Decimal('1.00'))])
+
+    def test_wallet_account_opens_with_current_balance(self):  # pylint: disable=missing-function-docstring
+        account = LedgerService.wallet_account(self.user.id)
+        assert LedgerService.balance(account) == Decimal('40.00')
+        opening = LedgerService.system_account(OPENING_ACCOUNT)
+        assert LedgerService.balance(opening) == Decimal('-40.00')
+        # Re-fetching does not post a second opening balance
+        LedgerService.wallet_account(self.user.id)
+        assert LedgerEntry.objects.count() == 1
+
+    def test_deposit_and_withdrawal_are_posted(self):  # pylint: disable=missing-function-docstring
+        deposit = Transaction.objects.create(
+            user=self.user, amount=Decimal('10.00'), type='DEPOSIT',
+        )
+        withdrawal = Transaction.objects.create(
+            user=self.user, amount=Decimal('5.00'), type='WITHDRAWAL',
+        )
+        CreditService.process_transaction(deposit.id)
+        CreditService.process_transaction(withdrawal.id)
+        self.user.refresh_from_db()
+        account = LedgerService.wallet_account(self.user.id)
+        assert LedgerService.balance(account) == self.user.wallet_balance == Decimal('45.00')
+
+    def test_settlement_is_posted(self):  # pylint: disable=missing-function-docstring
+        provider = User.objects.create_user(
+            username='ledger_provider', password='p', wallet_balance=Decimal('0.00'),
+        )
+        job = Job.objects.create(
+            user=self.user, task_type='inference',
+            input_data={"prompt": "p", "model": "m"}, cost=Decimal('1.00'),
+        )
+        EscrowService.reserve(self.user, job, Decimal('1.00'))
+        EscrowService.capture(job.id, provider.id)
+        EscrowService.settle()
+        accounts = LedgerService.wallet_accounts([self.user.id, provider.id])
+        assert LedgerService.balance(accounts[self.user.id]) == Decimal('39.00')
+        assert LedgerService.balance(accounts[provider.id]) == Decimal('1.00')
+
+
+@pytest.mark.django_db
+class TestLedgerSnapshots:
+    """Tests for snapshot-based balance reconstruction."""
+
+    def setup_method(self):
+        self.user = User.objects.create_user(
+            username='snap_user', password='p',
+            wallet_balance=Decimal('0.00')
+        )
+        self.account = LedgerService.wallet_account(self.user.id)
+        self.external = LedgerService.system_account('system:external')
+
+    def _credit(self, amount):
+        LedgerService.post("credit", [
+            (self.account, amount), (self.external, -amount),
+        ])
+
+    def test_snapshot_plus_tail_matches_full_sum(self):  # pylint: disable=missing-function-docstring
+        for _ in range(3):
+            self._credit(Decimal('2.00'))
+        _age_ledger()
+        assert LedgerService.take_snapshots() == 2
+        snapshot = BalanceSnapshot.objects.get(account=self.account)
+        assert snapshot.balance == Decimal('6.00')
+
+        self._credit(Decimal('1.50'))
+        assert LedgerService.balance(self.account) == Decimal('7.50')
+
+    def test_snapshot_run_is_incremental(self):  # pylint: disable=missing-function-docstring
+        self._credit(Decimal('2.00'))
+        _age_ledger()
+        LedgerService.take_snapshots()
+        assert LedgerService.take_snapshots() == 0
+
+        self._credit(Decimal('3.00'))
+        _age_ledger()
+        assert LedgerService.take_snapshots() == 2
+        latest = BalanceSnapshot.objects.filter(account=self.account).order_by('-last_posting_id').first()
+        assert latest.balance == Decimal('5.00')
+
+    def test_recent_postings_wait_for_next_run(self):  # pylint: disable=missing-function-docstring
+        self._credit(Decimal('2.00'))
+        assert LedgerService.take_snapshots() == 0
+        assert LedgerService.balance(self.account) == Decimal('2.00')
+
+    def test_historical_balance(self):  # pylint: disable=missing-function-docstring
+        self._credit(Decimal('2.00'))
+        _age_ledger(minutes=10)
+        LedgerService.take_snapshots()
+        self._credit(Decimal('3.00'))
+        assert LedgerService.balance(self.account, at=timezone.now() - timedelta(minutes=5)) == Decimal('2.00')
+        assert LedgerService.balance(self.account) == Decimal('5.00')
+
+
+@pytest.mark.django_db
+class TestLedgerConsistency:
+    """Tests for the incremental consistency checker."""
+
+    def setup_method(self):
+        self.user = User.objects.create_user(
+            username='check_user', password='p',
+            wallet_balance=Decimal('20.00')
+        )
+
+    def test_consistent_ledger_has_no_problems(self):  # pylint: disable=missing-function-docstring
+        txn = Transaction.objects.create(user=self.user, amount=Decimal('5.00'), type='DEPOSIT')
+        CreditService.process_transaction(txn.id)
+        _age_ledger()
+        assert LedgerService.check_consistency() == []
+
+    def test_detects_untracked_wallet_change(self):  # pylint: disable=missing-function-docstring
+        LedgerService.wallet_account(self.user.id)
+        User.objects.filter(pk=self.user.pk).update(wallet_balance=Decimal('99.00'))
+        _age_ledger()
+        problems = LedgerService.check_consistency()
+        assert len(problems) == 1
+        assert 'wallet:' in problems[0]
+
+    def test_only_new_entries_are_checked(self):  # pylint: disable=missing-function-docstring
+        LedgerService.wallet_account(self.user.id)
+        _age_ledger()
+        assert LedgerService.check_consistency() == []
+        User.objects.filter(pk=self.user.pk).update(wallet_balance=Decimal('99.00'))
+        # No new entries since the last run, so nothing is re-verified
+        assert LedgerService.check_consistency() == []
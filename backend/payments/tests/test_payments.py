@@ -2,15 +2,24 @@
 Test Suite: Payment System
 Covers: Wallet balance, deposit, credit transfer, mock webhook
 """
+import json
+from datetime import timedelta
 from decimal import Decimal
 
 import pytest
+from channels.db import database_sync_to_async
+from django.test import AsyncClient
+from django.utils import timezone
 from django.urls import reverse
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
+from computing.models import Job
 from core.models import User
-from payments.models import CreditLog, Transaction
-from payments.services import CreditService
+from payments.ledger import LedgerService
+from payments.models import CreditLog, Hold, JobSettlement, Transaction
+from payments.services import CreditService, EscrowService, PayoutService
+from payments.tasks import settle_holds
 
 
 @pytest.mark.django_db
@@ -58,6 +67,12 @@ class TestCreditService:
         assert self.sender.wallet_balance == Decimal('50.00')
         assert self.receiver.wallet_balance == Decimal('10.00')
 
+    def test_transfer_cannot_spend_held_funds(self):  # pylint: disable=missing-function-docstring
+        job = Job.objects.create(user=self.sender, task_type="inference", input_data={})
+        EscrowService.reserve(self.sender, job, Decimal('40.00'))
+        with pytest.raises(ValueError, match="Insufficient funds"):
+            CreditService.transfer_credits(self.sender, self.receiver, Decimal('20.00'))
+
 
 @pytest.mark.django_db
 class TestDepositWebhookFlow:
@@ -107,6 +122,17 @@ class TestDepositWebhookFlow:
         txn.refresh_from_db()
         assert txn.status == 'FAILED'
 
+    def test_withdrawal_cannot_take_held_funds(self):  # pylint: disable=missing-function-docstring
+        job = Job.objects.create(user=self.user, task_type="inference", input_data={})
+        EscrowService.reserve(self.user, job, Decimal('8.00'))
+        txn = Transaction.objects.create(
+            user=self.user, amount=Decimal('5.00'),
+            type='WITHDRAWAL', status='PENDING'
+        )
+        assert CreditService.process_transaction(txn.id) is False
+        self.user.refresh_from_db()
+        assert self.user.wallet_balance == Decimal('10.00')
+
     def test_mock_webhook_endpoint(self):  # pylint: disable=missing-function-docstring
         txn = Transaction.objects.create(
             user=self.user, amount=Decimal('10.00'),
@@ -226,3 +252,247 @@ class TestDepositView:
         url = reverse('deposit')
         resp = self.client.post(url, {'amount': '25.00'})
         assert resp.status_code == 401
+
+
+@pytest.mark.django_db
+class TestEscrowService:
+    """Tests for escrow holds and batched settlement."""
+
+    def setup_method(self):
+        self.consumer = User.objects.create_user(
+            username='escrow_consumer', password='p',
+            wallet_balance=Decimal('10.00')
+        )
+        self.provider = User.objects.create_user(
+            username='escrow_provider', password='p',
+            wallet_balance=Decimal('0.00')
+        )
+
+    def _job(self, model='llama3.2'):
+        return Job.objects.create(
+            user=self.consumer, task_type='inference',
+            input_data={"prompt": "p", "model": model},
+            status='PENDING', cost=Decimal('1.00'),
+        )
+
+    def _reserve(self):
+        job = self._job()
+        EscrowService.reserve(self.consumer, job, Decimal('1.00'))
+        return job
+
+    def test_reserve_reduces_available_not_wallet(self):  # pylint: disable=missing-function-docstring
+        self._reserve()
+        self.consumer.refresh_from_db()
+        assert self.consumer.wallet_balance == Decimal('10.00')
+        assert EscrowService.held_amount(self.consumer) == Decimal('1.00')
+        assert EscrowService.available_balance(self.consumer) == Decimal('9.00')
+
+    def test_reserve_insufficient_funds_raises(self):  # pylint: disable=missing-function-docstring
+        with pytest.raises(ValueError, match="Insufficient funds"):
+            EscrowService.reserve(self.consumer, self._job(), Decimal('10.01'))
+
+    def test_capture_and_release_are_single_use(self):  # pylint: disable=missing-function-docstring
+        job = self._reserve()
+        assert EscrowService.capture(job.id, self.provider.id) is True
+        assert EscrowService.capture(job.id, self.provider.id) is False
+        assert EscrowService.release(job.id) is False
+
+    def test_release_restores_available_without_wallet_write(self):  # pylint: disable=missing-function-docstring
+        job = self._reserve()
+        assert EscrowService.release(job.id) is True
+        assert EscrowService.available_balance(self.consumer) == Decimal('10.00')
+        assert EscrowService.settle() == 0
+        assert not CreditLog.objects.exists()
+
+    def test_settle_applies_batch_once_per_wallet(self, django_assert_max_num_queries):  # pylint: disable=missing-function-docstring
+        for _ in range(5):
+            job = self._reserve()
+            EscrowService.capture(job.id, self.provider.id)
+        LedgerService.wallet_accounts([self.consumer.id, self.provider.id])
+        # Constant in the number of holds: select, ledger entry, 2 wallet
+        # updates, log insert, hold update (+ lookups and savepoints)
+        with django_assert_max_num_queries(12):
+            assert EscrowService.settle() == 5
+        self.consumer.refresh_from_db()
+        self.provider.refresh_from_db()
+        assert self.consumer.wallet_balance == Decimal('5.00')
+        assert self.provider.wallet_balance == Decimal('5.00')
+        assert EscrowService.available_balance(self.consumer) == Decimal('5.00')
+        assert CreditLog.objects.filter(
+            user=self.provider, description__startswith='Earned:',
+        ).count() == 5
+        assert CreditLog.objects.filter(user=self.consumer, amount__lt=0).count() == 5
+
+    def test_settle_respects_batch_size(self):  # pylint: disable=missing-function-docstring
+        for _ in range(3):
+            EscrowService.capture(self._reserve().id, self.provider.id)
+        assert EscrowService.settle(batch_size=2) == 2
+        assert EscrowService.settle(batch_size=2) == 1
+        assert EscrowService.settle(batch_size=2) == 0
+
+    def test_release_expired_fails_job(self):  # pylint: disable=missing-function-docstring
+        job = self._reserve()
+        Hold.objects.filter(job=job).update(
+            created_at=timezone.now() - timedelta(hours=2),
+        )
+        assert EscrowService.release_expired() == 1
+        job.refresh_from_db()
+        assert job.status == 'FAILED'
+        assert Hold.objects.get(job=job).status == 'RELEASED'
+
+    def test_settle_holds_task(self):  # pylint: disable=missing-function-docstring
+        EscrowService.capture(self._reserve().id, self.provider.id)
+        result = settle_holds(batch_size=10)
+        assert "Settled 1" in result
+        self.provider.refresh_from_db()
+        assert self.provider.wallet_balance == Decimal('1.00')
+
+
+@pytest.mark.django_db
+class TestPayoutAggregation:
+    """Tests for aggregated provider payouts."""
+
+    def setup_method(self):
+        self.consumer = User.objects.create_user(
+            username='agg_consumer', password='p',
+            wallet_balance=Decimal('10.00')
+        )
+        self.provider = User.objects.create_user(
+            username='agg_provider', password='p',
+            wallet_balance=Decimal('0.00')
+        )
+
+    def _captured_job(self):
+        job = Job.objects.create(
+            user=self.consumer, task_type='inference',
+            input_data={"prompt": "p", "model": "llama3.2"},
+            status='COMPLETED', cost=Decimal('1.00'),
+        )
+        EscrowService.reserve(self.consumer, job, Decimal('1.00'))
+        EscrowService.capture(job.id, self.provider.id)
+        return job
+
+    def test_settlement_defers_provider_credit(self, settings):  # pylint: disable=missing-function-docstring
+        settings.PAYOUT_AGGREGATION = True
+        for _ in range(3):
+            self._captured_job()
+        assert EscrowService.settle() == 3
+
+        self.provider.refresh_from_db()
+        assert self.provider.wallet_balance == Decimal('0.00')
+        assert JobSettlement.objects.filter(provider=self.provider, paid_out_at=None).count() == 3
+        assert not CreditLog.objects.filter(user=self.provider).exists()
+
+        assert PayoutService.flush() == 1
+        self.provider.refresh_from_db()
+        assert self.provider.wallet_balance == Decimal('3.00')
+        log = CreditLog.objects.get(user=self.provider)
+        assert log.amount == Decimal('3.00')
+        assert log.description == 'Earned: payout for 3 job(s)'
+        assert not JobSettlement.objects.filter(paid_out_at=None).exists()
+        assert PayoutService.flush() == 0
+
+    def test_flush_pays_unpaid_rows_in_batches(self, settings):  # pylint: disable=missing-function-docstring
+        settings.PAYOUT_AGGREGATION = True
+        for _ in range(3):
+            self._captured_job()
+        EscrowService.settle()
+        # Rows settled by any process (or before a crash) are owed until flushed
+        assert PayoutService.flush(batch_size=2) == 1
+        self.provider.refresh_from_db()
+        assert self.provider.wallet_balance == Decimal('3.00')
+        assert sorted(
+            CreditLog.objects.filter(user=self.provider).values_list('description', flat=True)
+        ) == ['Earned: payout for 1 job(s)', 'Earned: payout for 2 job(s)']
+
+
+@pytest.mark.django_db
+class TestHistoryExports:
+    """Tests for the streaming credit log / transaction exports."""
+
+    def setup_method(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='exporter', password='p',
+            wallet_balance=Decimal('10.00')
+        )
+        self.client.force_authenticate(user=self.user)
+        for i in range(3):
+            CreditLog.objects.create(
+                user=self.user, amount=Decimal('1.00'), description=f'Earned: Job #{i}',
+            )
+        other = User.objects.create_user(username='other_exporter', password='p')
+        CreditLog.objects.create(user=other, amount=Decimal('9.00'), description='Not mine')
+
+    def _body(self, resp):
+        return b''.join(resp.streaming_content).decode()
+
+    def test_credit_logs_csv(self):  # pylint: disable=missing-function-docstring
+        resp = self.client.get(reverse('export-credit-logs'))
+        assert resp.status_code == 200
+        assert resp.streaming
+        assert resp['Content-Type'] == 'text/csv'
+        lines = self._body(resp).strip().splitlines()
+        assert lines[0] == 'id,amount,description,created_at'
+        assert len(lines) == 4
+        assert 'Not mine' not in self._body(self.client.get(reverse('export-credit-logs')))
+
+    def test_credit_logs_ndjson(self):  # pylint: disable=missing-function-docstring
+        resp = self.client.get(reverse('export-credit-logs'), {'output': 'ndjson'})
+        rows = [json.loads(line) for line in self._body(resp).splitlines()]
+        assert len(rows) == 3
+        assert rows[0]['amount'] == '1.00'
+        assert rows[0]['description'] == 'Earned: Job #0'
+
+    def test_date_range_filter(self):  # pylint: disable=missing-function-docstring
+        CreditLog.objects.filter(description='Earned: Job #0').update(
+            created_at=timezone.now() - timedelta(days=10),
+        )
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        resp = self.client.get(reverse('export-credit-logs'), {'output': 'ndjson', 'since': since})
+        assert len(self._body(resp).splitlines()) == 2
+
+        until = (timezone.now() - timedelta(days=5)).date().isoformat()
+        resp = self.client.get(reverse('export-credit-logs'), {'output': 'ndjson', 'until': until})
+        assert len(self._body(resp).splitlines()) == 1
+
+    def test_invalid_params_return_400(self):  # pylint: disable=missing-function-docstring
+        assert self.client.get(reverse('export-credit-logs'), {'output': 'xml'}).status_code == 400
+        assert self.client.get(reverse('export-credit-logs'), {'since': 'yesterday'}).status_code == 400
+
+    def test_transactions_export(self):  # pylint: disable=missing-function-docstring
+        Transaction.objects.create(user=self.user, amount=Decimal('5.00'), type='DEPOSIT')
+        resp = self.client.get(reverse('export-transactions'), {'output': 'ndjson'})
+        rows = [json.loads(line) for line in self._body(resp).splitlines()]
+        assert len(rows) == 1
+        assert rows[0]['type'] == 'DEPOSIT'
+
+    def test_export_requires_auth(self):  # pylint: disable=missing-function-docstring
+        assert APIClient().get(reverse('export-transactions')).status_code == 401
+
+
+@pytest.mark.django_db(transaction=True)
+class TestAsyncExport:
+    """Tests for exports served under ASGI."""
+
+    async def test_asgi_export_streams_async_chunks(self, monkeypatch):  # pylint: disable=missing-function-docstring
+        monkeypatch.setattr('core.exports.EXPORT_CHUNK_SIZE', 2)
+
+        def _setup():
+            user = User.objects.create_user(username='async_exporter', password='p')
+            CreditLog.objects.bulk_create([
+                CreditLog(user=user, amount=Decimal('1.00'), description=f'Earned: Job #{i}')
+                for i in range(5)
+            ])
+            return str(AccessToken.for_user(user))
+        token = await database_sync_to_async(_setup)()
+
+        resp = await AsyncClient().get(
+            reverse('export-credit-logs'), {'output': 'ndjson'},
+            headers={'Authorization': f'Bearer {token}'},
+        )
+        assert resp.status_code == 200
+        assert resp.is_async
+        body = b''.join([chunk async for chunk in resp.streaming_content]).decode()
+        rows = [json.loads(line) for line in body.splitlines()]
+        assert [row['description'] for row in rows] == [f'Earned: Job #{i}' for i in range(5)]
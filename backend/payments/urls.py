@@ -1,11 +1,16 @@
 """URL routes for payment, wallet, and webhook endpoints."""
 from django.urls import path
 
-from .views import WalletBalanceView, DepositView, MockPaymentWebhookView
+from .views import (
+    WalletBalanceView, DepositView, MockPaymentWebhookView,
+    CreditLogExportView, TransactionExportView,
+)
 
 urlpatterns = [
     path('wallet/', WalletBalanceView.as_view(), name='wallet'),
     path('deposit/', DepositView.as_view(), name='deposit'),
+    path('export/credit-logs/', CreditLogExportView.as_view(), name='export-credit-logs'),
+    path('export/transactions/', TransactionExportView.as_view(), name='export-transactions'),
     path(
         'webhook/mock/<int:transaction_id>/',
         MockPaymentWebhookView.as_view(),
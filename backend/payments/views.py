@@ -3,9 +3,10 @@ from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from core.exports import ExportView
 from .models import Transaction, CreditLog
 from .serializers import TransactionSerializer, CreditLogSerializer
-from .services import CreditService
+from .services import CreditService, EscrowService
 
 
 class WalletBalanceView(APIView):
@@ -14,11 +15,14 @@ class WalletBalanceView(APIView):
     permission_classes = (permissions.IsAuthenticated,)
 
     def get(self, request):
-        """Return wallet balance and recent credit log entries."""
+        """Return wallet balance, escrowed amount and credit log entries."""
         logs = CreditLog.objects.filter(user=request.user).order_by('-created_at')
         serializer = CreditLogSerializer(logs, many=True)
+        held = EscrowService.held_amount(request.user)
         return Response({
             "balance": request.user.wallet_balance,
+            "held": held,
+            "available": request.user.wallet_balance - held,
             "logs": serializer.data
         })
 
@@ -45,3 +49,21 @@ class MockPaymentWebhookView(APIView):
         if success:
             return Response({"status": "Transaction Processed"})
         return Response({"status": "Failed"}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class CreditLogExportView(ExportView):
+    """Stream the user's full credit log history."""
+    columns = ("id", "amount", "description", "created_at")
+    filename = "credit_logs"
+
+    def get_queryset(self, request):
+        return CreditLog.objects.filter(user=request.user)
+
+
+class TransactionExportView(ExportView):
+    """Stream the user's deposit and withdrawal history."""
+    columns = ("id", "type", "status", "amount", "currency", "gateway_id", "created_at")
+    filename = "transactions"
+
+    def get_queryset(self, request):
+        return Transaction.objects.filter(user=request.user)